@@ -0,0 +1,74 @@
+"""
+Responde un lote de preguntas sin pasar por la API: el mismo camino que `POST /query/batch`, en este proceso.
+
+Uso (desde el directorio que contiene el paquete `app`):
+    python -m app.batch_query preguntas.jsonl -o respuestas.jsonl --concurrency 8
+    python -m app.batch_query preguntas.jsonl --collection manuales --doc-id guia --page-from 10 --page-to 20
+
+Cada línea de entrada es `{"question": ..., "id": ...}` (o una cadena JSON); cada línea de salida, un resultado
+con `line`, `id`, `answer` (o `error`) y `latency_ms`, en el orden en que se van completando.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+
+async def main_async(args) -> dict:
+    # Importación diferida: carga el corpus y los modelos solo al ejecutar el lote
+    from app.initialization import collections, translator
+    from app.services.batch_query import BatchQueryRunner, parse_questions
+    from app.services.corpus_store import SearchFilter
+
+    with open(args.input, encoding="utf-8") as f:
+        questions, errors = parse_questions(f, args.target_language, args.model_name)
+    query_service = collections.get(args.collection)
+    runner = BatchQueryRunner(query_service, translator=translator, chunk_size=args.chunk_size,
+                              concurrency=args.concurrency)
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    summary = {"questions": len(questions), "invalid_lines": len(errors), "failed": 0}
+    start = time.perf_counter()
+    try:
+        for error in errors:
+            output.write(json.dumps(error, ensure_ascii=False) + "\n")
+        search_filter = SearchFilter(args.doc_id, args.page_from, args.page_to)
+        async for result in runner.run(questions, k=args.k, nprobe=args.nprobe, ef_search=args.ef_search,
+                                       include_fragments=args.include_fragments, search_filter=search_filter):
+            summary["failed"] += "error" in result
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    summary["questions_per_second"] = round(len(questions) / summary["seconds"], 2) if summary["seconds"] else None
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Responde un lote de preguntas (JSONL) contra el corpus.")
+    parser.add_argument("input", help="JSONL de preguntas")
+    parser.add_argument("-o", "--output", help="JSONL de resultados (por defecto, la salida estándar)")
+    parser.add_argument("--model-name", default="llama2")
+    parser.add_argument("--target-language", default="es")
+    parser.add_argument("--k", type=int, default=10, help="Fragmentos recuperados por pregunta")
+    parser.add_argument("--nprobe", type=int)
+    parser.add_argument("--ef-search", type=int)
+    parser.add_argument("--chunk-size", type=int, help="Preguntas recuperadas a la vez (BATCH_QUERY_CHUNK_SIZE)")
+    parser.add_argument("--concurrency", type=int, help="Generaciones simultáneas (BATCH_QUERY_CONCURRENCY)")
+    parser.add_argument("--include-fragments", action="store_true")
+    parser.add_argument("--collection", help="Colección consultada (por defecto, DEFAULT_COLLECTION)")
+    parser.add_argument("--doc-id", nargs="+", help="Buscar solo en estos documentos")
+    parser.add_argument("--page-from", type=int, help="Buscar solo desde esta página")
+    parser.add_argument("--page-to", type=int, help="Buscar solo hasta esta página")
+    args = parser.parse_args()
+
+    summary = asyncio.run(main_async(args))
+    # El resumen va a stderr para no mezclarse con los resultados cuando se escriben en la salida estándar
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark del almacenamiento compacto: vectores cuantizados (SQfp16 / SQ8) con re-ordenación exacta y texto de los
+fragmentos comprimido por bloques.
+
+Vectores: para cada tipo de índice informa de la memoria del índice por vector, del recall@k frente al índice exacto
+(Flat) y de la latencia por consulta, sin re-ordenar y re-ordenando `k * factor` candidatos con los vectores float32
+exactos de un `VectorStore` (que quedan en disco, mapeados en memoria).
+
+Texto: guarda fragmentos sintéticos en un `FragmentStore` sin comprimir y con cada códec disponible, e informa del
+tamaño en disco y de la latencia de leer un fragmento al azar.
+
+Uso (desde el directorio que contiene el paquete `app`):
+    python -m app.benchmarks.bench_compact --size 1000000 --rerank-factors 0 2 4 --json compact.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import faiss
+from app.benchmarks.bench_index import synthetic_corpus, recall_at_k
+from app.config import Config
+from app.services.fragment_store import FragmentStore, zstandard
+from app.services.index_factory import create_index, train_index
+from app.services.vector_store import VectorStore
+
+WORDS = [
+    "el", "jugador", "roba", "dos", "cartas", "al", "inicio", "de", "cada", "turno", "los", "dados", "deciden",
+    "cuántas", "casillas", "avanza", "la", "ficha", "gana", "quien", "consigue", "más", "puntos", "de", "victoria",
+    "recursos", "comercio", "reglas", "tablero", "ronda", "fase", "acción", "mazo", "descarte", "jugadores",
+]
+
+
+def percentiles(timings: list) -> dict:
+    return {"p50_ms": float(np.percentile(timings, 50)), "p99_ms": float(np.percentile(timings, 99))}
+
+
+def bench_vectors(args, workdir: str) -> list:
+    vectors, queries = synthetic_corpus(args.size, args.dimension, args.queries)
+    exact = faiss.IndexFlatL2(args.dimension)
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, args.k)
+    del exact
+
+    vector_store = VectorStore(os.path.join(workdir, "bench"), args.dimension)
+    for start in range(0, len(vectors), 100_000):
+        end = min(start + 100_000, len(vectors))
+        vector_store.append(list(range(start, end)), vectors[start:end])
+    vector_store.save()
+    exact_bytes = os.path.getsize(vector_store.data_path)
+
+    results = []
+    for index_type in args.types:
+        start = time.perf_counter()
+        index = create_index(args.dimension, index_type)
+        if not index.is_trained:
+            train_index(index, vectors)
+        index.add(vectors)
+        build_s = time.perf_counter() - start
+        bytes_per_vector = faiss.serialize_index(index).nbytes / args.size
+
+        for factor in args.rerank_factors if index_type != "flat" else [0]:
+            found, timings = [], []
+            for query in queries:
+                query = query[None, :]
+                start = time.perf_counter()
+                if factor:
+                    distances, ids = index.search(query, args.k * factor)
+                    ids = vector_store.rerank(query, distances, ids, args.k)[1]
+                else:
+                    ids = index.search(query, args.k)[1]
+                timings.append((time.perf_counter() - start) * 1000)
+                found.append(ids[0])
+            row = {
+                "size": args.size,
+                "index_type": index_type,
+                "rerank_factor": factor,
+                f"recall@{args.k}": recall_at_k(ground_truth, np.array(found), args.k),
+                **percentiles(timings),
+                "index_bytes_per_vector": bytes_per_vector,
+                "index_memory_saving": 1 - bytes_per_vector / (4 * args.dimension),
+                "exact_vectors_disk_bytes": exact_bytes if factor else 0,
+                "build_s": build_s,
+            }
+            results.append(row)
+            print(
+                f"{index_type:>8} rerank={factor:<2} recall@{args.k}={row[f'recall@{args.k}']:.3f} "
+                f"p50={row['p50_ms']:.3f}ms p99={row['p99_ms']:.3f}ms índice={bytes_per_vector:.0f}B/vec "
+                f"(ahorro {row['index_memory_saving']:.0%})"
+            )
+    return results
+
+
+def synthetic_fragments(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(40, 120, count)
+    return [" ".join(rng.choice(WORDS, length)) + "." for length in lengths]
+
+
+def bench_text(args, workdir: str) -> list:
+    fragments = synthetic_fragments(args.text_fragments)
+    ids = list(range(len(fragments)))
+    records = [{"text": text, "doc_id": f"doc{i // 500}", "position": i % 500} for i, text in enumerate(fragments)]
+    lookups = np.random.default_rng(1).integers(0, len(fragments), args.lookups)
+
+    codecs = ["none", "zlib"] + (["zstd"] if zstandard is not None else [])
+    results = []
+    for codec in codecs:
+        store = FragmentStore(os.path.join(workdir, f"text_{codec}"), compression=codec, block_size=args.block_size)
+        start = time.perf_counter()
+        for offset in range(0, len(ids), 10_000):
+            store.append(ids[offset:offset + 10_000], records[offset:offset + 10_000])
+        store.save()
+        write_s = time.perf_counter() - start
+
+        timings = []
+        for fragment_id in lookups:
+            start = time.perf_counter()
+            store.get_text(int(fragment_id))
+            timings.append((time.perf_counter() - start) * 1000)
+        row = {
+            "compression": codec,
+            "block_size": args.block_size if codec != "none" else None,
+            "fragments": len(fragments),
+            "blob_bytes": os.path.getsize(store.blob_path),
+            "write_s": write_s,
+            **percentiles(timings),
+        }
+        results.append(row)
+        print(
+            f"{codec:>5}: {row['blob_bytes'] / len(fragments):6.1f} B/fragmento "
+            f"({row['blob_bytes'] / 2 ** 20:.1f} MiB) lectura p50={row['p50_ms']:.3f}ms p99={row['p99_ms']:.3f}ms"
+        )
+    raw = results[0]["blob_bytes"]
+    for row in results:
+        row["saving"] = 1 - row["blob_bytes"] / raw
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria y recall del almacenamiento compacto de vectores y texto.")
+    parser.add_argument("--size", type=int, default=1_000_000, help="Vectores del corpus sintético.")
+    parser.add_argument("--types", nargs="+", default=["flat", "sq_fp16", "sq_int8"])
+    parser.add_argument("--rerank-factors", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument("--dimension", type=int, default=Config.EMBEDDING_DIMENSION)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--text-fragments", type=int, default=100_000)
+    parser.add_argument("--block-size", type=int, default=Config.FRAGMENT_BLOCK_SIZE)
+    parser.add_argument("--lookups", type=int, default=10_000, help="Lecturas de fragmentos al azar.")
+    parser.add_argument("--threads", type=int, default=1, help="Hilos de OpenMP para FAISS.")
+    parser.add_argument("--json", help="Ruta donde guardar los resultados en JSON.")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    with tempfile.TemporaryDirectory(prefix="bench_compact_") as workdir:
+        report = {"vectors": bench_vectors(args, workdir), "text": bench_text(args, workdir)}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Benchmark de extremo a extremo, sin red: ingesta de PDFs sintéticos, latencia por etapa de `/query/` y QPS concurrente.
+
+Arranca la API (uvicorn) en un subproceso con un directorio de datos temporal y el stub de Ollama
+(`stub_ollama.py`) como LLM, así que no toca el corpus real ni necesita un LLM. Mide:
+  - ingestion: páginas/s y fragmentos/s de `POST /pdf/upload` hasta que terminan los trabajos, y el tiempo
+    total de cada etapa de la ingesta (`ingestion_stage_seconds` de `/metrics`).
+  - query:     percentiles (p50/p95/p99) por etapa de `POST /query/` a partir de `trace=true`, y tokens medios
+               del contexto de los fragmentos recuperados y del prompt (`prompt_context_tokens` de `/metrics`).
+  - load:      QPS y latencias de `POST /query/` a varios niveles de concurrencia (`load_test.run_level`).
+
+La caché semántica de respuestas y la de embeddings se desactivan para medir siempre el camino completo. Los
+modelos de embeddings y de traducción deben estar ya en la caché local de Hugging Face (se fuerza el modo offline).
+
+La API hereda las variables de entorno, así que dos ejecuciones con distinta configuración (p. ej.
+`CONTEXT_COMPRESSION=True`) se comparan con `--baseline`. Con `--stub-prefill-ms-per-token`, la latencia del
+stub crece con la longitud del prompt.
+
+El informe JSON (`--json`) incluye la configuración del benchmark; con `--baseline informe_anterior.json` se
+comparan las métricas principales y el proceso termina con código 1 si alguna empeora más de `--tolerance`.
+
+Uso (desde el directorio que contiene el paquete `app`):
+    python -m app.benchmarks.bench_e2e --documents 4 --pages 20 --queries 50 --concurrency 1 8 32 --json e2e.json
+    python -m app.benchmarks.bench_e2e --json e2e_nuevo.json --baseline e2e.json --tolerance 0.2
+    python -m app.benchmarks.bench_e2e --stub-prefill-ms-per-token 2 --json sin_compresion.json
+    CONTEXT_COMPRESSION=True python -m app.benchmarks.bench_e2e --stub-prefill-ms-per-token 2 --baseline sin_compresion.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import httpx
+from app.benchmarks.load_test import run_level
+from app.benchmarks.stub_ollama import start_stub_server
+
+WORDS = [
+    "card", "dice", "player", "turn", "board", "token", "score", "round", "deck", "hand", "move", "rule",
+    "victory", "resource", "trade", "attack", "defense", "phase", "draw", "discard", "bonus", "penalty",
+]
+
+
+def synthetic_pages(pages: int, lines_per_page: int, seed: int) -> list:
+    """
+    Texto de un reglamento sintético: frases aleatorias sobre un vocabulario fijo, reproducibles con `seed`.
+    """
+    rng = np.random.default_rng(seed)
+    return [
+        [f"{page + 1}.{line + 1} " + " ".join(rng.choice(WORDS, 10)) + "." for line in range(lines_per_page)]
+        for page in range(pages)
+    ]
+
+
+def synthetic_pdf(pages: list) -> bytes:
+    """
+    PDF mínimo (Helvetica, una línea de texto por entrada) con las páginas dadas; sin dependencias externas.
+    """
+    objects = {1: "<< /Type /Catalog /Pages 2 0 R >>", 3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids, number = [], 4
+    for lines in pages:
+        stream = "\n".join(f"BT /F1 10 Tf 40 {760 - 14 * i} Td ({line}) Tj ET" for i, line in enumerate(lines))
+        objects[number] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {number + 1} 0 R "
+            "/Resources << /Font << /F1 3 0 R >> >> >>"
+        )
+        objects[number + 1] = f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"
+        kids.append(f"{number} 0 R")
+        number += 2
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>"
+
+    out, offsets = b"%PDF-1.4\n", {}
+    for key in sorted(objects):
+        offsets[key] = len(out)
+        out += f"{key} 0 obj\n{objects[key]}\nendobj\n".encode("latin-1")
+    xref, size = len(out), max(objects) + 1
+    out += f"xref\n0 {size}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offsets[key]:010d} 00000 n \n".encode() for key in range(1, size))
+    out += f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF".encode()
+    return out
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(np.mean(values)), 3),
+    }
+
+
+def stage_totals(metrics_text: str, metric: str, sum_field: str = "seconds") -> dict:
+    """
+    Suma (`sum_field`) y número de observaciones de cada etapa de un histograma en el texto de `/metrics`.
+    """
+    totals = {}
+    for line in metrics_text.splitlines():
+        for suffix, field in (("_sum", sum_field), ("_count", "count")):
+            if line.startswith(f"{metric}{suffix}{{"):
+                labels, value = line[len(metric) + len(suffix):].rsplit(" ", 1)
+                stage = labels.split('stage="', 1)[1].split('"', 1)[0]
+                totals.setdefault(stage, {})[field] = round(float(value), 4) if field == sum_field else int(float(value))
+    return totals
+
+
+def context_tokens(metrics_text: str) -> dict:
+    """
+    Tokens medios del contexto de los fragmentos recuperados (`retrieved`) y de los que llegan al prompt (`prompt`).
+    """
+    totals = stage_totals(metrics_text, "prompt_context_tokens", sum_field="tokens")
+    means = {stage: round(values["tokens"] / values["count"], 1) for stage, values in totals.items() if values.get("count")}
+    if means.get("retrieved"):
+        means["reduction"] = round(1 - means.get("prompt", means["retrieved"]) / means["retrieved"], 3)
+    return means
+
+
+def start_api(workdir: str, port: int, stub_port: int, workers: int) -> subprocess.Popen:
+    """
+    Lanza la API en un subproceso con todos sus datos en `workdir`.
+    """
+    package_parent = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [package_parent, os.environ.get("PYTHONPATH")])),
+        "FAISS_INDEX_PATH": os.path.join(workdir, "index", "index.faiss"),
+        "TEMP_PDF_PATH": os.path.join(workdir, "uploads"),
+        "OLLAMA_URL": f"http://127.0.0.1:{stub_port}/api/generate",
+        "EMBEDDING_CACHE_PATH": "",
+        "ANSWER_CACHE_SIZE": "0",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "ERROR"),
+        "HF_HUB_OFFLINE": "1",
+        "TRANSFORMERS_OFFLINE": "1",
+    })
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+
+
+def wait_healthy(client: httpx.Client, process: subprocess.Popen, timeout: float = 120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"La API terminó al arrancar (código {process.returncode}).")
+        try:
+            if client.get("/health").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError("La API no respondió a /health a tiempo.")
+
+
+def run_ingestion(client: httpx.Client, args) -> dict:
+    """
+    Sube `--documents` PDFs sintéticos a la vez y espera a que terminen sus trabajos de ingesta.
+    """
+    pdfs = [
+        synthetic_pdf(synthetic_pages(args.pages, args.lines_per_page, seed=document))
+        for document in range(args.documents)
+    ]
+    start = time.perf_counter()
+    job_ids = []
+    for document, pdf in enumerate(pdfs):
+        response = client.post("/pdf/upload", files={"file": (f"synthetic_{document}.pdf", pdf, "application/pdf")})
+        response.raise_for_status()
+        job_ids.append(response.json()["job_id"])
+
+    jobs = {}
+    while len(jobs) < len(job_ids):
+        for job_id in job_ids:
+            if job_id not in jobs:
+                job = client.get(f"/pdf/jobs/{job_id}").json()
+                if job["status"] in ("completed", "failed"):
+                    jobs[job_id] = job
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    failed = [job["error"] for job in jobs.values() if job["status"] == "failed"]
+    if failed:
+        raise RuntimeError(f"Ingesta fallida: {failed[0]}")
+    pages = sum(job["pages_total"] or 0 for job in jobs.values())
+    fragments = sum(job["fragments"] or 0 for job in jobs.values())
+    return {
+        "documents": len(pdfs),
+        "pages": pages,
+        "fragments": fragments,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(pages / elapsed, 2),
+        "fragments_per_second": round(fragments / elapsed, 2),
+        "per_document": percentiles(
+            [(job["finished_at"] - job["started_at"]) * 1000 for job in jobs.values()]
+        ),
+    }
+
+
+def run_queries(client: httpx.Client, args) -> dict:
+    """
+    Lanza `--queries` preguntas secuenciales con `trace=true` y calcula percentiles por etapa.
+    """
+    rng = np.random.default_rng(1234)
+    stages, totals = {}, []
+    for i in range(args.queries):
+        question = f"What does the rule say about {' and '.join(rng.choice(WORDS, 2))}? ({i})"
+        start = time.perf_counter()
+        response = client.post("/query/", params={"question": question, "model_name": args.model_name, "trace": "true"})
+        totals.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        # Una etapa puede repetirse en una petición (p. ej. traducir la pregunta y los fragmentos): se suma
+        per_request = {}
+        for span in response.json()["trace"]["spans"]:
+            per_request[span["stage"]] = per_request.get(span["stage"], 0.0) + span["duration_ms"]
+        for stage, duration in per_request.items():
+            stages.setdefault(stage, []).append(duration)
+    return {"total": percentiles(totals), "stages": {stage: percentiles(values) for stage, values in stages.items()}}
+
+
+def key_metrics(report: dict) -> dict:
+    """
+    Métricas que se comparan con el informe de referencia y si "más es mejor" para cada una.
+    """
+    metrics = {
+        "ingestion.pages_per_second": (report["ingestion"]["pages_per_second"], True),
+        "ingestion.fragments_per_second": (report["ingestion"]["fragments_per_second"], True),
+        "query.total.p50_ms": (report["query"]["total"].get("p50_ms"), False),
+        "query.total.p95_ms": (report["query"]["total"].get("p95_ms"), False),
+    }
+    for stage, values in report["query"]["stages"].items():
+        metrics[f"query.stages.{stage}.p50_ms"] = (values.get("p50_ms"), False)
+    if "prompt" in report["query"].get("context_tokens", {}):
+        metrics["query.context_tokens.prompt"] = (report["query"]["context_tokens"]["prompt"], False)
+    for level in report["load"]:
+        metrics[f"load.c{level['concurrency']}.qps"] = (level["qps"], True)
+    return metrics
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Lista de regresiones (métrica, referencia, actual, cambio relativo) de más de `tolerance`.
+    """
+    current, previous = key_metrics(report), key_metrics(baseline)
+    regressions = []
+    for name, (value, higher_is_better) in current.items():
+        reference = previous.get(name, (None, None))[0]
+        if value is None or not reference:
+            continue
+        change = (value - reference) / reference
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append({"metric": name, "baseline": reference, "current": value, "change": round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo (ingesta, consultas y carga) sin red.")
+    parser.add_argument("--documents", type=int, default=4, help="PDFs sintéticos a ingerir.")
+    parser.add_argument("--pages", type=int, default=20, help="Páginas por PDF.")
+    parser.add_argument("--lines-per-page", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=50, help="Consultas secuenciales para los percentiles por etapa.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="Peticiones por nivel de concurrencia.")
+    parser.add_argument("--workers", type=int, default=1, help="Workers de uvicorn.")
+    parser.add_argument("--model-name", default="llama2")
+    parser.add_argument("--stub-latency-ms", type=float, default=200)
+    parser.add_argument("--stub-tokens", type=int, default=50)
+    parser.add_argument("--stub-token-rate", type=float, default=100)
+    parser.add_argument("--stub-prefill-ms-per-token", type=float, default=0, help="Espera del stub por token del prompt.")
+    parser.add_argument("--json", help="Ruta donde guardar el informe en JSON.")
+    parser.add_argument("--baseline", help="Informe anterior con el que comparar.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento relativo máximo (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    stub_port, port = free_port(), free_port()
+    stub = start_stub_server(
+        stub_port, args.stub_latency_ms, args.stub_tokens, args.stub_token_rate,
+        prefill_ms_per_token=args.stub_prefill_ms_per_token,
+    )
+    report = {
+        "config": vars(args),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        api = start_api(workdir, port, stub_port, args.workers)
+        try:
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+                wait_healthy(client, api)
+                report["ingestion"] = run_ingestion(client, args)
+                report["ingestion"]["stages"] = stage_totals(client.get("/metrics").text, "ingestion_stage_seconds")
+                print(
+                    f"Ingesta: {report['ingestion']['pages']} páginas, {report['ingestion']['fragments']} fragmentos "
+                    f"en {report['ingestion']['seconds']:.1f}s ({report['ingestion']['pages_per_second']:.1f} páginas/s, "
+                    f"{report['ingestion']['fragments_per_second']:.1f} fragmentos/s)"
+                )
+
+                report["query"] = run_queries(client, args)
+                for stage, values in [("total", report["query"]["total"]), *report["query"]["stages"].items()]:
+                    print(f"  {stage:<20} p50={values['p50_ms']:>9.2f}ms p95={values['p95_ms']:>9.2f}ms p99={values['p99_ms']:>9.2f}ms")
+                report["query"]["context_tokens"] = context_tokens(client.get("/metrics").text)
+                if "prompt" in report["query"]["context_tokens"]:
+                    tokens = report["query"]["context_tokens"]
+                    print(
+                        f"  contexto del prompt: {tokens['retrieved']:.0f} -> {tokens['prompt']:.0f} tokens "
+                        f"de media ({tokens['reduction']:.0%} menos)"
+                    )
+
+            report["load"] = []
+            for concurrency in args.concurrency:
+                level = asyncio.run(run_level(
+                    f"http://127.0.0.1:{port}/query/", concurrency, args.requests,
+                    "What does the rule say about dice?", args.model_name,
+                ))
+                report["load"].append(level)
+                print(f"  concurrencia={concurrency:>4} QPS={level['qps']:.2f} p50={level['p50_ms']:.0f}ms p95={level['p95_ms']:.0f}ms")
+        finally:
+            api.terminate()
+            api.wait(timeout=30)
+            stub.shutdown()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+        for regression in regressions:
+            print(f"REGRESIÓN {regression['metric']}: {regression['baseline']} -> {regression['current']} ({regression['change']:+.0%})")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
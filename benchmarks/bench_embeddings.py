@@ -0,0 +1,114 @@
+"""
+Benchmark de los backends de embeddings: PyTorch (sentence-transformers) frente a ONNX Runtime (fp32 e int8).
+
+Para cada backend ONNX comprueba la paridad con PyTorch (similitud coseno entre los embeddings de las mismas
+frases) y, para todos, mide el rendimiento en frases/segundo con lotes de 1, 8 y 64 frases. Termina con
+código de salida 1 si la similitud mínima de algún backend queda por debajo de `--min-cosine`, así que sirve
+también como prueba de paridad antes de cambiar `EMBEDDING_MODEL` a `onnx:<modelo>`.
+
+Uso (desde el directorio que contiene el paquete `app`):
+    python -m app.benchmarks.bench_embeddings --model all-MiniLM-L6-v2 --threads 4
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+import numpy as np
+
+WORDS = [
+    "the", "player", "draws", "two", "cards", "at", "the", "start", "of", "each", "turn", "dice", "are", "rolled",
+    "to", "move", "tokens", "across", "the", "board", "victory", "points", "el", "jugador", "roba", "una", "carta",
+    "cada", "turno", "y", "mueve", "su", "ficha", "según", "el", "dado", "resource", "trade", "scoring", "rules",
+]
+
+
+def synthetic_sentences(count: int, seed: int = 0):
+    """
+    Frases de longitudes variadas (de 4 a 120 palabras), como preguntas cortas y fragmentos de documentos.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(mean=3.0, sigma=0.8, size=count).astype(int), 4, 120)
+    return [" ".join(rng.choice(WORDS, length)) + "." for length in lengths]
+
+
+def load_backend(name: str, model_name: str, cache_dir: str, threads: int):
+    if name == "torch":
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if threads > 0:
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name, device="cpu")
+    from app.models.onnx_embedding import OnnxSentenceEncoder
+    return OnnxSentenceEncoder.from_config(
+        model_name, cache_dir, quantize=(name == "onnx-int8"), intra_op_threads=threads
+    )
+
+
+def cosine_parity(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = (reference * candidate).sum(axis=1)
+    return {"min": float(cosine.min()), "mean": float(cosine.mean()), "p01": float(np.percentile(cosine, 1))}
+
+
+def throughput(model, sentences, batch_size: int, repeat: int) -> float:
+    """
+    Frases por segundo codificando `sentences` en llamadas de `batch_size` frases (el mejor de `repeat` intentos).
+    """
+    model.encode(sentences[:batch_size], batch_size=batch_size)  # Calentamiento
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for offset in range(0, len(sentences), batch_size):
+            model.encode(sentences[offset:offset + batch_size], batch_size=batch_size)
+        best = min(best, time.perf_counter() - start)
+    return len(sentences) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridad y rendimiento de los backends de embeddings.")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Modelo de sentence-transformers (nombre o ruta).")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx-fp32", "onnx-int8"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 64])
+    parser.add_argument("--sentences", type=int, default=256, help="Frases por medición.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="Hilos por inferencia (0 = por defecto de cada backend).")
+    parser.add_argument("--cache-dir", help="Directorio de los modelos ONNX exportados (por defecto, uno temporal).")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Similitud coseno mínima frente a PyTorch.")
+    parser.add_argument("--json", help="Ruta donde guardar los resultados en JSON.")
+    args = parser.parse_args()
+
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="bench_embeddings_")
+    sentences = synthetic_sentences(args.sentences)
+    models = {name: load_backend(name, args.model, cache_dir, args.threads) for name in args.backends}
+
+    results = {"model": args.model, "threads": args.threads, "backends": {}}
+    reference = models["torch"].encode(sentences, batch_size=64) if "torch" in models else None
+    parity_ok = True
+    for name, model in models.items():
+        result = {}
+        if reference is not None and name != "torch":
+            result["cosine_vs_torch"] = cosine_parity(reference, model.encode(sentences, batch_size=64))
+            parity_ok = parity_ok and result["cosine_vs_torch"]["min"] >= args.min_cosine
+        result["sentences_per_second"] = {
+            batch_size: throughput(model, sentences, batch_size, args.repeat) for batch_size in args.batch_sizes
+        }
+        results["backends"][name] = result
+
+        rates = " ".join(f"lote {bs}: {rate:8.1f} frases/s" for bs, rate in result["sentences_per_second"].items())
+        parity = ""
+        if "cosine_vs_torch" in result:
+            parity = f" | coseno vs torch min={result['cosine_vs_torch']['min']:.4f} media={result['cosine_vs_torch']['mean']:.4f}"
+        print(f"{name:>10}: {rates}{parity}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if not parity_ok:
+        print(f"[ERROR] La similitud coseno con PyTorch es menor que {args.min_cosine}.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
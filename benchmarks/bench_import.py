@@ -0,0 +1,124 @@
+"""
+Perfil de arranque: tiempo de importación de la aplicación y tiempo hasta que responde /health.
+
+Importa `app.main` en un proceso nuevo con `python -X importtime` y muestra los módulos que más tardan
+(tiempo acumulado, incluidos sus submódulos) y el total por paquete de primer nivel. Después mide, también
+en procesos nuevos:
+  - ready:  importar la aplicación y responder `GET /health` (lo que espera una sonda de disponibilidad).
+  - warmup: cargar los modelos del registro y ejecutar una inferencia con cada uno (`POST /warmup`).
+
+Uso (desde el directorio que contiene el paquete `app`):
+    python -m app.benchmarks.bench_import --top 25
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+READY_SNIPPET = """
+import json, time
+start = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.main import app
+response = TestClient(app).get("/health")
+print(json.dumps({"seconds": time.perf_counter() - start, "status": response.status_code}))
+"""
+
+WARMUP_SNIPPET = """
+import json, time
+from app.models.registry import model_registry
+start = time.perf_counter()
+timings = model_registry.warmup()
+print(json.dumps({"seconds": time.perf_counter() - start, "models": timings}))
+"""
+
+
+def run_python(args, snippet: str = None) -> subprocess.CompletedProcess:
+    command = [sys.executable, *args] + (["-c", snippet] if snippet else [])
+    return subprocess.run(command, capture_output=True, text=True, cwd=os.getcwd())
+
+
+def last_json_line(output: str) -> dict:
+    # Los logs van a stderr, pero alguna dependencia puede escribir en stdout: el informe es la última línea
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def parse_importtime(stderr: str):
+    """
+    Convierte la salida de `-X importtime` en una lista de (módulo, propio_us, acumulado_us).
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def profile_imports(module: str, top: int) -> dict:
+    start = time.perf_counter()
+    result = run_python(["-X", "importtime", "-c", f"import {module}"])
+    wall_s = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{result.stderr[-2000:]}")
+    modules = parse_importtime(result.stderr)
+
+    # El tiempo propio de cada módulo se suma a su paquete de primer nivel
+    by_package = defaultdict(int)
+    for name, self_us, _ in modules:
+        by_package[name.split(".")[0]] += self_us
+    return {
+        "module": module,
+        "wall_s": wall_s,
+        "modules_imported": len(modules),
+        "top_modules": [
+            {"module": name, "cumulative_ms": cumulative_us / 1000}
+            for name, _, cumulative_us in sorted(modules, key=lambda item: -item[2])[:top]
+        ],
+        "top_packages": [
+            {"package": name, "self_ms": self_us / 1000}
+            for name, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación y de arranque de la aplicación.")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--skip-warmup", action="store_true", help="No medir la carga de los modelos.")
+    parser.add_argument("--json", help="Ruta donde guardar los resultados en JSON.")
+    args = parser.parse_args()
+
+    report = profile_imports(args.module, args.top)
+    print(f"Importar {args.module}: {report['wall_s']:.2f}s ({report['modules_imported']} módulos)")
+    print("\nMódulos más lentos (tiempo acumulado):")
+    for entry in report["top_modules"]:
+        print(f"  {entry['cumulative_ms']:9.1f} ms  {entry['module']}")
+    print("\nPaquetes (tiempo propio):")
+    for entry in report["top_packages"]:
+        print(f"  {entry['self_ms']:9.1f} ms  {entry['package']}")
+
+    ready = run_python([], READY_SNIPPET)
+    report["ready"] = last_json_line(ready.stdout) if ready.returncode == 0 else {"error": ready.stderr[-2000:]}
+    if "seconds" in report["ready"]:
+        print(f"\nHasta responder /health: {report['ready']['seconds']:.2f}s")
+
+    if not args.skip_warmup:
+        warmup = run_python([], WARMUP_SNIPPET)
+        report["warmup"] = last_json_line(warmup.stdout) if warmup.returncode == 0 else {"error": warmup.stderr[-2000:]}
+        if "seconds" in report["warmup"]:
+            models = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in report["warmup"]["models"].items())
+            print(f"Carga y calentamiento de los modelos: {report['warmup']['seconds']:.2f}s ({models})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
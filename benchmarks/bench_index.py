@@ -0,0 +1,119 @@
+"""
+Benchmark de los tipos de índice FAISS soportados (Flat, IVF-Flat, HNSW, IVF-PQ).
+
+Genera corpus sintéticos de embeddings de 384 dimensiones y, para cada tipo de índice, informa de
+recall@k frente al índice exacto (Flat), latencia de búsqueda p50/p99 por consulta y memoria por vector.
+
+Uso (desde el directorio que contiene el paquete `app`):
+    python -m app.benchmarks.bench_index --sizes 10000 100000 1000000 --nprobe 8 16 32 --ef-search 32 64 128
+"""
+import argparse
+import json
+import time
+import numpy as np
+import faiss
+from app.config import Config
+from app.services.index_factory import INDEX_TYPES, create_index, train_index, search_parameters
+
+
+def synthetic_corpus(n: int, dimension: int, n_queries: int, seed: int = 0):
+    """
+    Genera vectores normalizados agrupados en clústeres, más parecidos a embeddings reales que el ruido uniforme.
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = max(16, n // 1000)
+    centers = rng.standard_normal((n_clusters, dimension)).astype(np.float32)
+
+    def sample(count):
+        vectors = centers[rng.integers(0, n_clusters, count)]
+        vectors = vectors + 0.5 * rng.standard_normal((count, dimension)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+    return sample(n), sample(n_queries)
+
+
+def recall_at_k(ground_truth: np.ndarray, found: np.ndarray, k: int) -> float:
+    hits = sum(len(set(gt[:k]) & set(fd[:k])) for gt, fd in zip(ground_truth, found))
+    return hits / (len(ground_truth) * k)
+
+
+def latency_percentiles(index, queries: np.ndarray, k: int, params) -> dict:
+    """
+    Mide la latencia de búsqueda consulta a consulta (como en `QueryService.query`).
+    """
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query[None, :], k, params=params)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": float(np.percentile(timings, 50)), "p99_ms": float(np.percentile(timings, 99))}
+
+
+def bench(args) -> list:
+    faiss.omp_set_num_threads(args.threads)
+    results = []
+    for size in args.sizes:
+        vectors, queries = synthetic_corpus(size, args.dimension, args.queries)
+        exact = faiss.IndexFlatL2(args.dimension)
+        exact.add(vectors)
+        _, ground_truth = exact.search(queries, args.k)
+
+        for index_type in args.types:
+            start = time.perf_counter()
+            index = create_index(args.dimension, index_type)
+            if not index.is_trained:
+                train_index(index, vectors)
+            index.add(vectors)
+            build_s = time.perf_counter() - start
+            bytes_per_vector = faiss.serialize_index(index).nbytes / size
+
+            settings = [(None, None)]
+            if index_type in ("ivf_flat", "ivf_pq"):
+                settings = [(nprobe, None) for nprobe in args.nprobe]
+            elif index_type == "hnsw":
+                settings = [(None, ef) for ef in args.ef_search]
+
+            for nprobe, ef_search in settings:
+                params = search_parameters(nprobe, ef_search, index)
+                _, found = index.search(queries, args.k, params=params)
+                row = {
+                    "size": size,
+                    "index_type": index_type,
+                    "nprobe": nprobe,
+                    "ef_search": ef_search,
+                    f"recall@{args.k}": recall_at_k(ground_truth, found, args.k),
+                    **latency_percentiles(index, queries, args.k, params),
+                    "bytes_per_vector": bytes_per_vector,
+                    "build_s": build_s,
+                }
+                results.append(row)
+                print(
+                    f"{size:>9} {index_type:>9} nprobe={str(nprobe):>4} ef={str(ef_search):>4} "
+                    f"recall@{args.k}={row[f'recall@{args.k}']:.3f} p50={row['p50_ms']:.3f}ms "
+                    f"p99={row['p99_ms']:.3f}ms mem={bytes_per_vector:.0f}B/vec build={build_s:.1f}s"
+                )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de recall/latencia/memoria de los índices FAISS.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES))
+    parser.add_argument("--dimension", type=int, default=Config.EMBEDDING_DIMENSION)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[Config.IVF_NPROBE])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[Config.HNSW_EF_SEARCH])
+    parser.add_argument("--threads", type=int, default=1, help="Hilos de OpenMP para FAISS.")
+    parser.add_argument("--json", help="Ruta donde guardar los resultados en JSON.")
+    args = parser.parse_args()
+
+    results = bench(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark del reparto entre varios servidores de LLM (`ModelRouter`) frente a un round-robin simple.
+
+Arranca varios stubs de Ollama con latencias distintas y coste de cambio de modelo (`--load-ms`), lanza
+peticiones concurrentes con una mezcla de modelos y mide latencias, reparto por servidor y cambios de modelo.
+Con `--kill-after`, uno de los servidores se cae a mitad de la prueba para comprobar el reintento en otro.
+
+Uso (desde el directorio que contiene el paquete `app`):
+    python -m app.benchmarks.bench_router --latencies-ms 50 50 200 --models llama2 gemma --requests 300 --concurrency 16
+    python -m app.benchmarks.bench_router --kill-after 100 --json router.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+import numpy as np
+from app.benchmarks.stub_ollama import start_stub_server
+from app.models.model_router import ModelRouter
+from app.models.ollama_model import OllamaModel
+
+
+class RoundRobin:
+    """
+    Referencia: cada petición va al siguiente servidor, sin mirar su carga ni el modelo que tiene cargado.
+    """
+    def __init__(self, clients):
+        self.clients = clients
+        self._next = itertools.cycle(clients)
+
+    async def agenerate(self, prompt: str, model_name: str) -> str:
+        try:
+            tokens = [token async for token in next(self._next).astream(prompt, model_name)]
+            return "".join(tokens).strip()
+        except Exception as e:
+            return f"Error: {e}"
+
+
+async def run(client, servers, args) -> dict:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    rng = random.Random(args.seed)
+    models = [rng.choice(args.models) for _ in range(args.requests)]
+    latencies, errors, done = [], 0, 0
+
+    async def one(i: int):
+        nonlocal errors, done
+        async with semaphore:
+            start = time.perf_counter()
+            answer = await client.agenerate(f"Pregunta {i}", models[i])
+            latencies.append(time.perf_counter() - start)
+            errors += answer.startswith("Error:")
+            done += 1
+            if args.kill_after and done == args.kill_after:
+                servers[0].failing = True
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": args.requests,
+        "errors": errors,
+        "qps": args.requests / elapsed,
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+        "servers": [
+            {"port": server.server_address[1], "latency_ms": server.latency_ms, "completed": server.completed,
+             "model_swaps": server.swaps}
+            for server in servers
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del router de servidores de LLM.")
+    parser.add_argument("--latencies-ms", type=float, nargs="+", default=[50, 50, 200],
+                        help="Latencia de cada stub (uno por servidor).")
+    parser.add_argument("--models", nargs="+", default=["llama2", "gemma"])
+    parser.add_argument("--load-ms", type=float, default=500, help="Coste de cambiar de modelo en un servidor.")
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token-rate", type=float, default=200)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-concurrency", type=int, default=8, help="Tope de peticiones por servidor del router.")
+    parser.add_argument("--kill-after", type=int, default=0, help="Tirar el primer servidor tras N respuestas.")
+    parser.add_argument("--base-port", type=int, default=11500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Ruta donde guardar los resultados en JSON.")
+    args = parser.parse_args()
+
+    results = {}
+    for offset, name in enumerate(("round_robin", "router")):
+        # Servidores nuevos para cada estrategia (puertos distintos: el cliente HTTP se comparte por URL)
+        ports = [args.base_port + offset * 100 + i for i in range(len(args.latencies_ms))]
+        servers = [
+            start_stub_server(port, latency, args.tokens, args.token_rate, load_ms=args.load_ms)
+            for port, latency in zip(ports, args.latencies_ms)
+        ]
+        clients = [OllamaModel(f"http://127.0.0.1:{port}/api/generate") for port in ports]
+        if name == "router":
+            # Los stubs solo tienen un modelo cargado a la vez
+            client = ModelRouter(
+                clients, max_concurrency=args.max_concurrency, swap_penalty=args.load_ms / 1000, max_loaded_models=1
+            )
+        else:
+            client = RoundRobin(clients)
+
+        result = asyncio.run(run(client, servers, args))
+        results[name] = result
+        for server in servers:
+            server.shutdown()
+        reparto = ", ".join(
+            f"{s['port']}({s['latency_ms']:.0f}ms): {s['completed']} resp/{s['model_swaps']} cambios"
+            for s in result["servers"]
+        )
+        print(
+            f"{name:>12}: QPS={result['qps']:.1f} p50={result['p50_ms']:.0f}ms p95={result['p95_ms']:.0f}ms "
+            f"errores={result['errors']} | {reparto}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Benchmark de arranque: tiempo de carga y memoria (RSS/PSS) del corpus por worker.
+
+Construye un corpus sintético y lanza N procesos en paralelo que lo cargan a la vez, igual que varios
+workers de uvicorn. Compara:
+  - legacy: `faiss.read_index` + todos los fragmentos en una `list[str]` (formato anterior).
+  - copy:   `CorpusStore` con `INDEX_MMAP=False` (índice copiado en RAM, texto mapeado).
+  - mmap:   `CorpusStore` con `INDEX_MMAP=True` (índice y texto mapeados en memoria).
+
+El PSS reparte las páginas compartidas entre los procesos que las usan, así que es la mejor medida del coste
+real por worker. Solo disponible en Linux (/proc).
+
+Uso (desde el directorio que contiene el paquete `app`):
+    python -m app.benchmarks.bench_startup --vectors 200000 --workers 4
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+
+def memory_kb() -> dict:
+    """
+    Lee RSS y PSS (en kB) del proceso actual desde /proc.
+    """
+    usage = {}
+    with open("/proc/self/smaps_rollup", "r") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            if key in ("Rss", "Pss", "Shared_Clean", "Private_Dirty"):
+                usage[key.lower()] = int(value.split()[0])
+    return usage
+
+
+def build_corpus(path: str, vectors: int, dimension: int, fragment_chars: int):
+    """
+    Crea un corpus sintético en los dos formatos: el de `CorpusStore` y el legacy (JSON con los textos).
+    """
+    os.environ["INDEX_MMAP"] = "False"
+    from app.services.corpus_store import CorpusStore
+    import faiss
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((vectors, dimension)).astype(np.float32)
+    words = ["regla", "turno", "carta", "jugador", "dado", "ficha", "tablero", "punto"]
+    texts = [
+        " ".join(rng.choice(words, fragment_chars // 6)).ljust(fragment_chars)[:fragment_chars]
+        for _ in range(vectors)
+    ]
+
+    store = CorpusStore(os.path.join(path, "index.faiss"), dimension=dimension)
+    store.add_document("synthetic", embeddings, texts)
+    # El índice se escribe en la instantánea; sin ella, cada worker reaplicaría el log al arrancar
+    store.snapshot()
+
+    legacy_index = faiss.IndexFlatL2(dimension)
+    legacy_index.add(embeddings)
+    faiss.write_index(legacy_index, os.path.join(path, "legacy.faiss"))
+    with open(os.path.join(path, "legacy.json"), "w", encoding="utf-8") as f:
+        json.dump(texts, f)
+
+
+def load_and_query(path: str, mode: str, dimension: int) -> dict:
+    """
+    Carga el corpus en el modo indicado y recupera los fragmentos de una consulta.
+    """
+    start = time.perf_counter()
+    if mode == "legacy":
+        import faiss
+        index = faiss.read_index(os.path.join(path, "legacy.faiss"))
+        with open(os.path.join(path, "legacy.json"), "r", encoding="utf-8") as f:
+            fragments = json.load(f)
+        get_text = fragments.__getitem__
+    else:
+        os.environ["INDEX_MMAP"] = "True" if mode == "mmap" else "False"
+        from app.services.corpus_store import CorpusStore
+        store = CorpusStore(os.path.join(path, "index.faiss"), dimension=dimension)
+        index = store.index
+        get_text = store.get_text
+    load_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(os.getpid())
+    query = rng.standard_normal((1, dimension)).astype(np.float32)
+    start = time.perf_counter()
+    _, ids = index.search(query, 10)
+    texts = [get_text(int(i)) for i in ids[0] if i >= 0]
+    first_query_s = time.perf_counter() - start
+    # Mantener vivos índice y fragmentos hasta medir la memoria
+    return {"load_s": load_s, "first_query_s": first_query_s, "fragments": len(texts), "_refs": (index, get_text)}
+
+
+def child(path: str, mode: str, dimension: int):
+    """
+    Proceso worker: carga el corpus, informa por stdout y espera a que el padre termine.
+    """
+    # Los logs van a stderr y stdout se reserva para el informe (por si alguna dependencia escribe en él).
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = load_and_query(path, mode, dimension)
+    refs = report.pop("_refs")
+    print(json.dumps({**report, **memory_kb()}), flush=True)
+    sys.stdin.read()
+    del refs
+
+
+def run_mode(path: str, mode: str, workers: int, dimension: int) -> dict:
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-m", "app.benchmarks.bench_startup", "--child", mode, "--path", path,
+             "--dimension", str(dimension)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        )
+        for _ in range(workers)
+    ]
+    # Todos los workers siguen vivos cuando se leen sus informes, así el PSS refleja las páginas compartidas.
+    reports = [json.loads(process.stdout.readline()) for process in processes]
+    for process in processes:
+        process.stdin.close()
+        process.wait()
+    return {
+        "mode": mode,
+        "workers": workers,
+        "load_s_mean": float(np.mean([r["load_s"] for r in reports])),
+        "first_query_ms_mean": 1000 * float(np.mean([r["first_query_s"] for r in reports])),
+        "rss_mb_per_worker": float(np.mean([r["rss"] for r in reports])) / 1024,
+        "pss_mb_per_worker": float(np.mean([r["pss"] for r in reports])) / 1024,
+        "pss_mb_total": float(np.sum([r["pss"] for r in reports])) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de arranque y memoria por worker del corpus.")
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--fragment-chars", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", default=["legacy", "copy", "mmap"])
+    parser.add_argument("--path", help="Directorio del corpus (por defecto, uno temporal nuevo).")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="Ruta donde guardar los resultados en JSON.")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.path, args.child, args.dimension)
+        return
+
+    path = args.path or tempfile.mkdtemp(prefix="bench_startup_")
+    if not os.path.exists(os.path.join(path, "index.faiss")):
+        print(f"Construyendo corpus sintético de {args.vectors} vectores en {path}...")
+        build_corpus(path, args.vectors, args.dimension, args.fragment_chars)
+
+    results = []
+    for mode in args.modes:
+        result = run_mode(path, mode, args.workers, args.dimension)
+        results.append(result)
+        print(
+            f"{mode:>7}: carga={result['load_s_mean']:.3f}s primera consulta={result['first_query_ms_mean']:.1f}ms "
+            f"RSS/worker={result['rss_mb_per_worker']:.0f}MB PSS/worker={result['pss_mb_per_worker']:.0f}MB "
+            f"PSS total={result['pss_mb_total']:.0f}MB"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
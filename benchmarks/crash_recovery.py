@@ -0,0 +1,198 @@
+"""
+Prueba de recuperación ante caídas del corpus: interrumpe una instantánea en cada uno de sus pasos y comprueba que
+al volver a abrir el corpus no se ha perdido ni corrompido nada.
+
+Construye un corpus con un índice cuantizado (con los vectores exactos aparte), guarda una instantánea y después
+elimina la mayoría de los documentos y añade uno nuevo, de modo que la siguiente instantánea compacta los
+fragmentos y los vectores. Para cada paso N de esa instantánea (cada rename o borrado de un archivo), un proceso
+hijo la repite sobre una copia del corpus y termina con `os._exit` justo antes del paso N, como una caída. El
+proceso principal abre la copia y comprueba documentos, textos, vectores exactos, IDs del índice y una búsqueda;
+después guarda otra instantánea de lo recuperado y lo comprueba otra vez.
+
+Termina con código 1 si algún paso no se recupera.
+
+Uso (desde el directorio que contiene el paquete `app`):
+    python -m app.benchmarks.crash_recovery
+    python -m app.benchmarks.crash_recovery --documents 20 --fragments 50 --keep 2
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import numpy as np
+
+CRASH_EXIT_CODE = 75  # Código con el que termina el hijo al simular la caída
+
+ENVIRONMENT = {
+    "INDEX_TYPE": "sq_int8",
+    "EXACT_RERANK_FACTOR": "4",
+    "INDEX_RELOAD_INTERVAL": "0",
+    "INDEX_SNAPSHOT_INTERVAL": "0",
+    "WAL_SNAPSHOT_MB": "1024",
+    "LOG_LEVEL": os.environ.get("LOG_LEVEL", "ERROR"),
+}
+
+
+def index_path(path: str) -> str:
+    return os.path.join(path, "index.faiss")
+
+
+def build_corpus(path: str, documents: int, fragments: int, keep: int, dimension: int) -> dict:
+    """
+    Crea el corpus de la prueba y devuelve lo que debe contener: documentos, texto y vector de cada fragmento.
+    """
+    from app.services.corpus_store import CorpusStore
+
+    rng = np.random.default_rng(0)
+    store = CorpusStore(index_path(path), dimension=dimension)
+    texts, vectors, fragment_ids = {}, {}, {}
+
+    def add(doc_id: str):
+        embeddings = rng.standard_normal((fragments, dimension)).astype(np.float32)
+        doc_texts = [
+            f"{doc_id} fragment {i} " + " ".join(rng.choice(["rule", "card", "turn"], 20)) for i in range(fragments)
+        ]
+        ids = store.add_document(doc_id, embeddings, doc_texts)
+        fragment_ids[doc_id] = ids
+        texts.update(zip(ids, doc_texts))
+        vectors.update(zip(ids, embeddings))
+
+    for document in range(documents):
+        add(f"doc{document}")
+    store.snapshot()
+    for document in range(keep, documents):
+        store.delete_document(f"doc{document}")
+        for fid in fragment_ids.pop(f"doc{document}"):
+            del texts[fid], vectors[fid]
+    add("late")
+    store.close()
+    return {"documents": sorted(fragment_ids), "texts": texts, "vectors": vectors}
+
+
+def child(path: str, step: int, dimension: int):
+    """
+    Proceso hijo: abre el corpus y guarda una instantánea, terminando de golpe antes del rename o borrado número
+    `step`. Sale con 0 si la instantánea termina antes de llegar a ese paso.
+    """
+    from app.services.corpus_store import CorpusStore
+
+    store = CorpusStore(index_path(path), dimension=dimension)
+    calls = [0]
+
+    def crash_before(function):
+        def wrapper(*args, **kwargs):
+            calls[0] += 1
+            if calls[0] == step:
+                os._exit(CRASH_EXIT_CODE)
+            return function(*args, **kwargs)
+        return wrapper
+
+    os.replace = crash_before(os.replace)
+    os.remove = crash_before(os.remove)
+    store.snapshot()
+    sys.exit(0)
+
+
+def check(path: str, expected: dict, dimension: int) -> list:
+    """
+    Abre el corpus y devuelve las diferencias con lo esperado (vacía si se ha recuperado entero).
+    """
+    from app.services.corpus_store import CorpusStore
+
+    errors = []
+    store = CorpusStore(index_path(path), dimension=dimension)
+    try:
+        ids = np.array(sorted(expected["texts"]), dtype=np.int64)
+        if sorted(store.documents) != expected["documents"]:
+            errors.append(f"documentos {sorted(store.documents)}")
+        if not np.array_equal(np.sort(store.fragment_ids()), ids):
+            errors.append(f"{len(store)} fragmentos en vez de {len(ids)}")
+        if not np.array_equal(np.sort(store.indexed_ids()), ids):
+            errors.append(f"{store.ntotal} vectores en el índice en vez de {len(ids)}")
+        wrong_texts = 0
+        for fid in ids.tolist():
+            try:
+                wrong_texts += store.get_text(fid) != expected["texts"][fid]
+            except Exception:
+                wrong_texts += 1
+        if wrong_texts:
+            errors.append(f"{wrong_texts} textos ilegibles o distintos")
+        try:
+            found, vectors = store.vector_store.get(ids)
+            if not found.all() or not np.array_equal(vectors, np.stack([expected["vectors"][fid] for fid in ids])):
+                errors.append("vectores exactos perdidos o distintos")
+        except Exception as e:
+            errors.append(f"vectores exactos ilegibles: {e}")
+        try:
+            _, result = store.search(expected["vectors"][int(ids[-1])][None], 1)
+            if int(result[0, 0]) != int(ids[-1]):
+                errors.append(f"la búsqueda devuelve {int(result[0, 0])} en vez de {int(ids[-1])}")
+        except Exception as e:
+            errors.append(f"la búsqueda falla: {e}")
+    finally:
+        store.close()
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recuperación del corpus tras una caída en cada paso de una instantánea.")
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--fragments", type=int, default=20, help="Fragmentos por documento.")
+    parser.add_argument("--keep", type=int, default=2, help="Documentos que se conservan antes de la instantánea.")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.environ.update(ENVIRONMENT)
+    if args.child:
+        child(args.path, args.child, args.dimension)
+        return
+
+    package_parent = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_parent, os.environ.get("PYTHONPATH")]))
+
+    failures = 0
+    with tempfile.TemporaryDirectory(prefix="crash_recovery_") as workdir:
+        template = os.path.join(workdir, "template")
+        expected = build_corpus(template, args.documents, args.fragments, args.keep, args.dimension)
+        step = 1
+        while True:
+            trial = os.path.join(workdir, f"step{step}")
+            shutil.copytree(template, trial)
+            code = subprocess.run(
+                [sys.executable, "-m", "app.benchmarks.crash_recovery", "--path", trial, "--child", str(step),
+                 "--dimension", str(args.dimension)],
+                env=env,
+            ).returncode
+            if code not in (0, CRASH_EXIT_CODE):
+                print(f"paso {step}: el proceso hijo ha fallado (código {code})")
+                failures += 1
+                break
+            errors = check(trial, expected, args.dimension)
+            if not errors:
+                # Lo recuperado debe sobrevivir también a la siguiente instantánea
+                from app.services.corpus_store import CorpusStore
+                store = CorpusStore(index_path(trial), dimension=args.dimension)
+                store.snapshot()
+                store.close()
+                errors = check(trial, expected, args.dimension)
+            outcome = "caída" if code == CRASH_EXIT_CODE else "sin caída"
+            print(f"paso {step} ({outcome}): {'OK' if not errors else '; '.join(errors)}")
+            failures += bool(errors)
+            shutil.rmtree(trial)
+            if code == 0:
+                break
+            step += 1
+
+    if failures:
+        print(f"{failures} pasos sin recuperar.")
+        sys.exit(1)
+    print(f"El corpus se recupera tras una caída en cualquiera de los {step - 1} pasos de la instantánea.")
+
+
+if __name__ == "__main__":
+    main()
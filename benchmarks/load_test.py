@@ -0,0 +1,96 @@
+"""
+Prueba de carga de `POST /query/`: mide QPS y latencias a distintos niveles de concurrencia.
+
+Con un handler bloqueante el QPS no crece con la concurrencia (un worker atiende una petición a la vez);
+con el camino no bloqueante, las peticiones se solapan mientras el LLM genera.
+
+Uso (desde el directorio que contiene el paquete `app`):
+    # 1. API con un solo worker (apuntando al Ollama por defecto, 127.0.0.1:11434)
+    uvicorn app.main:app --workers 1 --port 8000
+    # 2. Prueba de carga, arrancando el stub de Ollama en el puerto 11434
+    python -m app.benchmarks.load_test --start-stub --concurrency 1 8 32 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+import httpx
+from app.benchmarks.stub_ollama import start_stub_server
+
+
+async def run_level(url: str, concurrency: int, requests: int, question: str, model_name: str) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async with httpx.AsyncClient(timeout=300) as client:
+        async def one(i: int):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(url, params={"question": f"{question} ({i})", "model_name": model_name})
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = "error"
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "qps": requests / elapsed,
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+        "p99_ms": 1000 * float(np.percentile(latencies, 99)),
+        "statuses": {str(status): count for status, count in statuses.items()},
+    }
+
+
+async def main_async(args) -> list:
+    results = []
+    for concurrency in args.concurrency:
+        result = await run_level(args.url, concurrency, args.requests, args.question, args.model_name)
+        results.append(result)
+        print(
+            f"concurrencia={concurrency:>4} QPS={result['qps']:.2f} p50={result['p50_ms']:.0f}ms "
+            f"p95={result['p95_ms']:.0f}ms p99={result['p99_ms']:.0f}ms estados={result['statuses']}"
+        )
+    if len(results) > 1:
+        print(f"Ganancia de QPS (máx. concurrencia / mín.): {results[-1]['qps'] / results[0]['qps']:.1f}x")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de /query/.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/query/")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones por nivel de concurrencia.")
+    parser.add_argument("--question", default="¿Cuántas cartas roba cada jugador al inicio?")
+    parser.add_argument("--model-name", default="llama2")
+    parser.add_argument("--start-stub", action="store_true", help="Arrancar el stub de Ollama en este proceso.")
+    parser.add_argument("--stub-port", type=int, default=11434)
+    parser.add_argument("--stub-latency-ms", type=float, default=200)
+    parser.add_argument("--stub-tokens", type=int, default=50)
+    parser.add_argument("--stub-token-rate", type=float, default=100)
+    parser.add_argument("--json", help="Ruta donde guardar los resultados en JSON.")
+    args = parser.parse_args()
+
+    stub = None
+    if args.start_stub:
+        stub = start_stub_server(args.stub_port, args.stub_latency_ms, args.stub_tokens, args.stub_token_rate)
+    try:
+        results = asyncio.run(main_async(args))
+    finally:
+        if stub:
+            stub.shutdown()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
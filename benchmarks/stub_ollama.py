@@ -0,0 +1,137 @@
+"""
+Servidor Ollama de pruebas: responde a `POST /api/generate` con un stream NDJSON como el de Ollama,
+con latencia inicial y velocidad de tokens configurables. Permite medir la API sin un LLM real.
+
+Con `--prefill-ms-per-token`, la espera antes del primer token crece con la longitud del prompt (unos 4
+caracteres por token), como el procesado del prompt de un LLM en CPU.
+
+Opcionalmente simula los modelos de un servidor: con `--models` responde 404 a los que no tiene y, con
+`--load-ms`, cambiar de modelo cuesta ese tiempo extra (solo hay un modelo cargado a la vez, como con
+OLLAMA_MAX_LOADED_MODELS=1).
+
+Uso (desde el directorio que contiene el paquete `app`):
+    python -m app.benchmarks.stub_ollama --port 11434 --latency-ms 200 --tokens 50 --token-rate 100
+    python -m app.benchmarks.stub_ollama --port 11435 --models llama2 gemma --load-ms 3000
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive y transferencia por chunks, como Ollama
+
+    def log_message(self, format, *args):
+        pass
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        model = payload.get("model")
+
+        if server.failing:
+            # Servidor caído: se cierra la conexión sin responder
+            self.close_connection = True
+            return
+
+        if server.models and model not in server.models:
+            body = json.dumps({"error": f"model '{model}' not found"}).encode()
+            self.send_response(404)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        with server.model_lock:
+            swap = server.load_ms > 0 and server.loaded_model != model
+            server.loaded_model = model
+        if swap:
+            server.swaps += 1
+            time.sleep(server.load_ms / 1000)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        prompt_tokens = len(payload.get("prompt", "")) // 4
+        time.sleep((server.latency_ms + server.prefill_ms_per_token * prompt_tokens) / 1000)
+        delay = 1 / server.token_rate if server.token_rate > 0 else 0
+        try:
+            for i in range(server.tokens):
+                token = {"model": payload.get("model"), "response": f"token{i} ", "done": False}
+                self._write_chunk(json.dumps(token).encode() + b"\n")
+                if delay:
+                    time.sleep(delay)
+            self._write_chunk(json.dumps({"model": payload.get("model"), "response": "", "done": True}).encode() + b"\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente cerró la conexión (p. ej. petición abandonada): se deja de generar.
+            server.aborted += 1
+            return
+        server.completed += 1
+
+
+def start_stub_server(port: int = 11434, latency_ms: float = 200, tokens: int = 50, token_rate: float = 100,
+                      host: str = "127.0.0.1", models=None, load_ms: float = 0,
+                      prefill_ms_per_token: float = 0) -> ThreadingHTTPServer:
+    """
+    Arranca el servidor de pruebas en un hilo en segundo plano y lo devuelve (usar `shutdown()` para pararlo).
+    Con `server.failing = True` simula una caída: cierra las conexiones sin responder.
+
+    :param models: Modelos disponibles (los demás responden 404); None = todos.
+    :param load_ms: Tiempo de carga al cambiar de modelo (0 = sin coste).
+    :param prefill_ms_per_token: Espera adicional por cada token del prompt.
+    """
+    server = ThreadingHTTPServer((host, port), StubOllamaHandler)
+    server.daemon_threads = True
+    server.latency_ms = latency_ms
+    server.tokens = tokens
+    server.token_rate = token_rate
+    server.prefill_ms_per_token = prefill_ms_per_token
+    server.models = set(models or [])
+    server.load_ms = load_ms
+    server.loaded_model = None
+    server.model_lock = threading.Lock()
+    server.failing = False
+    server.completed = 0
+    server.aborted = 0
+    server.swaps = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor Ollama de pruebas con latencia configurable.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency-ms", type=float, default=200, help="Espera antes del primer token.")
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens por respuesta.")
+    parser.add_argument("--token-rate", type=float, default=100, help="Tokens por segundo (0 = sin límite).")
+    parser.add_argument("--models", nargs="+", help="Modelos disponibles (los demás responden 404).")
+    parser.add_argument("--load-ms", type=float, default=0, help="Tiempo de carga al cambiar de modelo.")
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0, help="Espera por token del prompt.")
+    args = parser.parse_args()
+
+    server = start_stub_server(
+        args.port, args.latency_ms, args.tokens, args.token_rate, args.host, models=args.models, load_ms=args.load_ms,
+        prefill_ms_per_token=args.prefill_ms_per_token,
+    )
+    print(f"Stub de Ollama escuchando en http://{args.host}:{args.port}/api/generate")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
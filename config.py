@@ -4,6 +4,29 @@ class Config:
     # Rutas de archivos y directorios
     TEMP_PDF_PATH = os.getenv("TEMP_PDF_PATH", "app/uploaded_pdfs")  # Directorio temporal para PDFs subidos
     FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "app/faiss_indices/index.faiss")  # Ruta del índice FAISS
+    # Colecciones con nombre: cada una tiene su propio índice y fragmentos en COLLECTIONS_PATH/<nombre>/ (la colección
+    # DEFAULT_COLLECTION es el índice de FAISS_INDEX_PATH). Se cargan en el primer uso y, por encima de
+    # COLLECTIONS_MAX_LOADED colecciones o COLLECTIONS_MAX_MEMORY_MB (estimado; 0 = sin límite), se descarga la usada
+    # hace más tiempo
+    COLLECTIONS_PATH = os.getenv("COLLECTIONS_PATH", "app/faiss_indices/collections")
+    DEFAULT_COLLECTION = os.getenv("DEFAULT_COLLECTION", "default")
+    COLLECTIONS_MAX_LOADED = int(os.getenv("COLLECTIONS_MAX_LOADED", "8"))
+    COLLECTIONS_MAX_MEMORY_MB = int(os.getenv("COLLECTIONS_MAX_MEMORY_MB", "0"))
+
+    # Servidor Ollama de los modelos generativos
+    OLLAMA_URL = os.getenv("OLLAMA_URL", "http://127.0.0.1:11434/api/generate")
+    # Varios servidores Ollama (URLs separadas por comas) entre los que se reparte la generación; por defecto, OLLAMA_URL
+    OLLAMA_ENDPOINTS = [url.strip() for url in os.getenv("OLLAMA_ENDPOINTS", "").split(",") if url.strip()] or [OLLAMA_URL]
+    # Reparto de carga entre servidores: peticiones simultáneas por servidor (0 = sin límite; p. ej. el
+    # OLLAMA_NUM_PARALLEL de cada servidor) y espera máxima por un hueco libre antes de responder 503
+    LLM_ENDPOINT_MAX_CONCURRENCY = int(os.getenv("LLM_ENDPOINT_MAX_CONCURRENCY", "0"))
+    LLM_ROUTER_QUEUE_TIMEOUT = float(os.getenv("LLM_ROUTER_QUEUE_TIMEOUT", "60"))
+    LLM_ROUTER_EWMA_ALPHA = float(os.getenv("LLM_ROUTER_EWMA_ALPHA", "0.3"))  # Peso de la última latencia en la media
+    # Afinidad de modelo: coste (s) de enviar un modelo a un servidor que no lo tiene cargado. Se considera cargado
+    # si está entre los LLM_MAX_LOADED_MODELS últimos enviados a ese servidor y se usó hace menos de LLM_MODEL_KEEP_ALIVE s
+    LLM_MODEL_SWAP_PENALTY = float(os.getenv("LLM_MODEL_SWAP_PENALTY", "5"))
+    LLM_MODEL_KEEP_ALIVE = float(os.getenv("LLM_MODEL_KEEP_ALIVE", "300"))  # keep_alive por defecto de Ollama (5 min)
+    LLM_MAX_LOADED_MODELS = int(os.getenv("LLM_MAX_LOADED_MODELS", "1"))  # OLLAMA_MAX_LOADED_MODELS de cada servidor
 
     # Configuración de los modelos
     MODEL_CONFIGS = {
@@ -24,8 +47,135 @@ class Config:
         },
     }
 
+    # Cliente HTTP compartido para los backends de LLM
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))  # Segundos para establecer la conexión
+    LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))  # Segundos máximos sin recibir datos
+    LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))  # Conexiones keep-alive por endpoint
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))  # Reintentos ante errores transitorios
+    LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.25"))  # Backoff base (s), con jitter
+    LLM_RETRY_BACKOFF_MAX = float(os.getenv("LLM_RETRY_BACKOFF_MAX", "2"))
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))  # Fallos que abren el circuito
+    LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))  # Tiempo con el circuito abierto
+
     # Configuración de FAISS y embeddings
-    EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # Modelo para generar embeddings
+    # Modelo para generar embeddings. Con el prefijo "onnx:" (p. ej. "onnx:all-MiniLM-L6-v2") se ejecuta con ONNX Runtime
+    # en lugar de PyTorch; la primera vez se exporta (y se cuantiza a int8) en ONNX_CACHE_DIR
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "True").lower() == "true"  # Cuantización dinámica int8 de los pesos
+    ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))  # Hilos por inferencia (0 = los de ONNX Runtime)
+    ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "app/models_cache/onnx")
+    EMBEDDING_DIMENSION = 384  # Dimensión de los embeddings del modelo
+
+    # Tipo de índice FAISS: flat, ivf_flat, hnsw, ivf_pq, sq_fp16, sq_int8 (o una cadena de faiss.index_factory)
+    INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+    IVF_NLIST = int(os.getenv("IVF_NLIST", "1024"))  # Número de listas invertidas (IVF)
+    IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))  # Listas visitadas por búsqueda (IVF)
+    PQ_M = int(os.getenv("PQ_M", "48"))  # Subcuantizadores (IVF-PQ); debe dividir la dimensión
+    PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))  # Bits por subcuantizador (IVF-PQ)
+    HNSW_M = int(os.getenv("HNSW_M", "32"))  # Vecinos por nodo (HNSW)
+    HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+    HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+    # Vectores necesarios antes de entrenar el índice (0 = calculado según el tipo de índice).
+    # Hasta entonces se usa un índice exacto (Flat).
+    INDEX_TRAIN_MIN_VECTORS = int(os.getenv("INDEX_TRAIN_MIN_VECTORS", "0"))
+    # Con índices cuantizados (SQ/PQ) se buscan k * EXACT_RERANK_FACTOR candidatos y se re-ordenan con los
+    # vectores float32 exactos, guardados aparte en disco y mapeados en memoria (0 = sin re-ordenar)
+    EXACT_RERANK_FACTOR = int(os.getenv("EXACT_RERANK_FACTOR", "4"))
+    # Texto de los fragmentos comprimido por bloques: zstd, zlib o none
+    FRAGMENT_COMPRESSION = os.getenv("FRAGMENT_COMPRESSION", "none")
+    FRAGMENT_BLOCK_SIZE = int(os.getenv("FRAGMENT_BLOCK_SIZE", "32"))  # Fragmentos por bloque comprimido
+    # Mapear el índice en memoria (faiss.IO_FLAG_MMAP) para compartirlo entre workers en la caché de páginas
+    INDEX_MMAP = os.getenv("INDEX_MMAP", "True").lower() == "true"
+    # Varios workers (uvicorn --workers N) comparten el índice en disco: cada uno comprueba cada
+    # INDEX_RELOAD_INTERVAL segundos si otro proceso ha guardado una versión nueva y la recarga (0 = no recargar)
+    INDEX_RELOAD_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", "1"))
+    # Las modificaciones del corpus se añaden a un log de escritura (<base>.wal) en lugar de reescribir el índice.
+    # WAL_FSYNC: sincronizar el log con el disco al confirmar cada modificación (un fsync por documento/operación).
+    # El índice completo se guarda en segundo plano cada INDEX_SNAPSHOT_INTERVAL segundos (0 = solo por tamaño)
+    # o cuando el log supera WAL_SNAPSHOT_MB, y entonces se vacía el log.
+    WAL_FSYNC = os.getenv("WAL_FSYNC", "True").lower() == "true"
+    INDEX_SNAPSHOT_INTERVAL = float(os.getenv("INDEX_SNAPSHOT_INTERVAL", "300"))
+    WAL_SNAPSHOT_MB = float(os.getenv("WAL_SNAPSHOT_MB", "64"))
+
+    # Búsqueda híbrida: resultados vectoriales fusionados con un índice léxico BM25 (reciprocal-rank fusion)
+    HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "True").lower() == "true"
+    RRF_K = int(os.getenv("RRF_K", "60"))  # Constante de RRF: 1 / (RRF_K + posición)
+    BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+    BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+    # Micro-lotes de embeddings para /query/: ventana de espera (ms) y tamaño máximo del lote
+    EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+    EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+    EMBEDDING_QUEUE_MAX_SIZE = int(os.getenv("EMBEDDING_QUEUE_MAX_SIZE", "512"))  # Preguntas en espera antes de un 503
+
+    # Las consultas idénticas simultáneas (misma pregunta normalizada, modelo, idioma y versión del corpus)
+    # comparten un único cálculo, también en streaming
+    QUERY_COALESCING = os.getenv("QUERY_COALESCING", "True").lower() == "true"
+
+    # Lotes de preguntas (POST /query/batch y `python -m app.batch_query`): preguntas recuperadas a la vez
+    # (una traducción, una codificación y un index.search por bloque) y generaciones simultáneas en el LLM
+    BATCH_QUERY_CHUNK_SIZE = int(os.getenv("BATCH_QUERY_CHUNK_SIZE", "64"))
+    BATCH_QUERY_CONCURRENCY = int(os.getenv("BATCH_QUERY_CONCURRENCY", "4"))
+
+    # Pools de hilos acotados (hilos / tareas en espera); por encima del límite se responde 503
+    INFERENCE_POOL_WORKERS = int(os.getenv("INFERENCE_POOL_WORKERS", "4"))
+    INFERENCE_POOL_QUEUE = int(os.getenv("INFERENCE_POOL_QUEUE", "64"))
+    INGESTION_POOL_WORKERS = int(os.getenv("INGESTION_POOL_WORKERS", "2"))
+    INGESTION_POOL_QUEUE = int(os.getenv("INGESTION_POOL_QUEUE", "8"))
+    IO_POOL_WORKERS = int(os.getenv("IO_POOL_WORKERS", "16"))
+    IO_POOL_QUEUE = int(os.getenv("IO_POOL_QUEUE", "64"))
+
+    # Traducción de preguntas y fragmentos (MarianMT)
+    TRANSLATION_MODEL = os.getenv("TRANSLATION_MODEL", "Helsinki-NLP/opus-mt-en-es")
+    TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", "16"))  # Textos por llamada a generate
+    TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "10000"))  # Traducciones en la caché LRU en memoria
+    TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH") or None  # Base SQLite del nivel en disco (opcional)
+    # Idiomas a los que se traducen los fragmentos al indexar (p. ej. "es,fr"); las consultas en esos idiomas no traducen
+    PRETRANSLATE_LANGUAGES = [lang.strip() for lang in os.getenv("PRETRANSLATE_LANGUAGES", "").split(",") if lang.strip()]
+
+    # Fragmentación de los documentos: "structure" (párrafos y frases, por tokens) o "fixed" (500 caracteres)
+    CHUNKER = os.getenv("CHUNKER", "structure")
+    CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "128"))  # Tokens del modelo de embeddings por fragmento
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "24"))  # Solapamiento al cortar dentro de un párrafo
+    # Contexto del prompt: presupuesto de tokens y tokenizador de Hugging Face del LLM (vacío = estimación por caracteres)
+    PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "768"))
+    PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER") or None
+    # Compresión del contexto tras la recuperación: re-ordenación con un cross-encoder (RERANKER_MODEL; vacío = sin
+    # él), MMR para descartar fragmentos casi duplicados y, opcionalmente, extracción de las frases relevantes.
+    # Desactivada por defecto: el cross-encoder añade su latencia a cada consulta (medirla con bench_e2e antes de activarla)
+    CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "False").lower() == "true"
+    RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))  # Pares (pregunta, fragmento) por pasada
+    RERANK_MIN_SCORE = float(os.getenv("RERANK_MIN_SCORE", "-inf"))  # Puntuación mínima del cross-encoder (logit)
+    CONTEXT_MAX_FRAGMENTS = int(os.getenv("CONTEXT_MAX_FRAGMENTS", "4"))  # Fragmentos que pasan al prompt
+    MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1 = solo relevancia; 0 = solo diversidad
+    MMR_DUPLICATE_SIMILARITY = float(os.getenv("MMR_DUPLICATE_SIMILARITY", "0.92"))  # Coseno a partir del cual se descarta
+    SENTENCE_EXTRACTION = os.getenv("SENTENCE_EXTRACTION", "False").lower() == "true"
+    SENTENCE_MIN_SIMILARITY = float(os.getenv("SENTENCE_MIN_SIMILARITY", "0.35"))  # Coseno mínimo pregunta-frase
+
+    # Ingesta de PDFs en segundo plano
+    PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))  # Procesos (0 = en el hilo de ingesta)
+    PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))  # Páginas extraídas por tarea del pool de procesos
+    INGESTION_EMBED_BATCH_SIZE = int(os.getenv("INGESTION_EMBED_BATCH_SIZE", "64"))  # Fragmentos codificados e indexados por lote
+    INGESTION_JOB_HISTORY = int(os.getenv("INGESTION_JOB_HISTORY", "100"))  # Trabajos terminados que se conservan
+
+    # Caché persistente de embeddings de fragmentos, por (modelo, hash del texto); vacío = desactivada
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "app/faiss_indices/embedding_cache.sqlite")
+    EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))  # Tamaño máximo de los vectores (0 = sin límite)
+
+    # Caché semántica de respuestas: preguntas con embeddings similares (mismo modelo, idioma y corpus)
+    # reutilizan la respuesta sin recuperar, traducir ni generar
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))  # Respuestas guardadas (0 = desactivada)
+    ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # Segundos de vida de cada respuesta (0 = sin caducidad)
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # Similitud coseno mínima
+
+    # Modelos locales (embeddings, traducción): se cargan en el primer uso. WARMUP_MODELS (p. ej. "embedding,translation")
+    # los carga en segundo plano al arrancar, sin retrasar la disponibilidad de la API
+    WARMUP_MODELS = [name.strip() for name in os.getenv("WARMUP_MODELS", "").split(",") if name.strip()]
+
+    # Logs: nivel mínimo (DEBUG, INFO, WARNING, ERROR) y formato ("text" o "json", una línea por registro)
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
 
     # Variables de entorno adicionales
     DEBUG = os.getenv("DEBUG", "True").lower() == "true"
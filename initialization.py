@@ -1,13 +1,23 @@
-from sentence_transformers import SentenceTransformer
 from app.services.query_service import QueryService
 from app.services.pdf_service import PDFService
-from app.models.ollama_model import OllamaModel
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.ingestion_jobs import IngestionJobManager
+from app.services.batch_query import BatchQueryRunner
+from app.services.collection_manager import CollectionManager
+from app.models.model_factory import ModelFactory
+from app.models.registry import model_registry, LazyModel
+from app.config import Config
+from app.utils.translation import Translator
 
-# Inicialización del cliente de embeddings
-embedding_client = SentenceTransformer('all-MiniLM-L6-v2')
+# Modelo de embeddings compartido por consultas e ingesta; se carga en el primer uso (ver app/models/registry.py)
+embedding_client = LazyModel(model_registry, "embedding")
 
-# Inicialización de los clientes de modelos generativos
-ollama_client = OllamaModel(base_url="http://127.0.0.1:11434/api/generate")
+# Traductor compartido (preguntas, fragmentos y pretraducción al indexar); su modelo también se carga en el primer uso
+translator = Translator()
+
+# Inicialización de los clientes de modelos generativos: la generación se reparte entre los servidores de
+# Config.OLLAMA_ENDPOINTS según su carga, con afinidad de modelo y reintento en otro servidor si uno falla
+ollama_client = ModelFactory.get_model("ollama_router", {"endpoints": Config.OLLAMA_ENDPOINTS})
 
 
 # Diccionario de clientes de modelos
@@ -20,13 +30,32 @@ model_clients = {
 
 # Inicialización del servicio de consultas
 query_service = QueryService(
-    index_path="app/faiss_indices/index.faiss",
-    model_clients=model_clients
+    index_path=Config.FAISS_INDEX_PATH,
+    model_clients=model_clients,
+    translator=translator
+)
+
+# Colecciones con nombre (un índice y unos fragmentos por colección), cargadas en el primer uso; la colección
+# por defecto es el corpus de FAISS_INDEX_PATH
+collections = CollectionManager(
+    query_service,
+    lambda index_path: QueryService(index_path, model_clients, translator=translator, parent=query_service),
 )
 
+# Micro-lotes de embeddings para las consultas concurrentes
+embedding_batcher = EmbeddingBatcher(query_service)
+
+# Lotes de preguntas (evaluaciones y preguntas y respuestas masivas)
+batch_query_runner = BatchQueryRunner(query_service, translator=translator)
+
 # Inicialización del servicio PDF
 pdf_service = PDFService(
-    temp_pdf_path="app/uploaded_pdfs",
-    faiss_index_path="app/faiss_indices/index.faiss",
-    query_service=query_service
+    temp_pdf_path=Config.TEMP_PDF_PATH,
+    faiss_index_path=Config.FAISS_INDEX_PATH,
+    query_service=query_service,
+    translator=translator,
+    embedding_model=embedding_client
 )
+
+# Trabajos de ingesta de PDFs en segundo plano
+ingestion_jobs = IngestionJobManager(pdf_service, collections=collections)
@@ -1,7 +1,17 @@
-from fastapi import FastAPI
+import threading
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.routes.pdf import router as pdf_router
 from app.routes.query import router as query_router
+from app.routes.system import router as system_router
+from app.config import Config
+from app.models.registry import model_registry
+from app.services.collection_manager import CollectionNotFoundError, InvalidCollectionNameError
+from app.utils.executors import ExecutorSaturatedError
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 # Crear instancia de FastAPI
 app = FastAPI(
@@ -19,8 +29,31 @@ app.add_middleware(
     allow_headers=["*"],  # Permite todos los encabezados
 )
 
+# Backpressure: si un pool de hilos está lleno se responde 503 en lugar de encolar sin límite
+@app.exception_handler(ExecutorSaturatedError)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturatedError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+# Colección indicada en una petición que no existe o con un nombre no válido
+@app.exception_handler(CollectionNotFoundError)
+async def collection_not_found_handler(request: Request, exc: CollectionNotFoundError):
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
+@app.exception_handler(InvalidCollectionNameError)
+async def invalid_collection_name_handler(request: Request, exc: InvalidCollectionNameError):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+# Precarga opcional de modelos en segundo plano: la API acepta peticiones (y /health responde) mientras tanto
+@app.on_event("startup")
+async def warmup_models():
+    if Config.WARMUP_MODELS:
+        threading.Thread(
+            target=model_registry.warmup, args=(Config.WARMUP_MODELS,), name="model-warmup", daemon=True
+        ).start()
+
 # Registrar rutas
-print("[DEBUG] main.py: Registrando rutas de PDF y Query.")
+logger.debug("Registrando rutas de PDF, Query y System.")
 app.include_router(pdf_router, prefix="/pdf", tags=["PDF Processing"])
 app.include_router(query_router, prefix="/query", tags=["Query Models"])
-print("[DEBUG] main.py: Configuración completa.")
+app.include_router(system_router, tags=["System"])
+logger.debug("Configuración completa.")
@@ -1,16 +1,14 @@
 from app.models.base_model import BaseModel
-import requests
+from app.models.http_client import get_client
 
 class GPTNeoXModel(BaseModel):
     def __init__(self, endpoint: str):
         self.endpoint = endpoint
+        self.client = get_client(endpoint)
 
     def generate(self, context: str) -> str:
         try:
-            response = requests.post(
-                self.endpoint,
-                json={"context": context}
-            )
+            response = self.client.post({"context": context})
             return response.json().get("response", "Sin respuesta generada.")
         except Exception as e:
             return f"Error al generar respuesta con GPT-NeoX: {str(e)}"
@@ -0,0 +1,269 @@
+import asyncio
+import contextlib
+import random
+import threading
+import time
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from app.config import Config
+from app.utils.metrics import metrics
+
+# Códigos HTTP transitorios que merece la pena reintentar
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """
+    Se lanza cuando el circuito de un backend está abierto y la petición no se envía.
+    """
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Circuito abierto para {endpoint}; se reintentará en {retry_in:.1f}s.")
+        self.endpoint = endpoint
+
+
+class _RetryableStatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"Respuesta HTTP {status_code}")
+        self.status_code = status_code
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        """
+        Circuit breaker por endpoint.
+
+        Tras `failure_threshold` fallos consecutivos el circuito se abre y las peticiones fallan al instante.
+        Pasados `reset_timeout` segundos se deja pasar una petición de prueba (semiabierto): si tiene éxito
+        el circuito se cierra y, si falla, vuelve a abrirse.
+
+        :param failure_threshold: Fallos consecutivos que abren el circuito.
+        :param reset_timeout: Segundos que el circuito permanece abierto.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def check(self, endpoint: str):
+        """
+        Lanza `CircuitOpenError` si la petición no debe enviarse.
+        """
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half_open" and self._trial_in_flight):
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+                raise CircuitOpenError(endpoint, retry_in)
+            if state == "half_open":
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class BackendClient:
+    def __init__(self, endpoint: str):
+        """
+        Cliente HTTP compartido para un endpoint de LLM.
+
+        Mantiene conexiones keep-alive en un pool (síncrono con `requests.Session` y asíncrono con
+        `httpx.AsyncClient`), aplica timeouts de conexión y lectura, reintenta con backoff exponencial y jitter
+        los errores transitorios (solo antes de recibir la respuesta) y corta el tráfico con un circuit breaker.
+
+        :param endpoint: URL del endpoint.
+        """
+        self.endpoint = endpoint
+        self.breaker = CircuitBreaker(Config.LLM_CIRCUIT_FAILURE_THRESHOLD, Config.LLM_CIRCUIT_RESET_SECONDS)
+        self.latency_histogram = metrics.histogram(
+            "llm_backend_latency_seconds", "Latencia de las peticiones al backend de LLM", endpoint=endpoint
+        )
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.in_flight = 0
+        self._stats_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.LLM_POOL_SIZE, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._async_client = None
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(Config.LLM_READ_TIMEOUT, connect=Config.LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=Config.LLM_POOL_SIZE, max_keepalive_connections=Config.LLM_POOL_SIZE
+                ),
+            )
+        return self._async_client
+
+    def _backoff(self, attempt: int) -> float:
+        # Backoff exponencial con jitter completo
+        return random.uniform(0, min(Config.LLM_RETRY_BACKOFF_MAX, Config.LLM_RETRY_BACKOFF * 2 ** attempt))
+
+    def _count(self, field: str, delta: int = 1):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + delta)
+
+    def _failed(self):
+        self._count("failures")
+        self.breaker.record_failure()
+
+    def _rejected(self, status_code: int):
+        """
+        Cuenta una respuesta de error no reintentable. Los 5xx son fallos del backend; los 4xx (p. ej. el 404 de un
+        modelo que no está descargado) son errores de la petición: el servidor responde, así que no abren el
+        circuit breaker (que cortaría el tráfico de todos los modelos del endpoint).
+        """
+        if status_code >= 500:
+            self._failed()
+        else:
+            self.breaker.record_success()
+
+    def post(self, payload: dict, stream: bool = False) -> requests.Response:
+        """
+        POST síncrono con reintentos. Con `stream=True` el cuerpo se lee después, fuera de los reintentos.
+        """
+        self._count("requests")
+        for attempt in range(Config.LLM_MAX_RETRIES + 1):
+            self.breaker.check(self.endpoint)
+            start = time.perf_counter()
+            self._count("in_flight")
+            try:
+                response = self.session.post(
+                    self.endpoint, json=payload, stream=stream,
+                    timeout=(Config.LLM_CONNECT_TIMEOUT, Config.LLM_READ_TIMEOUT),
+                )
+                if response.status_code in RETRY_STATUS_CODES:
+                    response.close()
+                    raise _RetryableStatusError(response.status_code)
+                if not response.ok:
+                    # Se lee el cuerpo del error (pequeño) para que la conexión vuelva al pool antes de propagarlo
+                    response.content
+                    response.close()
+                    response.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout, _RetryableStatusError) as e:
+                self._failed()
+                if attempt == Config.LLM_MAX_RETRIES:
+                    raise requests.exceptions.RequestException(f"{self.endpoint}: {e}") from e
+                self._count("retries")
+                time.sleep(self._backoff(attempt))
+                continue
+            except requests.HTTPError as e:
+                self._rejected(e.response.status_code)
+                raise
+            except requests.RequestException:
+                self._failed()
+                raise
+            finally:
+                self._count("in_flight", -1)
+            self.breaker.record_success()
+            self.latency_histogram.observe(time.perf_counter() - start)
+            return response
+
+    @contextlib.asynccontextmanager
+    async def stream(self, payload: dict):
+        """
+        POST asíncrono en streaming con reintentos hasta recibir las cabeceras de la respuesta.
+
+        Uso: `async with client.stream(payload) as response: async for line in response.aiter_lines(): ...`
+        """
+        self._count("requests")
+        response = None
+        for attempt in range(Config.LLM_MAX_RETRIES + 1):
+            self.breaker.check(self.endpoint)
+            start = time.perf_counter()
+            try:
+                request = self.async_client.build_request("POST", self.endpoint, json=payload)
+                response = await self.async_client.send(request, stream=True)
+                if response.status_code in RETRY_STATUS_CODES:
+                    await response.aclose()
+                    raise _RetryableStatusError(response.status_code)
+                if response.is_error:
+                    await response.aread()
+                    await response.aclose()
+                    response.raise_for_status()
+                break
+            except (httpx.TransportError, _RetryableStatusError) as e:
+                self._failed()
+                if attempt == Config.LLM_MAX_RETRIES:
+                    raise httpx.TransportError(f"{self.endpoint}: {e}") from e
+                self._count("retries")
+                await asyncio.sleep(self._backoff(attempt))
+            except httpx.HTTPStatusError as e:
+                self._rejected(e.response.status_code)
+                raise
+            except httpx.HTTPError:
+                self._failed()
+                raise
+
+        self._count("in_flight")
+        try:
+            yield response
+        except httpx.TransportError:
+            # Fallo a mitad del stream (p. ej. timeout de lectura): cuenta para el circuit breaker
+            self._failed()
+            raise
+        else:
+            self.breaker.record_success()
+            self.latency_histogram.observe(time.perf_counter() - start)
+        finally:
+            self._count("in_flight", -1)
+            await response.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "endpoint": self.endpoint,
+            "pool_size": Config.LLM_POOL_SIZE,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "retries": self.retries,
+            "circuit": self.breaker.state,
+            "latency_seconds": self.latency_histogram.snapshot(),
+        }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(endpoint: str) -> BackendClient:
+    """
+    Devuelve el cliente compartido de un endpoint (uno por endpoint en todo el proceso).
+    """
+    with _clients_lock:
+        if endpoint not in _clients:
+            _clients[endpoint] = BackendClient(endpoint)
+        return _clients[endpoint]
+
+
+def backend_stats() -> dict:
+    """
+    Estadísticas de pool, latencia y circuit breaker por endpoint.
+    """
+    with _clients_lock:
+        return {endpoint: client.stats() for endpoint, client in _clients.items()}
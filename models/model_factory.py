@@ -1,5 +1,6 @@
+from app.config import Config
 from app.models.ollama_model import OllamaModel
-from app.models.gpt3_model import GPT3Model
+from app.models.model_router import ModelRouter
 from app.models.gpt_neox_model import GPTNeoXModel
 from app.models.llama_model import LLaMAModel
 
@@ -7,8 +8,17 @@ class ModelFactory:
     @staticmethod
     def get_model(model_name: str, config: dict):
         if model_name == "ollama":
-            return OllamaModel(config.get("model_path", ""))
+            return OllamaModel(config.get("endpoint") or Config.OLLAMA_URL)
+        elif model_name == "ollama_router":
+            # Varios servidores Ollama detrás de un único cliente (ver app/models/model_router.py)
+            endpoints = config.get("endpoints") or Config.OLLAMA_ENDPOINTS
+            return ModelRouter(
+                [ModelFactory.get_model("ollama", {"endpoint": endpoint}) for endpoint in endpoints],
+                max_concurrency=config.get("max_concurrency"),
+            )
         elif model_name == "gpt3":
+            # Importación diferida: openai solo hace falta si se usa GPT-3
+            from app.models.gpt3_model import GPT3Model
             return GPT3Model(config.get("api_key", ""))
         elif model_name == "gpt_neox":
             return GPTNeoXModel(config.get("endpoint", ""))
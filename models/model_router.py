@@ -0,0 +1,300 @@
+import asyncio
+import random
+import threading
+import time
+from typing import List, Optional, Set
+import httpx
+import requests
+from app.config import Config
+from app.models.http_client import CircuitOpenError
+from app.models.ollama_model import OllamaModel
+from app.utils.executors import ExecutorSaturatedError
+from app.utils.logger import get_logger
+from app.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+# Errores tras los que se prueba en otro servidor (si todavía no se ha enviado ningún token)
+FAILOVER_ERRORS = (requests.exceptions.RequestException, httpx.HTTPError, CircuitOpenError)
+# Tiempo durante el que no se envía a un servidor un modelo que respondió 404 (modelo no descargado)
+MISSING_MODEL_SECONDS = 60.0
+
+
+class NoEndpointError(Exception):
+    """
+    Se lanza cuando ningún servidor puede atender la petición (todos han fallado, tienen el circuito abierto
+    o no tienen el modelo).
+    """
+    def __init__(self, model_name: str, last_error: Exception = None):
+        detail = f": {last_error}" if last_error is not None else ""
+        super().__init__(f"Ningún servidor disponible para el modelo '{model_name}'{detail}")
+        self.last_error = last_error
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+class _Endpoint:
+    def __init__(self, client: OllamaModel, max_concurrency: int):
+        """
+        Estado de un servidor para el router: peticiones en curso, latencia (EWMA) y modelos cargados recientemente.
+        """
+        self.client = client
+        self.url = client.base_url
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.requests = 0
+        self.failures = 0
+        self.last_used = {}  # Modelo -> último envío (time.monotonic())
+        self.missing_until = {}  # Modelo -> hasta cuándo se considera no disponible
+        self.requests_counter = metrics.counter(
+            "llm_router_requests_total", "Peticiones enviadas a cada servidor de LLM", endpoint=self.url
+        )
+        self.failovers_counter = metrics.counter(
+            "llm_router_failovers_total", "Peticiones reintentadas en otro servidor tras un fallo", endpoint=self.url
+        )
+
+    @property
+    def circuit(self) -> str:
+        return self.client.client.breaker.state
+
+    def has_capacity(self) -> bool:
+        return not self.max_concurrency or self.in_flight < self.max_concurrency
+
+    def serves(self, model_name: str, now: float) -> bool:
+        return self.circuit != "open" and self.missing_until.get(model_name, 0.0) <= now
+
+    def warm_models(self, now: float, keep_alive: float, max_loaded: int) -> List[str]:
+        """
+        Modelos que probablemente siguen cargados: los `max_loaded` últimos enviados, si no ha pasado `keep_alive`.
+        """
+        recent = sorted(self.last_used, key=self.last_used.get, reverse=True)[:max_loaded]
+        return [model for model in recent if now - self.last_used[model] < keep_alive]
+
+    def stats(self, now: float, keep_alive: float, max_loaded: int) -> dict:
+        return {
+            "endpoint": self.url,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency or None,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "failovers": self.failovers_counter.value,
+            "circuit": self.circuit,
+            "warm_models": sorted(self.warm_models(now, keep_alive, max_loaded)),
+            "missing_models": sorted(model for model, until in self.missing_until.items() if until > now),
+        }
+
+
+class ModelRouter:
+    def __init__(self, clients: List[OllamaModel], max_concurrency: int = None, ewma_alpha: float = None,
+                 swap_penalty: float = None, keep_alive: float = None, max_loaded_models: int = None,
+                 queue_timeout: float = None):
+        """
+        Reparte la generación entre varios servidores Ollama, con la misma interfaz que `OllamaModel`.
+
+        Cada petición va al servidor con menor coste estimado: latencia media (EWMA) × (peticiones en curso + 1),
+        más `swap_penalty` segundos si el servidor no tiene ese modelo cargado, es decir, si no está entre los
+        `max_loaded_models` últimos que se le han enviado o lleva más de `keep_alive` segundos sin usarse
+        (afinidad de modelo: evita que Ollama descargue un modelo para cargar otro). Se saltan los servidores con
+        el circuito abierto o que no tienen el modelo (404).
+
+        Si un servidor falla antes de enviar el primer token, la petición se reintenta en otro. Con
+        `max_concurrency`, cada servidor atiende como mucho ese número de peticiones a la vez; el resto espera
+        a que se libere alguno (hasta `queue_timeout` segundos; después, 503).
+
+        :param clients: Clientes de cada servidor.
+        :param max_concurrency: Peticiones simultáneas por servidor (por defecto, `Config.LLM_ENDPOINT_MAX_CONCURRENCY`; 0 = sin límite).
+        :param ewma_alpha: Peso de la última latencia en la media (por defecto, `Config.LLM_ROUTER_EWMA_ALPHA`).
+        :param swap_penalty: Coste, en segundos, de cargar un modelo (por defecto, `Config.LLM_MODEL_SWAP_PENALTY`).
+        :param keep_alive: Segundos que un modelo sigue cargado tras su último uso (por defecto, `Config.LLM_MODEL_KEEP_ALIVE`).
+        :param max_loaded_models: Modelos cargados a la vez en cada servidor (por defecto, `Config.LLM_MAX_LOADED_MODELS`).
+        :param queue_timeout: Espera máxima por un hueco libre (por defecto, `Config.LLM_ROUTER_QUEUE_TIMEOUT`).
+        """
+        if not clients:
+            raise ValueError("El router necesita al menos un servidor.")
+        max_concurrency = Config.LLM_ENDPOINT_MAX_CONCURRENCY if max_concurrency is None else max_concurrency
+        self.endpoints = [_Endpoint(client, max_concurrency) for client in clients]
+        self.ewma_alpha = ewma_alpha if ewma_alpha is not None else Config.LLM_ROUTER_EWMA_ALPHA
+        self.swap_penalty = swap_penalty if swap_penalty is not None else Config.LLM_MODEL_SWAP_PENALTY
+        self.keep_alive = keep_alive if keep_alive is not None else Config.LLM_MODEL_KEEP_ALIVE
+        self.max_loaded_models = max_loaded_models or Config.LLM_MAX_LOADED_MODELS
+        self.queue_timeout = queue_timeout if queue_timeout is not None else Config.LLM_ROUTER_QUEUE_TIMEOUT
+        self.queue_wait_histogram = metrics.histogram(
+            "llm_router_queue_wait_seconds", "Espera por un servidor de LLM con capacidad libre"
+        )
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._async_waiters = []  # (event loop, future) de las corrutinas que esperan un hueco
+
+    @property
+    def base_url(self) -> str:
+        return ",".join(endpoint.url for endpoint in self.endpoints)
+
+    def _cost(self, endpoint: _Endpoint, model_name: str, now: float, default_latency: float) -> float:
+        latency = endpoint.latency_ewma if endpoint.latency_ewma is not None else default_latency
+        cost = latency * (endpoint.in_flight + 1)
+        if model_name not in endpoint.warm_models(now, self.keep_alive, self.max_loaded_models):
+            cost += self.swap_penalty
+        return cost
+
+    def _try_acquire(self, model_name: str, tried: Set[_Endpoint]) -> Optional[_Endpoint]:
+        """
+        Reserva el servidor más barato con capacidad libre (con `self._lock` tomado). Devuelve None si todos los
+        candidatos están llenos y lanza `NoEndpointError` si no queda ningún candidato.
+        """
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in tried and endpoint.serves(model_name, now)]
+        if not candidates:
+            raise NoEndpointError(model_name)
+        available = [endpoint for endpoint in candidates if endpoint.has_capacity()]
+        if not available:
+            return None
+        # Servidores sin latencia medida: la media de los demás (o 1 s), para que también reciban tráfico
+        known = [endpoint.latency_ewma for endpoint in self.endpoints if endpoint.latency_ewma is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+        # Desempate aleatorio entre servidores con el mismo coste
+        endpoint = min(available, key=lambda e: (self._cost(e, model_name, now, default_latency), random.random()))
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+        # El servidor carga el modelo al recibir la petición
+        endpoint.last_used[model_name] = now
+        endpoint.requests_counter.inc()
+        return endpoint
+
+    def _acquire(self, model_name: str, tried: Set[_Endpoint]) -> _Endpoint:
+        start = time.monotonic()
+        with self._released:
+            while True:
+                endpoint = self._try_acquire(model_name, tried)
+                if endpoint is not None:
+                    self.queue_wait_histogram.observe(time.monotonic() - start)
+                    return endpoint
+                remaining = start + self.queue_timeout - time.monotonic()
+                if remaining <= 0:
+                    raise ExecutorSaturatedError("llm")
+                self._released.wait(remaining)
+
+    async def _aacquire(self, model_name: str, tried: Set[_Endpoint]) -> _Endpoint:
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                endpoint = self._try_acquire(model_name, tried)
+                if endpoint is None:
+                    released = loop.create_future()
+                    self._async_waiters.append((loop, released))
+            if endpoint is not None:
+                self.queue_wait_histogram.observe(time.monotonic() - start)
+                return endpoint
+            remaining = start + self.queue_timeout - time.monotonic()
+            try:
+                await asyncio.wait_for(released, max(remaining, 0))
+            except asyncio.TimeoutError:
+                raise ExecutorSaturatedError("llm")
+
+    def _release(self, endpoint: _Endpoint, model_name: str, latency: float = None, error: Exception = None):
+        now = time.monotonic()
+        with self._lock:
+            endpoint.in_flight -= 1
+            if latency is not None:
+                if endpoint.latency_ewma is None:
+                    endpoint.latency_ewma = latency
+                else:
+                    endpoint.latency_ewma += self.ewma_alpha * (latency - endpoint.latency_ewma)
+            if error is not None:
+                endpoint.failures += 1
+                if _status_code(error) == 404:
+                    endpoint.missing_until[model_name] = now + MISSING_MODEL_SECONDS
+            self._released.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, released in waiters:
+            loop.call_soon_threadsafe(_wake, released)
+
+    def _failed_over(self, endpoint: _Endpoint, model_name: str, error: Exception):
+        endpoint.failovers_counter.inc()
+        logger.warning(f"Fallo en {endpoint.url} con el modelo '{model_name}' ({error}); se reintenta en otro servidor.")
+
+    def complete(self, prompt: str, model_name: str) -> str:
+        """
+        Genera la respuesta completa (síncrono), reintentando en otro servidor si uno falla.
+        """
+        tried, last_error = set(), None
+        while True:
+            try:
+                endpoint = self._acquire(model_name, tried)
+            except NoEndpointError:
+                raise NoEndpointError(model_name, last_error)
+            start, error = time.perf_counter(), None
+            try:
+                return endpoint.client.complete(prompt, model_name)
+            except FAILOVER_ERRORS as e:
+                error = last_error = e
+                tried.add(endpoint)
+                self._failed_over(endpoint, model_name, e)
+            finally:
+                self._release(endpoint, model_name, None if error else time.perf_counter() - start, error)
+
+    def generate(self, prompt: str, model_name: str) -> str:
+        try:
+            return self.complete(prompt, model_name)
+        except NoEndpointError as e:
+            logger.error(f"Error al comunicarse con el modelo '{model_name}': {e}")
+            return f"Error: {e}"
+
+    async def astream(self, prompt: str, model_name: str):
+        """
+        Igual que `OllamaModel.astream`. Si el servidor falla antes del primer token, se pasa a otro; a mitad
+        de la respuesta ya no se puede reintentar y el error se propaga.
+        """
+        tried, last_error = set(), None
+        while True:
+            try:
+                endpoint = await self._aacquire(model_name, tried)
+            except NoEndpointError:
+                raise NoEndpointError(model_name, last_error)
+            start, error, emitted, latency = time.perf_counter(), None, False, None
+            tokens = endpoint.client.astream(prompt, model_name)
+            try:
+                async for token in tokens:
+                    emitted = True
+                    yield token
+                latency = time.perf_counter() - start
+                return
+            except FAILOVER_ERRORS as e:
+                error = last_error = e
+                if emitted:
+                    raise
+                tried.add(endpoint)
+                self._failed_over(endpoint, model_name, e)
+            finally:
+                # Cierra la conexión con el servidor también si el consumidor deja de leer
+                await tokens.aclose()
+                # Una respuesta abandonada por el consumidor no cuenta para la latencia media
+                self._release(endpoint, model_name, latency, error)
+
+    async def agenerate(self, prompt: str, model_name: str) -> str:
+        try:
+            tokens = [token async for token in self.astream(prompt, model_name)]
+            return "".join(tokens).strip()
+        except (NoEndpointError, *FAILOVER_ERRORS) as e:
+            logger.error(f"Error al comunicarse con el modelo '{model_name}': {e}")
+            return f"Error: {e}"
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "endpoints": [
+                    endpoint.stats(now, self.keep_alive, self.max_loaded_models) for endpoint in self.endpoints
+                ],
+                "queue_wait_seconds": self.queue_wait_histogram.snapshot(),
+            }
+
+
+def _wake(released: asyncio.Future):
+    if not released.done():
+        released.set_result(None)
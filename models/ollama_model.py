@@ -1,5 +1,12 @@
 import requests
+import httpx
 import json
+import time
+from app.models.http_client import get_client, CircuitOpenError
+from app.utils.logger import get_logger
+from app.utils.tracing import record_span
+
+logger = get_logger(__name__)
 
 class OllamaModel:
     def __init__(self, base_url: str = "http://127.0.0.1:11434/api/generate"):
@@ -9,6 +16,7 @@ class OllamaModel:
         :param base_url: URL base del servidor Ollama.
         """
         self.base_url = base_url
+        self.client = get_client(base_url)  # Conexiones keep-alive, timeouts, reintentos y circuit breaker
 
     def generate(self, prompt: str, model_name: str) -> str:
         """
@@ -18,25 +26,83 @@ class OllamaModel:
         :param model_name: Nombre del modelo.
         :return: Respuesta generada por el modelo.
         """
-        
-        payload = {"prompt": prompt, "model": model_name}
         try:
-            response = requests.post(self.base_url, json=payload, timeout=3000, stream=True)
-            response.raise_for_status()
+            return self.complete(prompt, model_name)
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            logger.error(f"Error al comunicarse con el modelo '{model_name}': {e}")
+            return f"Error: {e}"
 
-            result = ""
+    def complete(self, prompt: str, model_name: str) -> str:
+        """
+        Igual que `generate`, pero los errores de comunicación se lanzan en lugar de devolverse como texto
+        (para que `ModelRouter` pueda reintentar en otro servidor).
+        """
+        payload = {"prompt": prompt, "model": model_name}
+        start = time.perf_counter()
+        first_token = True
+        result = ""
+        # Con `with`, la conexión vuelve al pool de la sesión al terminar (o se cierra si algo falla a mitad)
+        with self.client.post(payload, stream=True) as response:
+            # Se lee el stream hasta el final (tras la línea `done` solo queda el cierre del chunked): una respuesta
+            # a medio leer no puede reutilizar su conexión
             for line in response.iter_lines():
                 if line:
                     try:
                         data = json.loads(line)
                         if "response" in data:
+                            if first_token:
+                                record_span("llm_first_token", start, time.perf_counter() - start)
+                                first_token = False
                             result += data["response"]
-                        if data.get("done"):
-                            break  # Salir del bucle cuando la respuesta esté completa
                     except json.JSONDecodeError as e:
-                        print(f"[WARNING] OllamaModel: No se pudo decodificar una línea de la respuesta: {line}")
+                        logger.warning(f"No se pudo decodificar una línea de la respuesta: {line}")
+                        continue
+        record_span("llm_generation", start, time.perf_counter() - start)
+        return result.strip()
+
+    async def astream(self, prompt: str, model_name: str):
+        """
+        Genera una respuesta en streaming: produce cada fragmento de texto en cuanto Ollama lo emite.
+
+        Si el consumidor deja de iterar (p. ej. el cliente se desconecta), la conexión con Ollama se cierra
+        y el modelo deja de generar.
+
+        :param prompt: Prompt para el modelo.
+        :param model_name: Nombre del modelo.
+        :return: Generador asíncrono de tokens.
+        """
+        payload = {"prompt": prompt, "model": model_name}
+        start = time.perf_counter()
+        first_token = True
+        async with self.client.stream(payload) as response:
+            # Se lee el stream hasta el final (tras la línea `done` solo queda el cierre del chunked): si se cierra
+            # a medio leer, httpx descarta la conexión en lugar de devolverla al pool
+            async for line in response.aiter_lines():
+                if line:
+                    try:
+                        data = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"No se pudo decodificar una línea de la respuesta: {line}")
                         continue
-            return result.strip()
-        except requests.exceptions.RequestException as e:
-            print(f"[ERROR] OllamaModel: Error al comunicarse con el modelo '{model_name}': {e}")
+                    if data.get("response"):
+                        if first_token:
+                            # Tiempo hasta el primer token: espera en el backend + procesado del prompt
+                            record_span("llm_first_token", start, time.perf_counter() - start)
+                            first_token = False
+                        yield data["response"]
+        record_span("llm_generation", start, time.perf_counter() - start)
+
+    async def agenerate(self, prompt: str, model_name: str) -> str:
+        """
+        Versión asíncrona de `generate`: no bloquea el event loop mientras Ollama genera.
+
+        :param prompt: Prompt para el modelo.
+        :param model_name: Nombre del modelo.
+        :return: Respuesta generada por el modelo.
+        """
+        try:
+            tokens = [token async for token in self.astream(prompt, model_name)]
+            return "".join(tokens).strip()
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            logger.error(f"Error al comunicarse con el modelo '{model_name}': {e}")
             return f"Error: {e}"
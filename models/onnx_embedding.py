@@ -0,0 +1,176 @@
+import inspect
+import json
+import os
+from typing import List, Union
+import numpy as np
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+ONNX_PREFIX = "onnx:"
+INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def export_model(model_name: str, output_dir: str, quantize: bool = True):
+    """
+    Exporta el transformer de un modelo de sentence-transformers a ONNX (y opcionalmente lo cuantiza a int8).
+
+    En `output_dir` quedan `model.onnx`, `model.int8.onnx` (si se cuantiza), el tokenizador y `encoder.json`
+    con el pooling, la normalización y la longitud máxima del modelo original. Solo la exportación necesita
+    PyTorch; la inferencia usa únicamente ONNX Runtime y el tokenizador.
+
+    :param model_name: Nombre o ruta del modelo de sentence-transformers.
+    :param output_dir: Directorio de destino.
+    :param quantize: Generar también la versión con cuantización dinámica int8 de los pesos.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.model(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    logger.info(f"Exportando el modelo de embeddings '{model_name}' a ONNX en {output_dir}.")
+    sentence_model = SentenceTransformer(model_name, device="cpu")
+    transformer = sentence_model[0]
+    pooling = next((module for module in sentence_model if type(module).__name__ == "Pooling"), None)
+    pooling_mode = "mean"
+    if pooling is not None:
+        # `pooling_mode` en versiones recientes de sentence-transformers, `get_pooling_mode_str()` en las anteriores
+        pooling_mode = getattr(pooling, "pooling_mode", None) or pooling.get_pooling_mode_str()
+    if pooling_mode not in ("mean", "cls"):
+        raise ValueError(f"[ERROR] Pooling '{pooling_mode}' no soportado por el backend ONNX (solo 'mean' y 'cls').")
+    settings = {
+        "model": model_name,
+        "pooling": pooling_mode,
+        "normalize": any(type(module).__name__ == "Normalize" for module in sentence_model),
+        "max_seq_length": sentence_model.max_seq_length,
+        "dimension": sentence_model.get_sentence_embedding_dimension(),
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    dummy = transformer.tokenizer(["exportación del modelo"], return_tensors="pt")
+    input_names = [name for name in INPUT_NAMES if name in dummy]
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    export_options = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_options["dynamo"] = False  # Exportador clásico: ejes dinámicos con `dynamic_axes`
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState(transformer.auto_model.eval()),
+            tuple(dummy[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=14,
+            **export_options,
+        )
+    transformer.tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, "encoder.json"), "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=2)
+    if quantize:
+        quantize_model(output_dir)
+
+
+def quantize_model(model_dir: str):
+    """
+    Genera `model.int8.onnx` a partir de `model.onnx` con cuantización dinámica int8 de los pesos
+    (las activaciones se cuantizan en cada inferencia).
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(
+        os.path.join(model_dir, "model.onnx"), os.path.join(model_dir, "model.int8.onnx"), weight_type=QuantType.QInt8
+    )
+
+
+class OnnxSentenceEncoder:
+    def __init__(self, model_dir: str, quantized: bool = True, intra_op_threads: int = 0):
+        """
+        Codificador de frases con ONNX Runtime, equivalente a `SentenceTransformer.encode` (mismo pooling y
+        normalización que el modelo exportado).
+
+        :param model_dir: Directorio generado por `export_model`.
+        :param quantized: Usar el modelo cuantizado a int8.
+        :param intra_op_threads: Hilos de ONNX Runtime por inferencia (0 = su valor por defecto).
+        """
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, "encoder.json"), "r", encoding="utf-8") as f:
+            settings = json.load(f)
+        self.model_name = settings["model"]
+        self.pooling = settings["pooling"]
+        self.normalize = settings["normalize"]
+        self.max_seq_length = settings["max_seq_length"]
+        self.dimension = settings["dimension"]
+        self.quantized = quantized
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        model_path = os.path.join(model_dir, "model.int8.onnx" if quantized else "model.onnx")
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    @classmethod
+    def from_config(cls, model_name: str, cache_dir: str, quantize: bool = True, intra_op_threads: int = 0):
+        """
+        Carga el modelo exportado desde `cache_dir`, exportándolo primero si todavía no existe.
+        """
+        model_dir = os.path.join(cache_dir, model_name.strip("/").replace("/", "__"))
+        if not os.path.exists(os.path.join(model_dir, "encoder.json")):
+            export_model(model_name, model_dir, quantize=quantize)
+        elif quantize and not os.path.exists(os.path.join(model_dir, "model.int8.onnx")):
+            quantize_model(model_dir)
+        return cls(model_dir, quantized=quantize, intra_op_threads=intra_op_threads)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        features = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+        )
+        feed = {name: features[name].astype(np.int64) for name in self.input_names if name in features}
+        if "token_type_ids" in self.input_names and "token_type_ids" not in feed:
+            feed["token_type_ids"] = np.zeros_like(feed["input_ids"])
+        hidden = self.session.run(None, feed)[0]
+
+        if self.pooling == "cls":
+            embeddings = hidden[:, 0]
+        else:
+            mask = features["attention_mask"][..., None].astype(np.float32)
+            embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype(np.float32)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, normalize_embeddings: bool = False,
+               **kwargs) -> np.ndarray:
+        """
+        Codifica frases. Acepta los mismos argumentos que `SentenceTransformer.encode` que usa la aplicación
+        (`convert_to_tensor` y similares se ignoran: siempre devuelve un array de NumPy).
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Ordenar por longitud reduce el padding dentro de cada lote
+        order = sorted(range(len(texts)), key=lambda position: len(texts[position]))
+        embeddings = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            positions = order[start:start + batch_size]
+            embeddings[positions] = self._encode_batch([texts[position] for position in positions])
+        if normalize_embeddings and not self.normalize:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
@@ -0,0 +1,137 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable
+from app.config import Config
+from app.models.onnx_embedding import ONNX_PREFIX
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ModelRegistry:
+    def __init__(self):
+        """
+        Registro de los modelos locales (embeddings, traducción, re-ordenación) compartidos por todos los servicios del proceso.
+
+        Cada modelo se carga una sola vez, la primera vez que se usa, de modo que la API arranca sin esperar a los
+        pesos y un worker solo carga los modelos que necesita. `warmup` los carga por adelantado.
+        """
+        self._loaders: Dict[str, Callable] = {}
+        self._warmups: Dict[str, Callable] = {}
+        self._models = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._model_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable, warmup: Callable = None):
+        """
+        Registra un modelo.
+
+        :param name: Nombre del modelo en el registro.
+        :param loader: Función sin argumentos que carga y devuelve el modelo.
+        :param warmup: Función opcional que recibe el modelo y ejecuta una inferencia de prueba.
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            if warmup is not None:
+                self._warmups[name] = warmup
+            self._model_locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str):
+        """
+        Devuelve el modelo, cargándolo si es la primera vez. Los hilos que lo piden mientras se carga esperan a esa carga.
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self._loaders:
+            raise KeyError(f"Modelo desconocido: '{name}'. Disponibles: {', '.join(self._loaders)}.")
+        with self._model_locks[name]:
+            if name not in self._models:
+                logger.info(f"Cargando el modelo '{name}'.")
+                start = time.perf_counter()
+                self._models[name] = self._loaders[name]()
+                self._load_seconds[name] = time.perf_counter() - start
+                logger.info(f"Modelo '{name}' cargado en {self._load_seconds[name]:.2f}s.")
+        return self._models[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def warmup(self, names: Iterable[str] = None) -> Dict[str, float]:
+        """
+        Carga los modelos indicados (todos por defecto) y ejecuta una inferencia de prueba con cada uno.
+
+        :return: Segundos dedicados a cada modelo.
+        """
+        timings = {}
+        for name in (names or list(self._loaders)):
+            start = time.perf_counter()
+            model = self.get(name)
+            if name in self._warmups:
+                self._warmups[name](model)
+            timings[name] = time.perf_counter() - start
+        return timings
+
+    def stats(self) -> dict:
+        return {
+            name: {"loaded": name in self._models, "load_seconds": self._load_seconds.get(name)}
+            for name in self._loaders
+        }
+
+
+class LazyModel:
+    def __init__(self, registry: ModelRegistry, name: str):
+        """
+        Referencia a un modelo del registro que se resuelve en el primer uso: `LazyModel(...).encode(...)`
+        carga el modelo (si hace falta) y llama a su `encode`.
+        """
+        self.registry = registry
+        self.name = name
+
+    def __getattr__(self, attribute):
+        return getattr(self.registry.get(self.name), attribute)
+
+
+def embedding_model_id() -> str:
+    """
+    Identifica el modelo de embeddings y su backend (p. ej. para no mezclar en la caché de embeddings vectores
+    de PyTorch y de ONNX int8).
+    """
+    if Config.EMBEDDING_MODEL.startswith(ONNX_PREFIX) and Config.ONNX_QUANTIZE:
+        return Config.EMBEDDING_MODEL + ":int8"
+    return Config.EMBEDDING_MODEL
+
+
+def _load_embedding_model():
+    if Config.EMBEDDING_MODEL.startswith(ONNX_PREFIX):
+        from app.models.onnx_embedding import OnnxSentenceEncoder
+        return OnnxSentenceEncoder.from_config(
+            Config.EMBEDDING_MODEL[len(ONNX_PREFIX):], Config.ONNX_CACHE_DIR,
+            quantize=Config.ONNX_QUANTIZE, intra_op_threads=Config.ONNX_INTRA_OP_THREADS,
+        )
+    # Importación diferida: sentence_transformers importa torch y transformers
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(Config.EMBEDDING_MODEL)
+
+
+def _load_translation_model():
+    from transformers import MarianMTModel, MarianTokenizer
+    return MarianTokenizer.from_pretrained(Config.TRANSLATION_MODEL), MarianMTModel.from_pretrained(Config.TRANSLATION_MODEL)
+
+
+def _load_reranker_model():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(Config.RERANKER_MODEL)
+
+
+def _warmup_translation_model(model):
+    tokenizer, marian = model
+    marian.generate(**tokenizer(["warmup"], return_tensors="pt"))
+
+
+model_registry = ModelRegistry()
+model_registry.register("embedding", _load_embedding_model, warmup=lambda model: model.encode(["warmup"]))
+model_registry.register("translation", _load_translation_model, warmup=_warmup_translation_model)
+if Config.CONTEXT_COMPRESSION and Config.RERANKER_MODEL:
+    model_registry.register("reranker", _load_reranker_model, warmup=lambda model: model.predict([("warmup", "warmup")]))
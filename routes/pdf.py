@@ -1,39 +1,116 @@
 import os
+import shutil
+import uuid
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.initialization import pdf_service
+from app.initialization import ingestion_jobs, collections
 from app.config import Config
+from app.services.collection_manager import InvalidCollectionNameError
+from app.services.ingestion_jobs import DocumentBusyError, remove_upload
+from app.utils.executors import io_pool, ExecutorSaturatedError
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
-@router.post("/upload")
-async def upload_pdf(file: UploadFile = File(...)):
+@router.post("/upload", status_code=202)
+async def upload_pdf(file: UploadFile = File(...), doc_id: str = None, collection: str = None):
     """
-    Endpoint para subir y procesar un archivo PDF.
+    Endpoint para subir un archivo PDF y encolar su procesamiento.
+
+    El PDF se procesa en segundo plano y se añade al corpus como un documento; si ya existe uno con el mismo ID,
+    se reemplaza al terminar. Devuelve el ID del trabajo, cuyo progreso se consulta en `GET /pdf/jobs/{job_id}`.
+
+    :param collection: Colección en la que se indexa (se crea si no existe; por defecto, `DEFAULT_COLLECTION`).
     """
-    print("[DEBUG] upload_pdf: Iniciando procesamiento del archivo.")
+    logger.debug("Iniciando procesamiento del archivo.")
 
+    file_path = None
     try:
         # Verifica que el archivo sea un PDF
-        print(f"[DEBUG] upload_pdf: Verificando si el archivo '{file.filename}' es un PDF.")
+        logger.debug(f"Verificando si el archivo '{file.filename}' es un PDF.")
         if not file.filename.endswith(".pdf"):
-            print("[ERROR] upload_pdf: El archivo no tiene extensión .pdf.")
+            logger.error("El archivo no tiene extensión .pdf.")
             raise HTTPException(status_code=400, detail="El archivo debe ser un PDF.")
         
-        # Guarda el archivo PDF temporalmente
-        file_path = os.path.join(Config.TEMP_PDF_PATH, file.filename)
-        print(f"[DEBUG] upload_pdf: Guardando archivo en la ruta temporal: {file_path}.")
-        os.makedirs(Config.TEMP_PDF_PATH, exist_ok=True)  # Asegura que el directorio exista
+        # Guarda el archivo PDF temporalmente (un directorio por subida, para que no se pisen)
+        upload_dir = os.path.join(Config.TEMP_PDF_PATH, uuid.uuid4().hex)
+        file_path = os.path.join(upload_dir, os.path.basename(file.filename))
+        logger.debug(f"Guardando archivo en la ruta temporal: {file_path}.")
+        os.makedirs(upload_dir, exist_ok=True)
         with open(file_path, "wb") as f:
-            f.write(await file.read())
-        print("[DEBUG] upload_pdf: Archivo guardado exitosamente.")
+            await io_pool.run(shutil.copyfileobj, file.file, f)
+        logger.debug("Archivo guardado exitosamente.")
         
-        # Procesa el archivo PDF
-        print("[DEBUG] upload_pdf: Procesando el archivo PDF con pdf_service.process_pdf.")
-        pdf_service.process_pdf(file_path)
-        print("[DEBUG] upload_pdf: Archivo procesado y añadido al índice con éxito.")
+        # Encola el procesamiento del PDF
+        job = ingestion_jobs.submit(file_path, doc_id=doc_id, temporary=True, collection=collection)
+        logger.debug(f"Trabajo de ingesta {job.job_id} encolado.")
+
+        return {"message": "PDF recibido; se está procesando en segundo plano", **job.to_dict()}
 
-        return {"message": "PDF procesado y añadido al índice con éxito"}
-    
+    except DocumentBusyError as e:
+        remove_upload(file_path)
+        raise HTTPException(status_code=409, detail=str(e))
+    except (HTTPException, ExecutorSaturatedError, InvalidCollectionNameError):
+        if file_path:
+            remove_upload(file_path)
+        raise
     except Exception as e:
-        print(f"[ERROR] upload_pdf: Error al procesar el archivo PDF: {e}")
+        logger.error(f"Error al procesar el archivo PDF: {e}")
+        if file_path:
+            remove_upload(file_path)
         raise HTTPException(status_code=500, detail=f"Error al procesar el archivo PDF: {str(e)}")
+
+
+@router.get("/jobs")
+async def list_jobs():
+    """
+    Lista los trabajos de ingesta recientes y su estado.
+    """
+    return {"jobs": [job.to_dict() for job in ingestion_jobs.list()]}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Estado y progreso de un trabajo de ingesta (páginas extraídas y fragmentos indexados).
+    """
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No existe el trabajo '{job_id}'.")
+    return job.to_dict()
+
+
+@router.get("/collections")
+async def list_collections():
+    """
+    Lista las colecciones (en disco o cargadas en memoria).
+    """
+    return {"collections": collections.list()}
+
+
+@router.get("/documents")
+async def list_documents(collection: str = None):
+    """
+    Lista los documentos indexados en una colección (por defecto, `DEFAULT_COLLECTION`).
+    """
+    service = await collections.aget(collection)
+    return {"collection": collections.resolve_name(collection), "documents": service.list_documents()}
+
+
+@router.delete("/documents/{doc_id}")
+async def delete_document(doc_id: str, collection: str = None):
+    """
+    Elimina un documento y sus fragmentos de una colección (por defecto, `DEFAULT_COLLECTION`).
+
+    Espera al bloqueo de escritura del corpus (p. ej. una ingesta en curso en otro worker) fuera del event loop.
+    """
+    def delete() -> int:
+        # La colección no se descarga mientras se borra el documento
+        with collections.pinned(collection) as service:
+            return service.delete_document(doc_id)
+
+    removed = await io_pool.run(delete)
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"No existe el documento '{doc_id}'.")
+    return {"message": "Documento eliminado", "doc_id": doc_id, "fragments": removed}
@@ -1,26 +1,96 @@
-from fastapi import APIRouter
-from app.initialization import query_service
-from app.utils.translation import Translator
+import json
+import time
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, UploadFile, File
+from fastapi.responses import StreamingResponse
+from app.initialization import (
+    query_service, embedding_batcher, translator, pdf_service, batch_query_runner, ollama_client, collections
+)
+from app.services.batch_query import parse_questions
+from app.services.corpus_store import SearchFilter
+from app.services.single_flight import Broadcast, SingleFlight, normalize_question
+from app.config import Config
+from app.utils.executors import inference_pool, pool_stats, ExecutorSaturatedError
+from app.models.http_client import backend_stats
+from app.utils.logger import get_logger
+from app.utils.tracing import begin_trace, span
+
+logger = get_logger(__name__)
 
 router = APIRouter()
-translator = Translator()
 
-def filter_relevant_fragments(question, fragments):
-    keywords = question.lower().split()  # Palabras clave de la pregunta
-    relevant_fragments = [frag for frag in fragments if any(kw in frag.lower() for kw in keywords)]
-    return relevant_fragments if relevant_fragments else fragments[:3]  # Usa los primeros 3 si no hay coincidencias
+# Consultas idénticas simultáneas: un solo cálculo (o una sola generación en streaming) por clave
+query_flights = SingleFlight("query")
 
+def search_filter(doc_id: Optional[List[str]], page_from: Optional[int], page_to: Optional[int]) -> SearchFilter:
+    """
+    Filtro de metadatos de una consulta (documentos y rango de páginas, ambos opcionales).
+    """
+    if page_from is not None and page_to is not None and page_from > page_to:
+        raise HTTPException(status_code=400, detail="page_from no puede ser mayor que page_to.")
+    return SearchFilter(doc_id, page_from, page_to)
 
-@router.post("/")
-async def query_pdf(question: str, target_language: str = "es", model_name: str = "llama2"):
-    print(f"[DEBUG] query_pdf: Procesando con modelo {model_name}.")
 
+async def retrieve_fragments(question: str, target_language: str, nprobe: int = None, ef_search: int = None,
+                             service=None, filters: SearchFilter = None):
+    """
+    Traduce la pregunta, consulta el índice FAISS y recupera los fragmentos en el idioma deseado, reducidos a
+    los que llegan al prompt (re-ordenación, sin duplicados y, si está activado, solo las frases relevantes).
+
+    :param service: Servicio de la colección consultada (por defecto, la colección por defecto).
+    :param filters: Filtro de metadatos, aplicado por FAISS y BM25 durante la búsqueda.
+    """
+    service = service or query_service
     # Traducir la pregunta al inglés si es necesario
-    question_in_english = translator.to_english(question)
+    with span("translation"):
+        question_in_english = await inference_pool.run(translator.to_english, question)
 
     # Consultar el índice FAISS
-    distances, indices = query_service.query(question_in_english)
-    fragments = query_service.get_fragments(indices, target_language, distances)
+    distances, indices = await embedding_batcher.query(
+        question_in_english, nprobe=nprobe, ef_search=ef_search, query_service=service, search_filter=filters
+    )
+    return await inference_pool.run(
+        service.get_fragments, indices, target_language, distances, question_in_english
+    )
+
+
+def with_trace(response: dict, trace) -> dict:
+    if trace is not None:
+        response["trace"] = trace.to_dict()
+    return response
+
+
+def flight_key(question: str, target_language: str, model_name: str, nprobe: int, ef_search: int,
+               service=None, filters: SearchFilter = None) -> tuple:
+    """
+    Clave de deduplicación de una consulta: pregunta normalizada, modelo, idioma, parámetros de búsqueda,
+    colección, filtro y versión del corpus (una respuesta calculada con otra versión del índice no se comparte).
+    """
+    service = service or query_service
+    return (
+        normalize_question(question), model_name, target_language, nprobe, ef_search, service.index_path,
+        filters.key() if filters else None, service.store.version,
+    )
+
+
+async def answer_question(question: str, target_language: str, model_name: str, nprobe: int = None,
+                          ef_search: int = None, service=None, filters: SearchFilter = None) -> dict:
+    """
+    Pipeline completo de `POST /query/` (caché semántica, recuperación y generación), sin la traza.
+    """
+    service = service or query_service
+    # Caché semántica: una pregunta equivalente ya respondida evita recuperar, traducir y generar
+    lookup = await inference_pool.run(service.lookup_answer, question, model_name, target_language, filters)
+    if lookup.hit:
+        return {
+            "question": question,
+            "answer": lookup.entry.answer,
+            "model": model_name,
+            "retrieved_fragments": lookup.entry.fragments,
+            "cached": True,
+        }
+
+    fragments = await retrieve_fragments(question, target_language, nprobe, ef_search, service, filters)
 
     if not fragments:
         return {
@@ -30,14 +100,14 @@ async def query_pdf(question: str, target_language: str = "es", model_name: str
             "retrieved_fragments": []
         }
 
-    # Filtrar los fragmentos relevantes
-    relevant_fragments = filter_relevant_fragments(question, fragments)
-
-    # Generar la respuesta
+    # Generar la respuesta (los fragmentos ya vienen ordenados por la búsqueda híbrida vectorial + BM25)
     try:
-        answer = query_service.generate_response(relevant_fragments, question, model_name)
+        answer = await service.agenerate_response(fragments, question, model_name)
         if not answer.strip():  # Manejo explícito de respuesta vacía
             answer = "No se pudo generar una respuesta relevante a partir del contexto proporcionado."
+        service.cache_answer(lookup, answer, fragments)
+    except ExecutorSaturatedError:
+        raise
     except Exception as e:
         answer = f"Error al generar la respuesta: {str(e)}"
 
@@ -45,6 +115,209 @@ async def query_pdf(question: str, target_language: str = "es", model_name: str
         "question": question,
         "answer": answer.strip(),
         "model": model_name,
-        "retrieved_fragments": fragments
+        "retrieved_fragments": fragments,
+        "cached": False,
     }
 
+
+@router.post("/")
+async def query_pdf(question: str, target_language: str = "es", model_name: str = "llama2",
+                    nprobe: int = None, ef_search: int = None, trace: bool = False, collection: str = None,
+                    doc_id: List[str] = Query(None), page_from: int = None, page_to: int = None):
+    """
+    Responde una pregunta con los fragmentos del corpus (RAG).
+
+    Las peticiones simultáneas con la misma pregunta (normalizada), modelo e idioma comparten un único cálculo
+    (`QUERY_COALESCING`); en ellas, la respuesta lleva `coalesced: true`.
+
+    :param trace: Incluir en la respuesta la traza de la petición (`trace`: duración de cada etapa).
+    :param collection: Colección consultada (por defecto, `DEFAULT_COLLECTION`).
+    :param doc_id: Buscar solo en estos documentos (se puede repetir).
+    :param page_from: Buscar solo en fragmentos que terminan en esta página o después.
+    :param page_to: Buscar solo en fragmentos que empiezan en esta página o antes.
+    """
+    request_trace = begin_trace(trace)
+    logger.debug(f"Procesando con modelo {model_name}.")
+    filters = search_filter(doc_id, page_from, page_to)
+    service = await collections.aget(collection)
+
+    if not Config.QUERY_COALESCING:
+        return with_trace(
+            await answer_question(question, target_language, model_name, nprobe, ef_search, service, filters),
+            request_trace,
+        )
+
+    start = time.perf_counter()
+    result, shared = await query_flights.do(
+        flight_key(question, target_language, model_name, nprobe, ef_search, service, filters),
+        lambda: answer_question(question, target_language, model_name, nprobe, ef_search, service, filters),
+    )
+    response = dict(result)
+    if shared:
+        # Las etapas se registran en la traza de la petición que hizo el cálculo; esta solo esperó
+        response["coalesced"] = True
+        if request_trace is not None:
+            request_trace.add("coalesced_wait", start, time.perf_counter() - start)
+    return with_trace(response, request_trace)
+
+
+async def answer_events(question: str, target_language: str, model_name: str, nprobe: int = None,
+                        ef_search: int = None, service=None, filters: SearchFilter = None):
+    """
+    Eventos de `POST /query/stream` (`fragments`, `token`, `done` o `error`) como diccionarios, sin codificar.
+    """
+    service = service or query_service
+    lookup = await inference_pool.run(service.lookup_answer, question, model_name, target_language, filters)
+    if lookup.hit:
+        # Acierto en la caché semántica: la respuesta completa se envía como un único token
+        yield {"type": "fragments", "question": question, "model": model_name, "retrieved_fragments": lookup.entry.fragments}
+        yield {"type": "token", "token": lookup.entry.answer}
+        yield {"type": "done", "answer": lookup.entry.answer, "cached": True}
+        return
+
+    fragments = await retrieve_fragments(question, target_language, nprobe, ef_search, service, filters)
+    yield {"type": "fragments", "question": question, "model": model_name, "retrieved_fragments": fragments}
+
+    if not fragments:
+        yield {"type": "done", "answer": "No se encontraron fragmentos relevantes en el texto proporcionado."}
+        return
+
+    answer = []
+    tokens = service.astream_response(fragments, question, model_name)
+    try:
+        async for token in tokens:
+            answer.append(token)
+            yield {"type": "token", "token": token}
+    except Exception as e:
+        logger.error(f"Error al generar la respuesta: {e}")
+        yield {"type": "error", "detail": f"Error al generar la respuesta: {str(e)}"}
+        return
+    finally:
+        # Cierra el stream de Ollama (y con él la generación) si el bucle termina antes de tiempo
+        await tokens.aclose()
+
+    answer = "".join(answer).strip() or "No se pudo generar una respuesta relevante a partir del contexto proporcionado."
+    service.cache_answer(lookup, answer, fragments)
+    yield {"type": "done", "answer": answer, "cached": False}
+
+
+@router.post("/stream")
+async def query_pdf_stream(request: Request, question: str, target_language: str = "es", model_name: str = "llama2",
+                           nprobe: int = None, ef_search: int = None, format: str = "ndjson", trace: bool = False,
+                           collection: str = None, doc_id: List[str] = Query(None), page_from: int = None,
+                           page_to: int = None):
+    """
+    Igual que `POST /query/`, pero la respuesta se envía en streaming.
+
+    Primero se envía un evento `fragments` con los fragmentos recuperados, después un evento `token` por cada
+    token que emite el modelo y, al final, un evento `done` con la respuesta completa. Si el cliente se
+    desconecta, se deja de generar (cuando no quedan otros clientes esperando la misma respuesta).
+
+    Las peticiones simultáneas idénticas comparten una sola generación: las que llegan tarde reciben primero
+    los tokens ya generados y después el resto según se generan.
+
+    :param format: `ndjson` (una línea JSON por evento) o `sse` (Server-Sent Events).
+    :param trace: Incluir la traza de la petición en el evento `done`.
+    :param collection: Colección consultada; `doc_id`, `page_from` y `page_to` filtran como en `POST /query/`.
+    """
+    request_trace = begin_trace(trace)
+    logger.debug(f"Procesando con modelo {model_name}.")
+    filters = search_filter(doc_id, page_from, page_to)
+    service = await collections.aget(collection)
+
+    source = lambda: answer_events(question, target_language, model_name, nprobe, ef_search, service, filters)
+    if Config.QUERY_COALESCING:
+        key = flight_key(question, target_language, model_name, nprobe, ef_search, service, filters)
+        broadcast, shared = query_flights.stream(key, source)
+    else:
+        broadcast, shared = Broadcast(source()), False
+    start = time.perf_counter()
+    events = broadcast.subscribe()
+    try:
+        # Los errores anteriores al primer evento (p. ej. un pool saturado) se responden como error HTTP
+        await broadcast.started()
+    except BaseException:
+        # El generador no ha empezado (cerrarlo no ejecutaría su `finally`): la baja se hace a mano
+        broadcast.unsubscribe()
+        raise
+    if shared and request_trace is not None:
+        request_trace.add("coalesced_wait", start, time.perf_counter() - start)
+
+    def encode(event: dict) -> str:
+        if event["type"] == "done":
+            event = with_trace({**event, "coalesced": True} if shared else dict(event), request_trace)
+        data = json.dumps(event, ensure_ascii=False)
+        return f"event: {event['type']}\ndata: {data}\n\n" if format == "sse" else data + "\n"
+
+    async def stream():
+        try:
+            async for event in events:
+                if event["type"] == "token" and await request.is_disconnected():
+                    logger.info("Cliente desconectado, se cancela la generación.")
+                    return
+                yield encode(event)
+        finally:
+            # Deja el reparto; si era el último cliente, se cierra el stream de Ollama
+            await events.aclose()
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type)
+
+
+@router.post("/batch")
+async def query_batch(file: UploadFile = File(...), target_language: str = "es", model_name: str = "llama2",
+                      nprobe: int = None, ef_search: int = None, include_fragments: bool = False,
+                      collection: str = None, doc_id: List[str] = Query(None), page_from: int = None,
+                      page_to: int = None):
+    """
+    Responde un lote de preguntas subido como JSONL (una pregunta por línea) y devuelve los resultados en
+    streaming, también como JSONL, según van estando listos.
+
+    Cada línea es `{"question": ..., "id": ..., "target_language": ..., "model_name": ...}` (solo `question`
+    es obligatorio) o una cadena JSON. Cada resultado lleva `line` (y `id`, si lo había) y `answer`, o `error`
+    si esa pregunta falló; las líneas no válidas también producen un resultado con `error`.
+
+    :param target_language: Idioma por defecto de las respuestas.
+    :param model_name: Modelo por defecto.
+    :param include_fragments: Incluir los fragmentos recuperados en cada resultado.
+    :param collection: Colección consultada; `doc_id`, `page_from` y `page_to` filtran como en `POST /query/`.
+    """
+    filters = search_filter(doc_id, page_from, page_to)
+    service = await collections.aget(collection)
+    questions, errors = parse_questions((await file.read()).splitlines(), target_language, model_name)
+    logger.info(f"Lote de {len(questions)} preguntas ({len(errors)} líneas no válidas).")
+
+    async def results():
+        for error in errors:
+            yield json.dumps(error, ensure_ascii=False) + "\n"
+        async for result in batch_query_runner.run(
+            questions, nprobe=nprobe, ef_search=ef_search, include_fragments=include_fragments,
+            query_service=service, search_filter=filters,
+        ):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router.get("/stats")
+async def query_stats():
+    """
+    Estadísticas del índice (versión cargada y recargas), de los micro-lotes de embeddings (tamaño de lote y espera en cola), de los pools de hilos,
+    de los backends de LLM (conexiones, latencia, reintentos y estado del circuit breaker), del reparto entre
+    servidores de LLM (carga, latencia media y modelos cargados de cada uno) y de la traducción
+    (aciertos de la caché y latencia de generate), de la caché semántica de respuestas, de la caché de
+    embeddings de la ingesta, de la agrupación de consultas idénticas simultáneas y de las colecciones cargadas
+    (el índice y la caché de respuestas son los de la colección por defecto).
+    """
+    return {
+        "index": query_service.store.stats(),
+        "collections": collections.stats(),
+        "answer_cache": query_service.answer_cache.stats() if query_service.answer_cache else None,
+        "embedding_batcher": embedding_batcher.stats(),
+        "pools": pool_stats(),
+        "backends": backend_stats(),
+        "router": ollama_client.stats(),
+        "translation": translator.stats(),
+        "embedding_cache": pdf_service.embedding_cache.stats() if pdf_service.embedding_cache else None,
+        "coalescing": query_flights.stats(),
+    }
@@ -0,0 +1,41 @@
+from typing import List
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from app.models.registry import model_registry
+from app.utils.executors import inference_pool
+from app.utils.metrics import metrics
+
+router = APIRouter()
+
+
+@router.get("/health")
+async def health():
+    """
+    Comprobación de disponibilidad: responde en cuanto la API ha arrancado, sin esperar a que se carguen los modelos.
+    """
+    return {"status": "ok", "models": model_registry.stats()}
+
+
+@router.post("/warmup")
+async def warmup(models: List[str] = Query(None)):
+    """
+    Carga los modelos indicados (todos por defecto) y ejecuta una inferencia de prueba con cada uno,
+    para que la primera consulta no pague el tiempo de carga.
+    """
+    try:
+        timings = await inference_pool.run(model_registry.warmup, models)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    return {"warmed_up": timings, "models": model_registry.stats()}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Métricas del proceso en el formato de texto de Prometheus: histogramas de latencia de cada etapa de las
+    consultas (`query_stage_seconds`) y de la ingesta (`ingestion_stage_seconds`), de los lotes de embeddings,
+    de la traducción y de los backends de LLM.
+
+    Con varios workers, cada uno expone sus propias métricas.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+
+
+class _CachedAnswer:
+    def __init__(self, embedding: np.ndarray, model_name: str, target_language: str, answer: str,
+                 fragments: List[str]):
+        self.embedding = embedding
+        self.model_name = model_name
+        self.target_language = target_language
+        self.answer = answer
+        self.fragments = fragments
+        self.created_at = time.monotonic()
+
+
+class AnswerLookup:
+    def __init__(self, embedding: Optional[np.ndarray], model_name: str, target_language: str,
+                 corpus_version: int, entry: Optional[_CachedAnswer]):
+        """
+        Resultado de buscar una pregunta en la caché: la entrada encontrada (`entry`, o None) y los datos
+        necesarios para guardar después la respuesta generada.
+        """
+        self.embedding = embedding
+        self.model_name = model_name
+        self.target_language = target_language
+        self.corpus_version = corpus_version
+        self.entry = entry
+
+    @property
+    def hit(self) -> bool:
+        return self.entry is not None
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_entries: int, ttl: float, similarity_threshold: float):
+        """
+        Caché de respuestas indexada por el embedding de la pregunta.
+
+        Una pregunta acierta si existe una respuesta del mismo modelo e idioma, generada con la misma versión del
+        corpus, cuya pregunta tiene una similitud coseno mayor o igual que `similarity_threshold`. Las entradas
+        caducan a los `ttl` segundos y, por encima de `max_entries`, se descarta la usada hace más tiempo (LRU).
+        Cuando cambia la versión del corpus se vacía entera.
+
+        :param max_entries: Número máximo de respuestas guardadas.
+        :param ttl: Segundos de vida de cada respuesta (0 = sin caducidad).
+        :param similarity_threshold: Similitud coseno mínima para considerar dos preguntas equivalentes.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._corpus_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def _sync_version(self, corpus_version: int):
+        if corpus_version != self._corpus_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._corpus_version = corpus_version
+
+    def _is_expired(self, entry: _CachedAnswer, now: float) -> bool:
+        return self.ttl > 0 and now - entry.created_at > self.ttl
+
+    def lookup(self, embedding: np.ndarray, model_name: str, target_language: str,
+               corpus_version: int) -> Optional[_CachedAnswer]:
+        """
+        Busca la respuesta de la pregunta más parecida (vecino más cercano) por encima del umbral.
+
+        :return: La entrada encontrada, o None si no hay ninguna suficientemente parecida.
+        """
+        embedding = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            self._sync_version(corpus_version)
+            for key in [key for key, entry in self._entries.items() if self._is_expired(entry, now)]:
+                del self._entries[key]
+
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry.model_name == model_name and entry.target_language == target_language
+            ]
+            if candidates:
+                similarities = np.stack([entry.embedding for _, entry in candidates]) @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def store(self, embedding: np.ndarray, model_name: str, target_language: str, corpus_version: int,
+              answer: str, fragments: List[str]):
+        """
+        Guarda una respuesta. Se ignora si se calculó con una versión del corpus anterior a la de la caché.
+        """
+        entry = _CachedAnswer(self._normalize(embedding), model_name, target_language, answer, fragments)
+        with self._lock:
+            if self._corpus_version is None or corpus_version > self._corpus_version:
+                self._sync_version(corpus_version)
+            if corpus_version != self._corpus_version:
+                return
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "similarity_threshold": self.similarity_threshold,
+                "corpus_version": self._corpus_version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
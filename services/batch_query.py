@@ -0,0 +1,202 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Iterable, List
+from app.config import Config
+from app.services.corpus_store import SearchFilter
+from app.utils.executors import inference_pool
+from app.utils.logger import get_logger
+from app.utils.tracing import begin_trace, span
+
+logger = get_logger(__name__)
+
+NO_FRAGMENTS_MESSAGE = "No se encontraron fragmentos relevantes en el texto proporcionado."
+
+
+class BatchQuestion:
+    def __init__(self, line: int, question: str, question_id=None, target_language: str = "es",
+                 model_name: str = "llama2"):
+        """
+        Una pregunta de un lote (una línea del JSONL de entrada).
+
+        :param line: Número de línea en el archivo de entrada (empezando en 1).
+        :param question_id: Identificador opcional (`id`) que se copia en el resultado.
+        """
+        self.line = line
+        self.question = question
+        self.question_id = question_id
+        self.target_language = target_language
+        self.model_name = model_name
+
+    def result(self, **fields) -> dict:
+        result = {"line": self.line, "question": self.question, "model": self.model_name, **fields}
+        if self.question_id is not None:
+            result["id"] = self.question_id
+        return result
+
+
+def parse_questions(lines: Iterable, target_language: str = "es", model_name: str = "llama2"):
+    """
+    Interpreta las líneas de un JSONL de preguntas.
+
+    Cada línea es un objeto con `question` y, opcionalmente, `id`, `target_language` y `model_name` (por defecto,
+    los del lote), o directamente una cadena JSON con la pregunta. Las líneas vacías se ignoran.
+
+    :return: Preguntas válidas y resultados de error de las líneas que no se pudieron interpretar.
+    """
+    questions, errors = [], []
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            question = item.get("question") if isinstance(item, dict) else None
+            if not isinstance(question, str) or not question.strip():
+                raise ValueError("falta el campo 'question'")
+        except ValueError as e:
+            errors.append({"line": line_number, "error": f"Línea no válida: {e}"})
+            continue
+        questions.append(BatchQuestion(
+            line_number, question, item.get("id"),
+            item.get("target_language") or target_language, item.get("model_name") or model_name,
+        ))
+    return questions, errors
+
+
+class BatchQueryRunner:
+    def __init__(self, query_service, translator=None, chunk_size: int = None, concurrency: int = None):
+        """
+        Responde lotes de preguntas (evaluaciones nocturnas, preguntas y respuestas masivas).
+
+        La recuperación se hace por bloques de `chunk_size` preguntas: las preguntas del bloque se traducen en una
+        sola llamada a `translate_batch`, se codifican en una sola pasada del modelo de embeddings y se buscan con
+        un único `index.search` de varias filas; los fragmentos se traducen también juntos. Las generaciones se
+        envían al LLM con como mucho `concurrency` peticiones en vuelo, mientras se recupera el bloque siguiente.
+
+        Las respuestas no pasan por la caché semántica: una evaluación mide siempre la generación.
+
+        :param query_service: Servicio de consultas (búsqueda, fragmentos y generación).
+        :param translator: Traductor de las preguntas al inglés (opcional).
+        :param chunk_size: Preguntas recuperadas a la vez (por defecto, `Config.BATCH_QUERY_CHUNK_SIZE`).
+        :param concurrency: Generaciones simultáneas (por defecto, `Config.BATCH_QUERY_CONCURRENCY`).
+        """
+        self.query_service = query_service
+        self.translator = translator
+        self.chunk_size = chunk_size or Config.BATCH_QUERY_CHUNK_SIZE
+        self.concurrency = concurrency or Config.BATCH_QUERY_CONCURRENCY
+
+    def retrieve(self, questions: List[BatchQuestion], k: int = 10, distance_threshold: float = 1.7,
+                 nprobe: int = None, ef_search: int = None, query_service=None,
+                 search_filter: SearchFilter = None) -> List[List[str]]:
+        """
+        Recupera los fragmentos de un bloque de preguntas (bloqueante; se ejecuta en el pool de inferencia).
+
+        :param query_service: Servicio de la colección en la que se busca (por defecto, el del runner).
+        :param search_filter: Filtro de metadatos aplicado durante la búsqueda.
+        :return: Fragmentos de cada pregunta, en el idioma de la pregunta.
+        """
+        query_service = query_service or self.query_service
+        texts = [question.question for question in questions]
+        if self.translator:
+            with span("translation"):
+                texts = self.translator.translate_batch(texts, source_lang="es", target_lang="en")
+        with span("embedding"):
+            embeddings = query_service.encode_questions(texts)
+        with span("faiss_search"):
+            allowed_ids = query_service.allowed_ids(search_filter)
+            distances, indices = query_service.search_embeddings(
+                embeddings, k, nprobe=nprobe, ef_search=ef_search, allowed_ids=allowed_ids
+            )
+
+        hits = [
+            query_service.hybrid_results(text, distances[row], indices[row], k, distance_threshold, allowed_ids)
+            for row, text in enumerate(texts)
+        ]
+        return query_service.get_fragments_batch(
+            [hit_indices for _, hit_indices in hits],
+            [question.target_language for question in questions],
+            [hit_distances for hit_distances, _ in hits],
+            questions=texts,
+        )
+
+    async def run(self, questions: List[BatchQuestion], k: int = 10, distance_threshold: float = 1.7,
+                  nprobe: int = None, ef_search: int = None, include_fragments: bool = False,
+                  query_service=None, search_filter: SearchFilter = None) -> AsyncIterator[dict]:
+        """
+        Responde las preguntas y va devolviendo cada resultado en cuanto está listo (no en el orden de entrada;
+        `line` e `id` identifican la pregunta).
+
+        :param include_fragments: Incluir los fragmentos recuperados en cada resultado.
+        :param query_service: Servicio de la colección en la que se busca (por defecto, el del runner).
+        :param search_filter: Filtro de metadatos aplicado durante la búsqueda.
+        :return: Generador asíncrono de resultados (`answer`, o `error` si la pregunta falló).
+        """
+        query_service = query_service or self.query_service
+        # Sin traza por pregunta: las etapas se miden (en /metrics) una vez por bloque
+        begin_trace(enabled=False)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # Preguntas recuperadas pendientes de respuesta: acota la memoria y lo que se adelanta la recuperación
+        in_flight = asyncio.Semaphore(2 * self.chunk_size)
+        results = asyncio.Queue()
+
+        async def answer(question: BatchQuestion, fragments: List[str]):
+            start = time.perf_counter()
+            try:
+                if not fragments:
+                    text = NO_FRAGMENTS_MESSAGE
+                else:
+                    async with semaphore:
+                        text = await query_service.agenerate_response(
+                            fragments, question.question, question.model_name, question.target_language
+                        )
+                result = question.result(answer=text.strip(), latency_ms=round((time.perf_counter() - start) * 1000, 1))
+            except Exception as e:
+                logger.error(f"Error al responder la línea {question.line}: {e}")
+                result = question.result(error=f"Error al generar la respuesta: {e}")
+            finally:
+                in_flight.release()
+            if include_fragments:
+                result["retrieved_fragments"] = fragments
+            await results.put(result)
+
+        async def produce():
+            tasks = []
+            try:
+                for start in range(0, len(questions), self.chunk_size):
+                    chunk = questions[start:start + self.chunk_size]
+                    # Las generaciones del bloque anterior siguen en vuelo mientras se recupera este
+                    for _ in chunk:
+                        await in_flight.acquire()
+                    try:
+                        fragments = await inference_pool.run(
+                            self.retrieve, chunk, k, distance_threshold, nprobe, ef_search, query_service, search_filter
+                        )
+                    except Exception as e:
+                        logger.error(f"Error al recuperar los fragmentos de {len(chunk)} preguntas: {e}")
+                        for question in chunk:
+                            in_flight.release()
+                            await results.put(question.result(error=f"Error al recuperar los fragmentos: {e}"))
+                        continue
+                    tasks.extend(asyncio.create_task(answer(q, f)) for q, f in zip(chunk, fragments))
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await results.put(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                yield result
+        finally:
+            # Si el consumidor deja de leer (cliente desconectado), se cancelan las generaciones pendientes
+            if not producer.done():
+                producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
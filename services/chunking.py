@@ -0,0 +1,289 @@
+import bisect
+import re
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional
+from app.config import Config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Separa frases tras un signo de fin de frase seguido de espacio
+_SENTENCE_RE = re.compile(r"\S.*?(?:[.!?…]+[\"')\]»]*(?=\s)|$)", re.S)
+_TERMINAL_PUNCTUATION = (".", "!", "?", ":", "…")
+
+TokenCounter = Callable[[str], int]
+
+
+def approximate_token_count(text: str) -> int:
+    """
+    Estimación de tokens (unos 4 caracteres por token) para cuando no hay un tokenizador disponible.
+    """
+    return max(1, (len(text) + 3) // 4)
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Divide un texto en frases (tras un signo de fin de frase seguido de espacio), con los espacios normalizados.
+    """
+    sentences = (" ".join(match.group().split()) for match in _SENTENCE_RE.finditer(text))
+    return [sentence for sentence in sentences if sentence]
+
+
+def tokenizer_counter(tokenizer) -> TokenCounter:
+    """
+    Contador de tokens a partir de un tokenizador de Hugging Face (sin tokens especiales).
+    """
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def load_token_counter(tokenizer_name: Optional[str] = None) -> TokenCounter:
+    """
+    Contador de tokens del tokenizador `tokenizer_name` (Hugging Face) o, si no se indica o no se puede cargar,
+    la estimación por caracteres.
+    """
+    if tokenizer_name:
+        try:
+            from transformers import AutoTokenizer
+            return tokenizer_counter(AutoTokenizer.from_pretrained(tokenizer_name))
+        except Exception as e:
+            logger.warning(f"No se pudo cargar el tokenizador '{tokenizer_name}': {e}. Se estiman los tokens.")
+    return approximate_token_count
+
+
+class Chunk:
+    def __init__(self, text: str, page: int, offset: int, page_end: int, tokens: int):
+        """
+        Fragmento de un documento.
+
+        :param text: Texto del fragmento.
+        :param page: Página (desde 1) en la que empieza.
+        :param offset: Posición (en caracteres) del inicio del fragmento en el texto de esa página.
+        :param page_end: Página en la que termina.
+        :param tokens: Tokens del fragmento según el contador del chunker.
+        """
+        self.text = text
+        self.page = page
+        self.offset = offset
+        self.page_end = page_end
+        self.tokens = tokens
+
+    def metadata(self) -> dict:
+        return {"page": self.page, "page_end": self.page_end, "offset": self.offset, "tokens": self.tokens}
+
+
+class Chunker(ABC):
+    """
+    Etapa de fragmentación de la ingesta. Recibe el texto página a página (`feed`) y devuelve los fragmentos
+    que ya están completos; `flush` devuelve el resto al final del documento.
+    """
+
+    @abstractmethod
+    def feed(self, page: int, text: str) -> List[Chunk]:
+        """Añade el texto de una página y devuelve los fragmentos completados."""
+        pass
+
+    @abstractmethod
+    def flush(self) -> List[Chunk]:
+        """Devuelve los fragmentos pendientes al terminar el documento."""
+        pass
+
+
+class FixedSizeChunker(Chunker):
+    def __init__(self, size: int = 500, token_counter: TokenCounter = approximate_token_count, **kwargs):
+        """
+        Ventanas fijas de `size` caracteres sobre el texto de las páginas unidas por saltos de línea
+        (el comportamiento original).
+        """
+        self.size = size
+        self.count_tokens = token_counter
+        self._buffer = ""
+        self._consumed = 0  # Caracteres del documento ya emitidos
+        self._page_starts = []  # Posición en el documento donde empieza cada página
+        self._pages = []
+
+    def _locate(self, position: int):
+        index = bisect.bisect_right(self._page_starts, position) - 1
+        return self._pages[index], position - self._page_starts[index]
+
+    def _chunk(self, text: str) -> Chunk:
+        page, offset = self._locate(self._consumed)
+        page_end, _ = self._locate(self._consumed + len(text) - 1)
+        self._consumed += len(text)
+        return Chunk(text, page, offset, page_end, self.count_tokens(text))
+
+    def feed(self, page: int, text: str) -> List[Chunk]:
+        self._page_starts.append(self._consumed + len(self._buffer))
+        self._pages.append(page)
+        self._buffer += text + "\n"
+        chunks = []
+        start = 0
+        while len(self._buffer) - start >= self.size:
+            chunks.append(self._chunk(self._buffer[start:start + self.size]))
+            start += self.size
+        self._buffer = self._buffer[start:]
+        return chunks
+
+    def flush(self) -> List[Chunk]:
+        chunks = [self._chunk(self._buffer)] if self._buffer else []
+        self._buffer = ""
+        return chunks
+
+
+class _Unit:
+    def __init__(self, text: str, page: int, offset: int, tokens: int, boundary: bool):
+        self.text = text
+        self.page = page
+        self.offset = offset
+        self.tokens = tokens
+        self.boundary = boundary  # Empieza un párrafo o una página
+
+
+class StructureChunker(Chunker):
+    def __init__(self, max_tokens: int = None, overlap_tokens: int = None, min_tokens: int = None,
+                 token_counter: TokenCounter = approximate_token_count, **kwargs):
+        """
+        Fragmenta respetando la estructura del texto: párrafos, frases y saltos de página.
+
+        Las frases se agrupan hasta `max_tokens`. Un fragmento se cierra antes si empieza un párrafo o una página
+        y ya tiene al menos `min_tokens`. Cuando un párrafo no cabe en un fragmento, se corta entre frases y el
+        siguiente fragmento repite las últimas frases del anterior, hasta `overlap_tokens`. Solo las frases más
+        largas que `max_tokens` se cortan por palabras.
+
+        :param max_tokens: Tokens máximos por fragmento (por defecto, `Config.CHUNK_MAX_TOKENS`).
+        :param overlap_tokens: Solapamiento entre fragmentos consecutivos de un mismo párrafo (por defecto, `Config.CHUNK_OVERLAP_TOKENS`).
+        :param min_tokens: Tokens a partir de los cuales se corta en un cambio de párrafo o página (por defecto, la mitad de `max_tokens`).
+        :param token_counter: Función que cuenta los tokens de un texto (p. ej. con el tokenizador del modelo de embeddings).
+        """
+        self.max_tokens = max_tokens or Config.CHUNK_MAX_TOKENS
+        self.overlap_tokens = Config.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        self.min_tokens = min_tokens if min_tokens is not None else self.max_tokens // 2
+        self.count_tokens = token_counter
+        self._current: List[_Unit] = []
+        self._current_tokens = 0
+
+    @staticmethod
+    def _paragraphs(text: str):
+        """
+        Divide el texto de una página en párrafos: (posición en la página, texto).
+
+        El texto extraído de un PDF rara vez tiene líneas en blanco, así que también se considera fin de párrafo
+        una línea que termina en un signo de puntuación final y es claramente más corta que las demás.
+        """
+        lines = text.split("\n")
+        width = max((len(line.rstrip()) for line in lines), default=0)
+        paragraphs, start, position = [], None, 0
+        for line in lines:
+            stripped = line.rstrip()
+            if stripped.strip() and start is None:
+                start = position + len(line) - len(line.lstrip())
+            end_of_paragraph = not stripped.strip() or (
+                stripped.endswith(_TERMINAL_PUNCTUATION) and len(stripped) < 0.8 * width
+            )
+            position += len(line) + 1
+            if end_of_paragraph and start is not None:
+                paragraphs.append((start, text[start:position - 1].rstrip()))
+                start = None
+        if start is not None:
+            paragraphs.append((start, text[start:].rstrip()))
+        return paragraphs
+
+    def _units(self, page: int, text: str) -> List[_Unit]:
+        units = []
+        for paragraph_offset, paragraph in self._paragraphs(text):
+            first = True
+            for match in _SENTENCE_RE.finditer(paragraph):
+                sentence = " ".join(match.group().split())
+                if not sentence:
+                    continue
+                offset = paragraph_offset + match.start()
+                tokens = self.count_tokens(sentence)
+                if tokens <= self.max_tokens:
+                    units.append(_Unit(sentence, page, offset, tokens, first))
+                else:
+                    units.extend(self._split_long(match.group(), page, offset, first))
+                first = False
+        return units
+
+    def _split_long(self, raw: str, page: int, offset: int, boundary: bool) -> List[_Unit]:
+        """
+        Corta por palabras una frase que no cabe en un fragmento.
+
+        :param raw: Texto de la frase tal como aparece en la página (para conservar las posiciones).
+        """
+        units, words, start, tokens = [], [], 0, 0
+        for word in re.finditer(r"\S+", raw):
+            word_tokens = self.count_tokens(word.group())
+            if words and tokens + word_tokens > self.max_tokens:
+                units.append(_Unit(" ".join(words), page, offset + start, tokens, boundary and not units))
+                words, tokens = [], 0
+            if not words:
+                start = word.start()
+            words.append(word.group())
+            tokens += word_tokens
+        if words:
+            units.append(_Unit(" ".join(words), page, offset + start, tokens, boundary and not units))
+        return units
+
+    def _emit(self, overlap: bool) -> Chunk:
+        units = self._current
+        text = " ".join(unit.text for unit in units)
+        chunk = Chunk(text, units[0].page, units[0].offset, units[-1].page, self.count_tokens(text))
+
+        kept, kept_tokens = [], 0
+        if overlap and self.overlap_tokens > 0:
+            # Repetir las últimas frases (sin llegar a repetir el fragmento entero)
+            for unit in reversed(units[1:]):
+                if kept_tokens + unit.tokens > self.overlap_tokens:
+                    break
+                kept.insert(0, unit)
+                kept_tokens += unit.tokens
+        self._current, self._current_tokens = kept, kept_tokens
+        return chunk
+
+    def _add(self, unit: _Unit, chunks: List[Chunk]):
+        if self._current:
+            if unit.boundary and self._current_tokens >= self.min_tokens:
+                chunks.append(self._emit(overlap=False))
+            elif self._current_tokens + unit.tokens > self.max_tokens:
+                chunks.append(self._emit(overlap=not unit.boundary))
+                # El solapamiento no debe impedir que la frase quepa
+                while self._current and self._current_tokens + unit.tokens > self.max_tokens:
+                    self._current_tokens -= self._current.pop(0).tokens
+        self._current.append(unit)
+        self._current_tokens += unit.tokens
+
+    def feed(self, page: int, text: str) -> List[Chunk]:
+        # La primera frase de cada párrafo (y, por tanto, de cada página) marca un límite preferente de corte
+        chunks = []
+        for unit in self._units(page, text):
+            self._add(unit, chunks)
+        return chunks
+
+    def flush(self) -> List[Chunk]:
+        return [self._emit(overlap=False)] if self._current else []
+
+
+CHUNKERS: Dict[str, type] = {
+    "structure": StructureChunker,
+    "fixed": FixedSizeChunker,
+}
+
+
+def register_chunker(name: str, chunker_class: type):
+    """
+    Registra una estrategia de fragmentación para usarla con `Config.CHUNKER`.
+    """
+    CHUNKERS[name] = chunker_class
+
+
+def create_chunker(name: str = None, **kwargs) -> Chunker:
+    """
+    Crea el chunker configurado (`Config.CHUNKER` por defecto) para fragmentar un documento.
+
+    :param name: Nombre de la estrategia registrada.
+    :param kwargs: Parámetros del chunker (p. ej. `token_counter`, `max_tokens`).
+    """
+    name = name or Config.CHUNKER
+    if name not in CHUNKERS:
+        raise ValueError(f"Chunker desconocido: '{name}'. Disponibles: {', '.join(CHUNKERS)}.")
+    return CHUNKERS[name](**kwargs)
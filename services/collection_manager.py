@@ -0,0 +1,242 @@
+import contextlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List
+from app.config import Config
+from app.utils.executors import io_pool
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Nombres de colección válidos: también son el nombre de su directorio
+COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+class InvalidCollectionNameError(ValueError):
+    """
+    Se lanza cuando el nombre de una colección no es válido.
+    """
+    def __init__(self, name: str):
+        super().__init__(
+            f"Nombre de colección no válido: '{name}' (letras, números, '_' y '-'; hasta 64 caracteres)."
+        )
+        self.name = name
+
+
+class CollectionNotFoundError(Exception):
+    """
+    Se lanza al consultar una colección que no existe.
+    """
+    def __init__(self, name: str):
+        super().__init__(f"No existe la colección '{name}'.")
+        self.name = name
+
+
+class CollectionManager:
+    def __init__(self, default_service, factory: Callable, root: str = None, max_loaded: int = None,
+                 max_memory_mb: int = None, default_name: str = None):
+        """
+        Colecciones con nombre: cada una es un corpus independiente (índice FAISS, fragmentos e índice léxico) con
+        su propio servicio de consultas, en `<root>/<nombre>/index.faiss`.
+
+        Las colecciones se cargan la primera vez que se usan. Si hay más de `max_loaded` cargadas o su tamaño
+        estimado (`CorpusStore.memory_bytes`, junto con el de la colección por defecto) supera `max_memory_mb`, se
+        descargan las usadas hace más tiempo (LRU), salvo las que se están modificando (`pinned`). Una colección descargada
+        sigue sirviendo a las peticiones que ya la tenían y se vuelve a cargar de disco en su siguiente uso.
+
+        La colección por defecto es el corpus de `Config.FAISS_INDEX_PATH` y no se descarga nunca.
+
+        :param default_service: Servicio de consultas de la colección por defecto.
+        :param factory: Crea el servicio de consultas de una colección a partir de la ruta de su índice.
+        :param root: Directorio de las colecciones (por defecto, `Config.COLLECTIONS_PATH`).
+        :param max_loaded: Colecciones cargadas a la vez, sin contar la por defecto (por defecto,
+                           `Config.COLLECTIONS_MAX_LOADED`).
+        :param max_memory_mb: Tamaño máximo estimado de las colecciones cargadas (por defecto,
+                              `Config.COLLECTIONS_MAX_MEMORY_MB`; 0 = sin límite).
+        :param default_name: Nombre de la colección por defecto (por defecto, `Config.DEFAULT_COLLECTION`).
+        """
+        self.default = default_service
+        self.factory = factory
+        self.root = root or Config.COLLECTIONS_PATH
+        self.max_loaded = max_loaded if max_loaded is not None else Config.COLLECTIONS_MAX_LOADED
+        max_memory_mb = max_memory_mb if max_memory_mb is not None else Config.COLLECTIONS_MAX_MEMORY_MB
+        self.max_memory = max_memory_mb * 1024 * 1024
+        self.default_name = default_name or Config.DEFAULT_COLLECTION
+        self._loaded = OrderedDict()  # Nombre -> servicio, del usado hace más tiempo al más reciente
+        self._load_locks = {}
+        self._pins = {}  # Nombre -> escrituras en curso que impiden descargar la colección
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def resolve_name(self, name: str = None) -> str:
+        """
+        Nombre de la colección de una petición (la por defecto si no se indica).
+
+        :raises InvalidCollectionNameError: Si el nombre no es válido.
+        """
+        name = name or self.default_name
+        if not COLLECTION_NAME.match(name):
+            raise InvalidCollectionNameError(name)
+        return name
+
+    def index_path(self, name: str) -> str:
+        return os.path.join(self.root, name, "index.faiss")
+
+    def exists(self, name: str) -> bool:
+        """
+        Indica si la colección existe (cargada o en disco).
+        """
+        name = self.resolve_name(name)
+        if name == self.default_name or name in self._loaded:
+            return True
+        return os.path.isdir(os.path.join(self.root, name))
+
+    def loaded(self, name: str = None):
+        """
+        Servicio de la colección si ya está cargada (y la marca como usada), o None.
+        """
+        name = self.resolve_name(name)
+        if name == self.default_name:
+            return self.default
+        with self._lock:
+            service = self._loaded.get(name)
+            if service is not None:
+                self._loaded.move_to_end(name)
+            return service
+
+    def get(self, name: str = None, create: bool = False):
+        """
+        Servicio de consultas de una colección, cargándola si no lo está (bloqueante: lee el corpus de disco).
+
+        :param name: Nombre de la colección (por defecto, la colección por defecto).
+        :param create: Crear la colección si no existe (subida de documentos).
+        :raises InvalidCollectionNameError: Si el nombre no es válido.
+        :raises CollectionNotFoundError: Si la colección no existe y no se pide crearla.
+        """
+        service = self.loaded(name)
+        if service is not None:
+            return service
+        name = self.resolve_name(name)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Una sola carga por colección; las peticiones simultáneas esperan a que termine
+        with load_lock:
+            service = self.loaded(name)
+            if service is not None:
+                return service
+            if not create and not self.exists(name):
+                raise CollectionNotFoundError(name)
+            logger.info(f"Cargando la colección '{name}'.")
+            service = self.factory(self.index_path(name))
+            with self._lock:
+                self._loaded[name] = service
+                self.loads += 1
+                evicted = self._evict()
+        self._close(evicted)
+        return service
+
+    @contextlib.contextmanager
+    def pinned(self, name: str = None, create: bool = False):
+        """
+        Servicio de una colección que no se descarga mientras dura el bloque (`with`), para las escrituras
+        (ingestas y borrados): una colección descargada se cierra y ya no admite modificaciones. Si al terminar se
+        superan los límites, se descargan las que sobran.
+
+        :param name: Nombre de la colección (por defecto, la colección por defecto).
+        :param create: Crear la colección si no existe.
+        :raises InvalidCollectionNameError: Si el nombre no es válido.
+        :raises CollectionNotFoundError: Si la colección no existe y no se pide crearla.
+        """
+        name = self.resolve_name(name)
+        # Se fija antes de cargarla, para que no la descargue otra carga simultánea
+        with self._lock:
+            self._pins[name] = self._pins.get(name, 0) + 1
+        try:
+            yield self.get(name, create)
+        finally:
+            with self._lock:
+                self._pins[name] -= 1
+                if not self._pins[name]:
+                    del self._pins[name]
+                evicted = self._evict()
+            self._close(evicted)
+
+    async def aget(self, name: str = None, create: bool = False):
+        """
+        Versión asíncrona de `get`: si la colección no está cargada, se carga en el pool de E/S.
+        """
+        service = self.loaded(name)
+        if service is not None:
+            return service
+        return await io_pool.run(self.get, name, create)
+
+    def _evict(self) -> list:
+        """
+        Quita de la lista de cargadas las colecciones usadas hace más tiempo mientras se superen los límites
+        (nunca la recién cargada ni las que se están modificando). Se llama con `_lock` tomado.
+        """
+        evicted = []
+        candidates = [
+            name for name in list(self._loaded)[:-1]
+            if name not in self._pins and not self._loaded[name].store.writing
+        ]
+        while candidates and self._over_limits():
+            name = candidates.pop(0)
+            evicted.append((name, self._loaded.pop(name)))
+            self.evictions += 1
+        return evicted
+
+    @staticmethod
+    def _close(evicted: list):
+        for name, service in evicted:
+            service.close()
+            logger.info(f"Colección '{name}' descargada de memoria.")
+
+    def _over_limits(self) -> bool:
+        if len(self._loaded) > self.max_loaded:
+            return True
+        return bool(self.max_memory) and self._memory_bytes() > self.max_memory
+
+    def _memory_bytes(self) -> int:
+        services = [self.default, *self._loaded.values()]
+        return sum(service.store.memory_bytes() for service in services)
+
+    def list(self) -> List[dict]:
+        """
+        Colecciones existentes (en disco o cargadas), indicando si están cargadas y, si lo están, su tamaño.
+        """
+        names = {self.default_name}
+        if os.path.isdir(self.root):
+            names.update(
+                entry for entry in os.listdir(self.root)
+                if os.path.isdir(os.path.join(self.root, entry)) and COLLECTION_NAME.match(entry)
+            )
+        with self._lock:
+            loaded = {self.default_name: self.default, **self._loaded}
+        names.update(loaded)
+
+        collections = []
+        for name in sorted(names):
+            service = loaded.get(name)
+            collection = {"name": name, "default": name == self.default_name, "loaded": service is not None}
+            if service is not None:
+                collection.update(documents=len(service.store.documents), fragments=len(service.store))
+            collections.append(collection)
+        return collections
+
+    def stats(self) -> dict:
+        with self._lock:
+            loaded = list(self._loaded)
+            memory_mb = self._memory_bytes() / (1024 * 1024)
+        return {
+            "loaded": loaded,
+            "max_loaded": self.max_loaded,
+            "memory_mb": round(memory_mb, 1),
+            "max_memory_mb": self.max_memory / (1024 * 1024) or None,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
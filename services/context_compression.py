@@ -0,0 +1,195 @@
+from typing import List, Optional, Tuple
+import numpy as np
+from app.config import Config
+from app.services.chunking import split_sentences
+from app.utils.logger import get_logger
+from app.utils.tracing import span
+
+logger = get_logger(__name__)
+
+# Fragmento seleccionado: posición entre los candidatos y texto (completo o solo sus frases relevantes)
+Selection = Tuple[int, str]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def mmr_select(embeddings: np.ndarray, relevance: np.ndarray, k: int, diversity_lambda: float = 0.7,
+               duplicate_similarity: float = 1.0) -> List[int]:
+    """
+    Selección por máxima relevancia marginal (MMR): en cada paso se elige el candidato con mayor
+    `lambda · relevancia - (1 - lambda) · similitud máxima con los ya elegidos`.
+
+    Los candidatos con similitud coseno `>= duplicate_similarity` con uno elegido se descartan directamente.
+
+    :param embeddings: Embeddings normalizados de los candidatos (una fila por candidato).
+    :param relevance: Relevancia de cada candidato para la pregunta (en [0, 1]).
+    :param k: Número máximo de candidatos a elegir.
+    :param diversity_lambda: Peso de la relevancia frente a la diversidad.
+    :param duplicate_similarity: Similitud a partir de la cual un candidato se considera duplicado.
+    :return: Posiciones de los candidatos elegidos, en orden de selección.
+    """
+    similarity = embeddings @ embeddings.T
+    redundancy = np.zeros(len(relevance), dtype=np.float32)
+    available = np.ones(len(relevance), dtype=bool)
+    selected = []
+    while len(selected) < k and available.any():
+        scores = np.where(available, diversity_lambda * relevance - (1 - diversity_lambda) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+        available &= similarity[best] < duplicate_similarity
+    return selected
+
+
+class ContextCompressor:
+    def __init__(self, embedding_model, reranker=None, max_fragments: int = None, min_score: float = None,
+                 diversity_lambda: float = None, duplicate_similarity: float = None,
+                 sentence_extraction: bool = None, sentence_min_similarity: float = None):
+        """
+        Etapa posterior a la recuperación que reduce el contexto del prompt: menos fragmentos, sin repeticiones
+        y, opcionalmente, solo las frases que tienen que ver con la pregunta.
+
+        1. Re-ordena los candidatos con un cross-encoder (pregunta y fragmento juntos), en una sola pasada por lote.
+        2. Elige como mucho `max_fragments` con MMR sobre los embeddings de los candidatos, descartando los casi
+           duplicados.
+        3. Con `sentence_extraction`, deja de cada fragmento las frases cuya similitud con la pregunta llega a
+           `sentence_min_similarity` (y siempre la más parecida).
+
+        Trabaja con el texto original de los fragmentos (en inglés), antes de traducirlos.
+
+        :param embedding_model: Modelo de embeddings (con `encode`).
+        :param reranker: Cross-encoder (con `predict`); sin él, la relevancia es la similitud coseno.
+        :param max_fragments: Fragmentos como máximo (por defecto, `Config.CONTEXT_MAX_FRAGMENTS`).
+        :param min_score: Puntuación mínima del cross-encoder (por defecto, `Config.RERANK_MIN_SCORE`).
+        :param diversity_lambda: Peso de la relevancia en MMR (por defecto, `Config.MMR_LAMBDA`).
+        :param duplicate_similarity: Similitud de duplicado (por defecto, `Config.MMR_DUPLICATE_SIMILARITY`).
+        :param sentence_extraction: Extraer frases (por defecto, `Config.SENTENCE_EXTRACTION`).
+        :param sentence_min_similarity: Similitud mínima de una frase (por defecto, `Config.SENTENCE_MIN_SIMILARITY`).
+        """
+        self.embedding_model = embedding_model
+        self.reranker = reranker
+        self.max_fragments = max_fragments or Config.CONTEXT_MAX_FRAGMENTS
+        self.min_score = min_score if min_score is not None else Config.RERANK_MIN_SCORE
+        self.diversity_lambda = diversity_lambda if diversity_lambda is not None else Config.MMR_LAMBDA
+        self.duplicate_similarity = (
+            duplicate_similarity if duplicate_similarity is not None else Config.MMR_DUPLICATE_SIMILARITY
+        )
+        self.sentence_extraction = (
+            sentence_extraction if sentence_extraction is not None else Config.SENTENCE_EXTRACTION
+        )
+        self.sentence_min_similarity = (
+            sentence_min_similarity if sentence_min_similarity is not None else Config.SENTENCE_MIN_SIMILARITY
+        )
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return _normalize(np.array(self.embedding_model.encode(texts), dtype=np.float32))
+
+    def _rerank_scores(self, questions: List[str], candidates: List[List[str]]) -> Optional[List[np.ndarray]]:
+        """
+        Puntuaciones del cross-encoder para todos los pares (pregunta, candidato) del lote, en una sola llamada.
+        Devuelve None si no hay cross-encoder o falla; si falla (p. ej. no se puede cargar el modelo), se desactiva
+        para las siguientes consultas y se sigue con la similitud coseno.
+        """
+        if self.reranker is None:
+            return None
+        pairs = [(question, text) for question, texts in zip(questions, candidates) for text in texts]
+        if not pairs:
+            return None
+        try:
+            with span("rerank"):
+                scores = np.asarray(self.reranker.predict(pairs, batch_size=Config.RERANK_BATCH_SIZE), dtype=np.float32)
+        except Exception as e:
+            logger.error(f"No se pudo re-ordenar con el cross-encoder: {e}. Se desactiva y se usa la similitud coseno.")
+            self.reranker = None
+            return None
+        bounds = np.cumsum([len(texts) for texts in candidates])[:-1]
+        return np.split(scores, bounds)
+
+    def compress(self, question: str, candidates: List[str]) -> List[Selection]:
+        """
+        Versión de `compress_batch` para una sola pregunta.
+        """
+        return self.compress_batch([question], [candidates])[0]
+
+    def compress_batch(self, questions: List[str], candidates: List[List[str]]) -> List[List[Selection]]:
+        """
+        Selecciona el contexto de varias preguntas: un solo `predict` del cross-encoder y un solo `encode` para
+        todos los candidatos del lote.
+
+        :param questions: Preguntas (en el idioma de los fragmentos).
+        :param candidates: Textos de los fragmentos recuperados para cada pregunta, en orden de recuperación.
+        :return: Para cada pregunta, (posición del candidato, texto) de los fragmentos elegidos, por relevancia.
+        """
+        scores = self._rerank_scores(questions, candidates)
+
+        with span("context_compression"):
+            embeddings = self._encode(list(questions) + [text for texts in candidates for text in texts])
+            question_embeddings, offset = embeddings[:len(questions)], len(questions)
+
+            results = []
+            for row, texts in enumerate(candidates):
+                if not texts:
+                    results.append([])
+                    continue
+                candidate_embeddings = embeddings[offset:offset + len(texts)]
+                offset += len(texts)
+
+                keep = np.arange(len(texts))
+                if scores is not None:
+                    # Logits del cross-encoder a [0, 1] para combinarlos con la similitud coseno en MMR
+                    relevance = 1 / (1 + np.exp(-scores[row]))
+                    above = np.flatnonzero(scores[row] >= self.min_score)
+                    # Siempre queda al menos el mejor candidato
+                    keep = above if len(above) else np.array([int(np.argmax(scores[row]))])
+                else:
+                    relevance = candidate_embeddings @ question_embeddings[row]
+
+                chosen = mmr_select(
+                    candidate_embeddings[keep], relevance[keep], self.max_fragments,
+                    self.diversity_lambda, self.duplicate_similarity,
+                )
+                results.append([(int(keep[position]), texts[keep[position]]) for position in chosen])
+
+            if self.sentence_extraction:
+                results = self._extract_sentences(question_embeddings, results)
+
+        logger.debug(
+            "Contexto comprimido: %d candidatos -> %d fragmentos.",
+            sum(len(texts) for texts in candidates), sum(len(selection) for selection in results),
+        )
+        return results
+
+    def _extract_sentences(self, question_embeddings: np.ndarray,
+                           results: List[List[Selection]]) -> List[List[Selection]]:
+        """
+        Reduce cada fragmento elegido a sus frases relevantes (en su orden original), con un solo `encode` para
+        todas las frases del lote.
+        """
+        sentences = [[split_sentences(text) for _, text in selection] for selection in results]
+        flat = [sentence for fragments in sentences for fragment in fragments for sentence in fragment]
+        if not flat:
+            return results
+        embeddings = self._encode(flat)
+
+        offset, extracted = 0, []
+        for row, selection in enumerate(results):
+            compressed = []
+            for (position, text), fragment in zip(selection, sentences[row]):
+                if len(fragment) <= 1:
+                    compressed.append((position, text))
+                    offset += len(fragment)
+                    continue
+                similarity = embeddings[offset:offset + len(fragment)] @ question_embeddings[row]
+                offset += len(fragment)
+                keep = similarity >= self.sentence_min_similarity
+                keep[int(np.argmax(similarity))] = True
+                if keep.all():
+                    compressed.append((position, text))
+                else:
+                    compressed.append((position, " ".join(s for s, kept in zip(fragment, keep) if kept)))
+            extracted.append(compressed)
+        return extracted
@@ -0,0 +1,947 @@
+import glob
+import os
+import json
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import faiss
+from app.config import Config
+from app.services.fragment_store import FragmentStore
+from app.services.lexical_index import BM25Index
+from app.services.vector_store import VectorStore
+from app.services.write_ahead_log import WriteAheadLog
+from app.utils.file_lock import FileLock
+from app.services.index_factory import (
+    create_index, apply_search_defaults, unwrap, factory_string, is_lossy, train_threshold, train_index,
+    search_parameters,
+)
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class SearchFilter:
+    def __init__(self, doc_ids: List[str] = None, page_from: int = None, page_to: int = None):
+        """
+        Filtro de metadatos de una búsqueda: solo los fragmentos de esos documentos y/o que se solapan con ese
+        rango de páginas (ambos extremos incluidos).
+
+        :param doc_ids: IDs de los documentos admitidos (None = todos).
+        :param page_from: Primera página admitida (desde 1).
+        :param page_to: Última página admitida.
+        """
+        self.doc_ids = sorted(set(doc_ids)) if doc_ids else None
+        self.page_from = page_from
+        self.page_to = page_to
+
+    def __bool__(self) -> bool:
+        return self.doc_ids is not None or self.page_from is not None or self.page_to is not None
+
+    def key(self) -> tuple:
+        """
+        Clave hashable del filtro (para agrupar o deduplicar consultas con el mismo filtro).
+        """
+        return tuple(self.doc_ids or ()), self.page_from, self.page_to
+
+    def to_dict(self) -> dict:
+        return {"doc_ids": self.doc_ids, "page_from": self.page_from, "page_to": self.page_to}
+
+
+class CorpusStore:
+    def __init__(self, index_path: str, dimension: int = Config.EMBEDDING_DIMENSION):
+        """
+        Almacén persistente del corpus: índice FAISS con IDs propios y fragmentos con metadatos en disco.
+
+        Cada documento tiene un ID y sus fragmentos se añaden de forma incremental detrás de un
+        `faiss.IndexIDMap`, de modo que se pueden añadir, reemplazar o eliminar documento a documento.
+
+        Junto al índice FAISS se mantiene un índice léxico BM25 de los mismos fragmentos. Si el índice es
+        cuantizado (SQ/PQ) y `Config.EXACT_RERANK_FACTOR` > 0, se guardan además los vectores exactos
+        (`VectorStore`) para re-ordenar los candidatos de cada búsqueda con la distancia exacta.
+
+        Con `Config.INDEX_MMAP` los vectores y el texto de los fragmentos se mapean en memoria en lugar de
+        copiarse, de modo que varios workers comparten una única copia en la caché de páginas. El índice se
+        carga por completo en RAM la primera vez que se modifica.
+
+        Las modificaciones no reescriben el índice: cada operación se añade a un log de escritura (`<base>.wal`) y
+        `save` la confirma con un solo fsync, así que guardar cuesta lo que el lote y no lo que el corpus. Un hilo en
+        segundo plano guarda una instantánea completa (archivos temporales + rename) cada
+        `Config.INDEX_SNAPSHOT_INTERVAL` segundos o cuando el log supera `Config.WAL_SNAPSHOT_MB`, y vacía el log.
+        Al cargar, se reaplican sobre la última instantánea las transacciones confirmadas del log; una escritura
+        interrumpida solo pierde la transacción que no llegó a confirmarse.
+
+        Varios procesos pueden usar el mismo índice: las modificaciones se serializan con un bloqueo de escritura
+        entre procesos (`writer`), cada guardado incrementa el número de versión de `<base>.version` y los demás
+        procesos se ponen al día reaplicando el log (`refresh`, cada `Config.INDEX_RELOAD_INTERVAL` segundos).
+
+        :param index_path: Ruta al índice FAISS. Los fragmentos se guardan junto a él.
+        :param dimension: Dimensión de los embeddings.
+        """
+        self.index_path = index_path
+        self.dimension = dimension
+        self.base_path = os.path.splitext(index_path)[0]
+        self.metadata_path = self.base_path + ".documents.json"
+        self.legacy_metadata_path = self.base_path + ".fragments.json"
+        self.lexical_path = self.base_path + ".bm25.json"
+        self.version_path = self.base_path + ".version"
+        self.index = None
+        self.fragment_store: FragmentStore = None
+        self.lexical: BM25Index = None
+        self.vector_store: VectorStore = None
+        self.documents: Dict[str, dict] = {}
+        self.next_id = 0
+        self.mmapped = False
+        self.version = 0  # Se incrementa en cada cambio del corpus (invalida cachés derivadas)
+        self.disk_version = 0  # Versión de disco que refleja el corpus en memoria
+        self.snapshot_version = 0  # Instantánea de disco sobre la que se ha construido el corpus en memoria
+        self.reloads = 0
+        self.snapshots = 0
+        self.wal = WriteAheadLog(self.base_path + ".wal", dimension)
+        self._lock = threading.RLock()
+        # Escritura: un único hilo del proceso (`_write_lock`) y un único proceso (`_writer_file_lock`) a la vez.
+        # Guardado/lectura de una versión completa de los archivos: `_snapshot_lock` (exclusivo/compartido).
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._writer_file_lock = FileLock(self.base_path + ".write.lock")
+        self._snapshot_lock = FileLock(self.base_path + ".snapshot.lock")
+        # Búsquedas en curso: usan el índice sin `_lock`, así que no se modifica en sitio hasta que terminan
+        self._searching = 0
+        self._searches_done = threading.Condition()
+        # Páginas de cada fragmento para los filtros por rango de páginas: (versión, ids, página inicial, final)
+        self._page_table = None
+        self._closed = threading.Event()
+        self._snapshot_requested = threading.Event()
+        self._unsaved_index = False  # Índice re-entrenado que aún no está en ninguna instantánea
+        self.load()
+
+        if Config.INDEX_RELOAD_INTERVAL > 0:
+            threading.Thread(
+                target=self._watch, args=(Config.INDEX_RELOAD_INTERVAL,), name="corpus-watcher", daemon=True
+            ).start()
+        threading.Thread(
+            target=self._snapshot_loop, args=(Config.INDEX_SNAPSHOT_INTERVAL,), name="corpus-snapshots", daemon=True
+        ).start()
+
+    def _create_new_index(self) -> faiss.Index:
+        """
+        Crea un índice FAISS vacío con soporte de IDs.
+
+        Si el tipo de índice configurado necesita entrenamiento, se empieza con un índice exacto (Flat)
+        que se migra automáticamente cuando hay suficientes vectores.
+        """
+        if train_threshold() > 0:
+            return faiss.IndexIDMap(faiss.IndexFlatL2(self.dimension))
+        return faiss.IndexIDMap(create_index(self.dimension))
+
+    def _pending_training(self) -> bool:
+        """
+        Indica si el índice actual es el Flat provisional y el configurado es otro.
+        """
+        return isinstance(unwrap(self.index), faiss.IndexFlat) and factory_string() != "Flat"
+
+    def _maybe_train(self):
+        """
+        Migra del índice Flat provisional al tipo configurado cuando hay suficientes vectores para entrenarlo.
+        """
+        if not self._pending_training() or self.index.ntotal == 0 or self.index.ntotal < train_threshold():
+            return
+        self._ensure_writable()
+        logger.info(f"Entrenando índice '{factory_string()}' con {self.index.ntotal} vectores.")
+        ids = faiss.vector_to_array(self.index.id_map).astype(np.int64)
+        vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+        if self.keeps_exact_vectors:
+            # El índice provisional es exacto: sus vectores completan los que falten (corpus creados sin re-ordenar)
+            missing = ~self.vector_store.get(ids)[0]
+            self.vector_store.append(ids[missing].tolist(), vectors[missing])
+        base = create_index(self.dimension)
+        if not base.is_trained:
+            train_index(base, vectors)
+        index = faiss.IndexIDMap(base)
+        index.add_with_ids(vectors, ids)
+        self.index = index
+        self.mmapped = False
+        # El índice entrenado se guarda en la siguiente instantánea (en segundo plano)
+        self._unsaved_index = True
+        self._snapshot_requested.set()
+        logger.info(f"Índice migrado a '{factory_string()}'.")
+
+    def _read_index(self, mmap: bool = True) -> Tuple[faiss.Index, bool]:
+        """
+        Lee el índice de disco, mapeándolo en memoria si `Config.INDEX_MMAP` está activo.
+
+        :param mmap: False para cargarlo en RAM aunque `Config.INDEX_MMAP` esté activo (se va a modificar).
+        :return: El índice y si está mapeado en memoria.
+        """
+        if Config.INDEX_MMAP and mmap:
+            # IO_FLAG_MMAP cubre las listas invertidas (IVF); IO_FLAG_MMAP_IFC, en versiones recientes de FAISS,
+            # también los vectores de índices Flat/HNSW. Se prueba primero la combinación más completa.
+            mmap_flags = [faiss.IO_FLAG_MMAP]
+            if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+                mmap_flags.insert(0, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_MMAP_IFC)
+            for flags in mmap_flags:
+                try:
+                    return faiss.read_index(self.index_path, flags | faiss.IO_FLAG_READ_ONLY), True
+                except RuntimeError as e:
+                    logger.debug(f"No se pudo mapear el índice con flags {flags:#x}: {e}")
+            logger.warning("No se pudo mapear el índice en memoria, se carga completo.")
+        return faiss.read_index(self.index_path), False
+
+    def _ensure_writable(self):
+        """
+        Prepara el índice servido para modificarlo en sitio (se llama con `_lock` tomado): sustituye el índice mapeado
+        (de solo lectura) por una copia en RAM o, si ya está en RAM, espera a que terminen las búsquedas en curso
+        sobre él. Con `_lock` tomado no empieza ninguna búsqueda nueva.
+        """
+        if self.mmapped:
+            logger.debug("Cargando el índice en memoria para modificarlo.")
+            self.index = faiss.read_index(self.index_path)
+            apply_search_defaults(self.index)
+            self.mmapped = False
+            return
+        with self._searches_done:
+            self._searches_done.wait_for(lambda: not self._searching)
+
+    def _read_version(self) -> Tuple[int, int]:
+        """
+        :return: Versión publicada en disco y número de la instantánea sobre la que se construye.
+        """
+        try:
+            with open(self.version_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return int(data["version"]), int(data.get("snapshot", 0))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return 0, 0
+
+    def load(self):
+        """
+        Carga el índice y los fragmentos desde disco, o crea un corpus vacío si no existen.
+        """
+        with self._snapshot_lock.shared():
+            snapshot = self._read_snapshot()
+        self._apply(snapshot)
+        if not os.path.exists(self.metadata_path) and os.path.exists(self.legacy_metadata_path):
+            with self.writer():
+                self._migrate_legacy_metadata()
+        with self._lock:
+            self._maybe_train()
+
+    def _read_snapshot(self) -> dict:
+        """
+        Lee de disco una versión completa del corpus sin tocar la que se está sirviendo: la última instantánea y,
+        encima, las transacciones confirmadas del log posteriores a ella.
+        """
+        disk_version, snapshot_version = self._read_version()
+        documents, next_id, wal_seq = {}, 0, 0
+        if os.path.exists(self.metadata_path):
+            try:
+                with open(self.metadata_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                documents = data.get("documents", {})
+                next_id = int(data.get("next_id", 0))
+                wal_seq = int(data.get("wal_seq", 0))
+            except Exception as e:
+                logger.error(f"No se pudieron cargar los documentos desde {self.metadata_path}: {e}")
+        transactions, wal_size, wal_seq = self.wal.read(wal_seq)
+
+        index, mmapped = None, False
+        if os.path.exists(self.index_path):
+            try:
+                # Si hay transacciones que reaplicar, el índice se carga en RAM para modificarlo
+                index, mmapped = self._read_index(mmap=not transactions)
+                if isinstance(index, faiss.IndexIDMap):
+                    logger.debug(f"Índice cargado desde {self.index_path} con {index.ntotal} vectores.")
+                else:
+                    # Índices antiguos sin IDs: sus fragmentos nunca se persistieron, no se pueden recuperar.
+                    logger.warning(f"El índice en {self.index_path} no tiene IDs ({index.ntotal} vectores). Se descarta.")
+                    index, mmapped = None, False
+            except Exception as e:
+                logger.error(
+                    f"No se pudo cargar el índice desde {self.index_path}: {e}. "
+                    "Los vectores que falten se recalcularán a partir de los fragmentos guardados."
+                )
+                index, mmapped = None, False
+        if index is None:
+            index = self._create_new_index()
+        apply_search_defaults(index)
+
+        lexical = BM25Index(self.lexical_path, Config.BM25_K1, Config.BM25_B)
+        lexical_loaded = lexical.load()
+        state = SimpleNamespace(
+            index=index, fragment_store=FragmentStore(self.base_path), lexical=lexical,
+            vector_store=VectorStore(self.base_path, self.dimension), documents=documents, next_id=next_id,
+        )
+        replayed, lexical_stale = self._replay(state, transactions)
+        if replayed:
+            logger.info(f"Reaplicadas {replayed} operaciones de {len(transactions)} transacciones del log de escritura.")
+        logger.debug(f"{len(state.fragment_store)} fragmentos de {len(state.documents)} documentos cargados.")
+        if len(state.fragment_store):
+            state.next_id = max(state.next_id, int(state.fragment_store.ids()[-1]) + 1)
+        if not lexical_loaded or lexical_stale or len(state.lexical) != len(state.fragment_store):
+            state.lexical = self._build_lexical(state.fragment_store)
+
+        return {
+            **vars(state), "mmapped": mmapped, "disk_version": disk_version, "snapshot_version": snapshot_version,
+            "wal_size": wal_size, "wal_seq": wal_seq,
+        }
+
+    def _replay(self, state, transactions: list) -> Tuple[int, bool]:
+        """
+        Reaplica operaciones del log sobre un corpus (`state`: el servido o uno recién leído de disco).
+
+        Una instantánea interrumpida puede haber guardado unos archivos y otros no, así que cada operación se
+        aplica solo a lo que aún no la refleja: los IDs ya presentes no se vuelven a añadir y los que se eliminan más
+        adelante en el log ni se añaden (sus registros pueden no existir ya tras compactar).
+
+        :return: Número de operaciones reaplicadas y si el índice léxico ha quedado desincronizado (hay que
+                 reconstruirlo).
+        """
+        operations = [entry for transaction in transactions for entry in transaction]
+        if not operations:
+            return 0, False
+        removed = {fid for operation, _ in operations if operation["op"] == "remove" for fid in operation["ids"]}
+        indexed = set(faiss.vector_to_array(state.index.id_map).tolist())
+        lexical_stale = False
+        for operation, vectors in operations:
+            kind = operation["op"]
+            if kind in ("append", "vectors"):
+                ids = np.asarray(operation["ids"], dtype=np.int64)
+                keep = np.array([fid not in removed for fid in ids.tolist()], dtype=bool)
+                missing = keep & np.array([fid not in indexed for fid in ids.tolist()], dtype=bool)
+                if missing.any():
+                    state.index.add_with_ids(np.ascontiguousarray(vectors[missing]), ids[missing])
+                    indexed.update(ids[missing].tolist())
+                if operation.get("vector_rows"):
+                    vector_rows = np.asarray(operation["vector_rows"], dtype=np.int64)
+                    state.vector_store.add_rows(vector_rows[keep])
+                ids = ids[keep].tolist()
+            if kind == "append":
+                state.fragment_store.add_rows(np.asarray(operation["fragment_rows"], dtype=np.int64)[keep])
+                state.lexical.add(ids, [state.fragment_store.get_text(fid) for fid in ids])
+                document = state.documents.setdefault(operation["doc_id"], {"fragment_ids": [], "metadata": {}})
+                known = set(document["fragment_ids"])
+                document["fragment_ids"].extend(fid for fid in ids if fid not in known)
+                state.next_id = max(state.next_id, operation["next_id"])
+            elif kind == "remove":
+                ids = operation["ids"]
+                present = [fid for fid in ids if fid in indexed]
+                if present:
+                    state.index, _ = self._remove_vectors(state.index, present)
+                    indexed.difference_update(present)
+                texts = [state.fragment_store.get_text(fid) for fid in ids]
+                # Sin su texto no se pueden quitar sus términos del índice léxico
+                lexical_stale |= any(text is None and fid in state.lexical.lengths for fid, text in zip(ids, texts))
+                state.lexical.remove(ids, texts)
+                state.fragment_store.remove(ids)
+                state.vector_store.remove(ids)
+            elif kind == "document":
+                if operation["document"] is None:
+                    state.documents.pop(operation["doc_id"], None)
+                else:
+                    state.documents[operation["doc_id"]] = operation["document"]
+        return len(operations), lexical_stale
+
+    def _apply(self, snapshot: dict):
+        """
+        Sustituye de una vez el corpus servido por una versión leída de disco.
+        """
+        with self._lock:
+            self.index = snapshot["index"]
+            self.mmapped = snapshot["mmapped"]
+            self.fragment_store = snapshot["fragment_store"]
+            self.lexical = snapshot["lexical"]
+            self.vector_store = snapshot["vector_store"]
+            self.documents = snapshot["documents"]
+            self.next_id = snapshot["next_id"]
+            self.disk_version = snapshot["disk_version"]
+            self.snapshot_version = snapshot["snapshot_version"]
+            self.wal.committed_size, self.wal.seq = snapshot["wal_size"], snapshot["wal_seq"]
+            self.version += 1
+
+    def _build_lexical(self, fragment_store: FragmentStore) -> BM25Index:
+        """
+        Reconstruye el índice léxico a partir de los fragmentos guardados (primer arranque o índice desincronizado).
+        """
+        lexical = BM25Index(self.lexical_path, Config.BM25_K1, Config.BM25_B)
+        if not len(fragment_store):
+            return lexical
+        logger.info(f"Construyendo el índice léxico de {len(fragment_store)} fragmentos.")
+        fragment_ids = fragment_store.ids().tolist()
+        lexical.add(fragment_ids, (fragment_store.get_text(fid) for fid in fragment_ids))
+        # Se guarda solo si ningún otro proceso está escribiendo (si lo está, lo guardará él)
+        if self._writer_file_lock.acquire(blocking=False):
+            try:
+                os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+                lexical.save()
+            finally:
+                self._writer_file_lock.release()
+        return lexical
+
+    def _reload(self):
+        with self._snapshot_lock.shared():
+            snapshot = self._read_snapshot()
+        self._apply(snapshot)
+        self.reloads += 1
+        logger.info(f"Recargada la versión {self.disk_version} del índice ({len(self.fragment_store)} fragmentos).")
+
+    def _catch_up(self) -> bool:
+        """
+        Se pone al día con la versión publicada en disco: reaplica las transacciones que otros procesos han
+        confirmado en el log desde la última aplicada aquí o, si entretanto se ha guardado una instantánea, la
+        recarga entera.
+
+        :return: True si había una versión nueva.
+        """
+        if self._read_version()[0] == self.disk_version:
+            return False
+        with self._snapshot_lock.shared():
+            disk_version, snapshot_version = self._read_version()
+            if snapshot_version == self.snapshot_version:
+                transactions, wal_size, wal_seq = self.wal.read(self.wal.seq, self.wal.committed_size)
+                with self._lock:
+                    if transactions:
+                        self._ensure_writable()
+                    replayed, lexical_stale = self._replay(self, transactions)
+                    if lexical_stale:
+                        self.lexical = self._build_lexical(self.fragment_store)
+                    self.wal.committed_size, self.wal.seq = wal_size, wal_seq
+                    self.disk_version = disk_version
+                    self.version += 1
+                logger.debug(f"Aplicadas {replayed} operaciones de la versión {disk_version} del índice.")
+                return True
+        self._reload()
+        return True
+
+    def refresh(self) -> bool:
+        """
+        Se pone al día si otro proceso ha guardado una versión más reciente en disco (ver `_catch_up`).
+
+        Las transacciones nuevas del log se aplican bajo el bloqueo del corpus y una instantánea nueva se lee aparte
+        y se sustituye de una vez, así que las búsquedas en curso terminan con la versión anterior. No hace nada
+        mientras este proceso está modificando el corpus.
+
+        :return: True si se ha actualizado.
+        """
+        if self._read_version()[0] == self.disk_version:
+            return False
+        if not self._write_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._catch_up()
+        finally:
+            self._write_lock.release()
+
+    def _watch(self, interval: float):
+        while not self._closed.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"No se pudo recargar el índice: {e}")
+
+    def _snapshot_loop(self, interval: float):
+        while True:
+            self._snapshot_requested.wait(interval or None)
+            if self._closed.is_set():
+                return
+            self._snapshot_requested.clear()
+            try:
+                self.snapshot()
+            except Exception as e:
+                logger.error(f"No se pudo guardar la instantánea del índice: {e}")
+
+    def close(self):
+        """
+        Detiene la recarga y las instantáneas periódicas. El corpus sigue sirviendo a quien aún lo use y se libera
+        al dejar de referenciarlo (colecciones descargadas de memoria); lo confirmado ya está en el log.
+        """
+        self._closed.set()
+        self._snapshot_requested.set()
+        self.wal.close()
+
+    @property
+    def writing(self) -> bool:
+        """
+        Indica si hay una modificación del corpus en curso en este proceso (p. ej. una ingesta).
+        """
+        return self._write_depth > 0
+
+    def memory_bytes(self) -> int:
+        """
+        Estimación del tamaño del corpus en memoria: lo que ocupan en disco sus archivos (índice, fragmentos,
+        índice léxico y vectores exactos), que es lo que se carga o se mapea al usarlo.
+        """
+        total = 0
+        for path in glob.glob(glob.escape(self.base_path) + ".*"):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    @contextmanager
+    def writer(self):
+        """
+        Bloqueo de escritura del corpus, compartido por todos los procesos que usan el mismo índice.
+
+        Al tomarlo se aplica la versión de disco si otro proceso la ha cambiado, de modo que nunca se modifica una
+        copia desactualizada, y se descartan los registros sin confirmar que un proceso interrumpido haya dejado al
+        final del log. Las operaciones que modifican el corpus lo toman por sí mismas; una ingesta lo mantiene hasta
+        persistir el documento. Al soltarlo se confirma lo que haya quedado pendiente en el log.
+        """
+        with self._write_lock, self._writer_file_lock.exclusive():
+            if self._write_depth == 0:
+                self._catch_up()
+                self.wal.discard_uncommitted()
+            self._write_depth += 1
+            try:
+                yield self
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0 and self.wal.pending:
+                    self.save()
+
+    def _migrate_legacy_metadata(self):
+        """
+        Convierte el formato anterior (un JSON con el texto de todos los fragmentos) al blob mapeado en memoria.
+        """
+        try:
+            with open(self.legacy_metadata_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            fragments = sorted((int(fid), fragment) for fid, fragment in data.get("fragments", {}).items())
+            self.fragment_store.append([fid for fid, _ in fragments], [fragment for _, fragment in fragments])
+            self.lexical.add([fid for fid, _ in fragments], [fragment["text"] for _, fragment in fragments])
+            self.documents = data.get("documents", {})
+            self.next_id = int(data.get("next_id", 0))
+            self._write_snapshot()
+            os.remove(self.legacy_metadata_path)
+            logger.info(f"{len(fragments)} fragmentos migrados al almacén mapeado en memoria.")
+        except Exception as e:
+            logger.error(f"No se pudieron migrar los fragmentos desde {self.legacy_metadata_path}: {e}")
+
+    def save(self):
+        """
+        Confirma las modificaciones pendientes: las operaciones añadidas al log desde el último guardado se
+        sincronizan con el disco de una vez (sin reescribir el índice) y se publica una nueva versión para los demás
+        procesos. Si el log supera `Config.WAL_SNAPSHOT_MB`, se pide una instantánea.
+        """
+        with self._write_lock, self._writer_file_lock.exclusive():
+            if not self.wal.pending:
+                return
+            if self.wal.fsync:
+                # Los registros y vectores que referencian las operaciones del log deben llegar antes al disco
+                self.fragment_store.sync()
+                self.vector_store.sync()
+            self.wal.commit()
+            self._publish_version()
+        if self.wal.size() > Config.WAL_SNAPSHOT_MB * 1024 * 1024:
+            self._snapshot_requested.set()
+
+    def _publish_version(self):
+        # La versión se escribe la última: quien la lea encuentra ya en disco todo lo que incluye
+        self.disk_version = max(self._read_version()[0], self.disk_version) + 1
+        tmp_version_path = self.version_path + ".tmp"
+        with open(tmp_version_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.disk_version, "snapshot": self.snapshot_version}, f)
+        os.replace(tmp_version_path, self.version_path)
+
+    def snapshot(self) -> bool:
+        """
+        Guarda una instantánea completa del corpus si el log tiene transacciones (o el índice se ha re-entrenado).
+        Lo llama periódicamente el hilo de instantáneas; las búsquedas siguen mientras se escribe.
+
+        :return: True si se ha guardado.
+        """
+        with self.writer():
+            if not self.wal.size() and not self._unsaved_index:
+                return False
+            self._write_snapshot()
+            return True
+
+    def _write_snapshot(self):
+        """
+        Guarda el índice, los vectores exactos, el índice léxico, los fragmentos y los documentos (cada archivo de
+        forma atómica: archivo temporal + rename) y vacía el log.
+
+        El archivo de documentos, con la última operación del log que incluye la instantánea, se escribe el último:
+        si se interrumpe antes, al cargar se reaplica el log entero sobre lo que se haya llegado a guardar. Al compactar,
+        los fragmentos y los vectores pasan a archivos de una generación nueva, que cada almacén publica con un
+        único rename; los de la anterior se borran al final.
+        """
+        with self._snapshot_lock.exclusive():
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+
+            tmp_index_path = self.index_path + ".tmp"
+            faiss.write_index(self.index, tmp_index_path)
+            os.replace(tmp_index_path, self.index_path)
+
+            self.vector_store.save()
+            self.lexical.save()
+            self.fragment_store.save()
+            if self.wal.fsync:
+                self._sync_files()
+
+            tmp_metadata_path = self.metadata_path + ".tmp"
+            with open(tmp_metadata_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"next_id": self.next_id, "wal_seq": self.wal.seq, "documents": self.documents}, f,
+                    ensure_ascii=False,
+                )
+                f.flush()
+                if self.wal.fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmp_metadata_path, self.metadata_path)
+            if self.wal.fsync:
+                self._sync_files([])
+
+            self.snapshot_version = max(self._read_version()[1], self.snapshot_version) + 1
+            self._publish_version()
+            self.wal.reset()
+            # Los archivos sustituidos al compactar ya no los referencia la versión publicada
+            self.fragment_store.remove_obsolete()
+            self.vector_store.remove_obsolete()
+            self._unsaved_index = False
+            self.snapshots += 1
+        logger.info(f"Instantánea del índice guardada ({len(self.fragment_store)} fragmentos); log vaciado.")
+
+    def _sync_files(self, paths: List[str] = None):
+        """
+        Fuerza la escritura en disco de los archivos de la instantánea (por defecto, todos los del corpus salvo el
+        log) y del directorio que los contiene (los renames).
+        """
+        if paths is None:
+            paths = [path for path in glob.glob(glob.escape(self.base_path) + ".*") if path != self.wal.path]
+        for path in paths + [os.path.dirname(self.index_path) or "."]:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    @property
+    def keeps_exact_vectors(self) -> bool:
+        """
+        Indica si se guardan los vectores exactos para re-ordenar los resultados del índice cuantizado.
+        """
+        return Config.EXACT_RERANK_FACTOR > 0 and is_lossy()
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    def __len__(self) -> int:
+        return len(self.fragment_store)
+
+    def fragment_ids(self) -> np.ndarray:
+        """
+        Devuelve los IDs de los fragmentos almacenados.
+        """
+        return self.fragment_store.ids()
+
+    def indexed_ids(self) -> np.ndarray:
+        """
+        Devuelve los IDs de los vectores presentes en el índice FAISS.
+        """
+        with self._lock:
+            return faiss.vector_to_array(self.index.id_map).astype(np.int64)
+
+    def get_text(self, fragment_id: int) -> Optional[str]:
+        return self.fragment_store.get_text(fragment_id)
+
+    def get_metadata(self, fragment_id: int) -> Optional[dict]:
+        return self.fragment_store.get(fragment_id)
+
+    def list_documents(self) -> List[dict]:
+        return [
+            {"doc_id": doc_id, "fragments": len(document["fragment_ids"]), **document.get("metadata", {})}
+            for doc_id, document in self.documents.items()
+        ]
+
+    def append_fragments(self, doc_id: str, embeddings: np.ndarray, fragments: List[str],
+                         fragment_metadata: List[dict] = None, save: bool = True) -> List[int]:
+        """
+        Añade fragmentos a un documento (creándolo si no existe) sin tocar el resto del corpus.
+
+        :param doc_id: ID del documento.
+        :param embeddings: Embeddings de los fragmentos.
+        :param fragments: Textos de los fragmentos.
+        :param fragment_metadata: Metadatos por fragmento (opcional).
+        :param save: Persistir el corpus tras la operación.
+        :return: IDs asignados a los fragmentos.
+        """
+        if embeddings is None or len(embeddings) == 0:
+            raise ValueError("[ERROR] Los embeddings están vacíos. No se pueden agregar al índice FAISS.")
+        if len(embeddings) != len(fragments):
+            raise ValueError("[ERROR] La cantidad de embeddings no coincide con la cantidad de fragmentos.")
+        fragment_metadata = fragment_metadata or [{} for _ in fragments]
+
+        with self.writer(), self._lock:
+            self._ensure_writable()
+            document = self.documents.setdefault(doc_id, {"fragment_ids": [], "metadata": {}})
+            ids = np.arange(self.next_id, self.next_id + len(fragments), dtype=np.int64)
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            self.index.add_with_ids(embeddings, ids)
+            vector_rows = None
+            if self.keeps_exact_vectors:
+                vector_rows = self.vector_store.append(ids.tolist(), embeddings).tolist()
+            position = len(document["fragment_ids"])
+            fragment_rows = self.fragment_store.append(ids.tolist(), [
+                {"text": text, "doc_id": doc_id, "position": position + offset, **extra}
+                for offset, (text, extra) in enumerate(zip(fragments, fragment_metadata))
+            ])
+            self.lexical.add(ids.tolist(), fragments)
+            document["fragment_ids"].extend(ids.tolist())
+            self.next_id += len(fragments)
+            # El texto ya está en el blob de fragmentos: el log guarda dónde, junto con los vectores
+            self.wal.append({
+                "op": "append", "doc_id": doc_id, "ids": ids.tolist(), "fragment_rows": fragment_rows.tolist(),
+                "vector_rows": vector_rows, "next_id": self.next_id,
+            }, embeddings)
+            self.version += 1
+            self._maybe_train()
+            if save:
+                self.save()
+            return ids.tolist()
+
+    def add_document(self, doc_id: str, embeddings: np.ndarray, fragments: List[str],
+                     metadata: dict = None, fragment_metadata: List[dict] = None) -> List[int]:
+        """
+        Añade un documento al corpus, reemplazando la versión anterior si ya existía.
+
+        :param doc_id: ID del documento.
+        :param embeddings: Embeddings de los fragmentos.
+        :param fragments: Textos de los fragmentos.
+        :param metadata: Metadatos del documento (nombre de archivo, etc.).
+        :param fragment_metadata: Metadatos por fragmento (opcional).
+        :return: IDs asignados a los fragmentos.
+        """
+        with self.writer(), self._lock:
+            if doc_id in self.documents:
+                logger.info(f"Reemplazando el documento '{doc_id}'.")
+                self.delete_document(doc_id, save=False)
+            ids = self.append_fragments(doc_id, embeddings, fragments, fragment_metadata, save=False)
+            self.documents[doc_id]["metadata"] = metadata or {}
+            self._log_document(doc_id)
+            self.save()
+            return ids
+
+    def delete_document(self, doc_id: str, save: bool = True) -> int:
+        """
+        Elimina un documento y todos sus fragmentos del corpus.
+
+        :param doc_id: ID del documento.
+        :param save: Persistir el corpus tras la operación.
+        :return: Número de fragmentos eliminados.
+        """
+        with self.writer(), self._lock:
+            document = self.documents.pop(doc_id, None)
+            if document is None:
+                return 0
+            self._log_document(doc_id)
+            removed = self.remove_ids(document["fragment_ids"])
+            if save:
+                self.save()
+            return removed
+
+    def remove_fragments(self, doc_id: str, fragment_ids: List[int], save: bool = True) -> int:
+        """
+        Elimina algunos fragmentos de un documento (el documento se elimina si se queda vacío).
+
+        :param doc_id: ID del documento.
+        :param fragment_ids: IDs de los fragmentos a eliminar.
+        :param save: Persistir el corpus tras la operación.
+        :return: Número de vectores eliminados.
+        """
+        with self.writer(), self._lock:
+            document = self.documents.get(doc_id)
+            if document is None or not fragment_ids:
+                return 0
+            dropped = set(fragment_ids)
+            document["fragment_ids"] = [fid for fid in document["fragment_ids"] if fid not in dropped]
+            if not document["fragment_ids"]:
+                del self.documents[doc_id]
+            self._log_document(doc_id)
+            removed = self.remove_ids(list(fragment_ids))
+            if save:
+                self.save()
+            return removed
+
+    def finalize_document(self, doc_id: str, metadata: dict = None, replaced_ids: List[int] = None):
+        """
+        Cierra la ingesta incremental de un documento: elimina los fragmentos de su versión anterior,
+        guarda sus metadatos y persiste el corpus.
+
+        :param doc_id: ID del documento.
+        :param metadata: Metadatos del documento.
+        :param replaced_ids: IDs de los fragmentos de la versión anterior.
+        """
+        with self.writer(), self._lock:
+            self.remove_fragments(doc_id, replaced_ids or [], save=False)
+            if doc_id in self.documents:
+                self.documents[doc_id]["metadata"] = metadata or {}
+                self._log_document(doc_id)
+            self.save()
+
+    def _log_document(self, doc_id: str):
+        """
+        Añade al log la entrada actual de un documento (None si se ha eliminado).
+        """
+        self.wal.append({"op": "document", "doc_id": doc_id, "document": self.documents.get(doc_id)})
+
+    def remove_ids(self, fragment_ids: List[int]) -> int:
+        """
+        Elimina vectores y fragmentos por ID (sin actualizar la lista de fragmentos del documento).
+        """
+        if not fragment_ids:
+            return 0
+        with self.writer(), self._lock:
+            self._ensure_writable()
+            self.index, removed = self._remove_vectors(self.index, fragment_ids)
+            self.lexical.remove(fragment_ids, [self.fragment_store.get_text(fid) for fid in fragment_ids])
+            self.fragment_store.remove(fragment_ids)
+            self.vector_store.remove(fragment_ids)
+            self.wal.append({"op": "remove", "ids": [int(fid) for fid in fragment_ids]})
+            self.version += 1
+            return removed
+
+    def _remove_vectors(self, index: faiss.Index, fragment_ids: List[int]) -> Tuple[faiss.Index, int]:
+        """
+        Elimina vectores de un índice (en RAM) por ID.
+
+        :return: El índice resultante y el número de vectores eliminados.
+        """
+        try:
+            return index, index.remove_ids(np.asarray(fragment_ids, dtype=np.int64))
+        except RuntimeError:
+            # Algunos índices (HNSW) no permiten eliminar vectores: se reconstruyen sin ellos.
+            return self._rebuild_without(index, fragment_ids)
+
+    def _rebuild_without(self, index: faiss.Index, fragment_ids: List[int]) -> Tuple[faiss.Index, int]:
+        """
+        Reconstruye el índice sin los IDs dados, para tipos de índice que no soportan `remove_ids`.
+        """
+        ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+        keep = ~np.isin(ids, np.asarray(fragment_ids, dtype=np.int64))
+        vectors = index.index.reconstruct_n(0, index.ntotal)[keep]
+        base = create_index(self.dimension)
+        if not base.is_trained:
+            base = faiss.clone_index(unwrap(index))
+            base.reset()
+        rebuilt = faiss.IndexIDMap(base)
+        if keep.any():
+            rebuilt.add_with_ids(vectors, ids[keep])
+        return rebuilt, int((~keep).sum())
+
+    def add_vectors(self, embeddings: np.ndarray, fragment_ids: List[int]):
+        """
+        Añade vectores para fragmentos que ya existen en el almacén (resincronización).
+        """
+        with self.writer(), self._lock:
+            self._ensure_writable()
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            self.index.add_with_ids(embeddings, np.asarray(fragment_ids, dtype=np.int64))
+            vector_rows = None
+            if self.keeps_exact_vectors:
+                vector_rows = self.vector_store.append(list(fragment_ids), embeddings).tolist()
+            self.wal.append(
+                {"op": "vectors", "ids": [int(fid) for fid in fragment_ids], "vector_rows": vector_rows}, embeddings
+            )
+            self.version += 1
+            self._maybe_train()
+
+    def filter_ids(self, search_filter: SearchFilter) -> np.ndarray:
+        """
+        IDs de los fragmentos que cumplen un filtro de metadatos, ordenados.
+
+        El filtro por documento usa la lista de fragmentos de cada documento; el de páginas, una tabla con la
+        página inicial y final de cada fragmento que se construye la primera vez que se necesita en cada versión
+        del corpus (los fragmentos sin página no pasan un filtro de páginas).
+        """
+        with self._lock:
+            if search_filter.doc_ids is not None:
+                ids = np.array(sorted(
+                    fid for doc_id in search_filter.doc_ids
+                    for fid in self.documents.get(doc_id, {}).get("fragment_ids", [])
+                ), dtype=np.int64)
+            else:
+                ids = self.fragment_ids().astype(np.int64)
+            if search_filter.page_from is None and search_filter.page_to is None:
+                return ids
+
+            table_ids, first_pages, last_pages = self._pages()
+            in_range = np.ones(len(table_ids), dtype=bool)
+            if search_filter.page_to is not None:
+                in_range &= first_pages <= search_filter.page_to
+            if search_filter.page_from is not None:
+                in_range &= last_pages >= search_filter.page_from
+            return np.intersect1d(ids, table_ids[in_range])
+
+    def _pages(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Tabla de páginas de los fragmentos de la versión actual del corpus (ver `filter_ids`).
+        """
+        if self._page_table is None or self._page_table[0] != self.version:
+            ids = self.fragment_ids().astype(np.int64)
+            first_pages = np.full(len(ids), -1, dtype=np.int64)
+            last_pages = np.full(len(ids), -2, dtype=np.int64)
+            for position, fragment_id in enumerate(ids.tolist()):
+                record = self.fragment_store.get(fragment_id) or {}
+                if record.get("page") is not None:
+                    first_pages[position] = record["page"]
+                    last_pages[position] = record.get("page_end") or record["page"]
+            self._page_table = (self.version, ids, first_pages, last_pages)
+        return self._page_table[1:]
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "disk_version": self.disk_version,
+            "reloads": self.reloads,
+            "snapshot_version": self.snapshot_version,
+            "snapshots": self.snapshots,
+            "wal_bytes": self.wal.size(),
+            "wal_commits": self.wal.commits,
+            "documents": len(self.documents),
+            "fragments": len(self.fragment_store),
+            "vectors": self.index.ntotal,
+            "exact_vectors": len(self.vector_store),
+            "mmapped": self.mmapped,
+        }
+
+    def search(self, embeddings: np.ndarray, k: int, nprobe: int = None, ef_search: int = None,
+               allowed_ids: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca los `k` vectores más cercanos. Los índices devueltos son IDs de fragmentos (-1 si no hay).
+        Con un índice cuantizado se buscan `k * Config.EXACT_RERANK_FACTOR` candidatos y se re-ordenan con
+        los vectores exactos.
+
+        :param embeddings: Embeddings de consulta.
+        :param k: Número de vecinos.
+        :param nprobe: Listas invertidas a visitar en esta búsqueda (índices IVF).
+        :param ef_search: Tamaño de la lista de candidatos en esta búsqueda (índices HNSW).
+        :param allowed_ids: Solo estos IDs (filtro de metadatos, ver `filter_ids`); FAISS aplica el filtro
+                            durante la búsqueda.
+        """
+        queries = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if allowed_ids is not None and not len(allowed_ids):
+            return np.full((len(queries), k), np.inf, dtype=np.float32), np.full((len(queries), k), -1, dtype=np.int64)
+        # Bajo el bloqueo solo se toma el índice actual; la búsqueda va fuera, en paralelo con las demás (las
+        # escrituras no lo modifican hasta que terminan, ver `_ensure_writable`, y una recarga lo sustituye por otro)
+        with self._lock:
+            index, vector_store = self.index, self.vector_store
+            with self._searches_done:
+                self._searching += 1
+        try:
+            params = search_parameters(nprobe, ef_search, index, allowed_ids)
+            if not self.keeps_exact_vectors or not len(vector_store):
+                return index.search(queries, k, params=params)
+            distances, ids = index.search(queries, k * Config.EXACT_RERANK_FACTOR, params=params)
+            return vector_store.rerank(queries, distances, ids, k)
+        finally:
+            with self._searches_done:
+                self._searching -= 1
+                if not self._searching:
+                    self._searches_done.notify_all()
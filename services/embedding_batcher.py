@@ -0,0 +1,176 @@
+import asyncio
+import time
+from typing import List, Tuple
+import numpy as np
+from app.config import Config
+from app.services.corpus_store import SearchFilter
+from app.utils.metrics import metrics
+from app.utils.executors import inference_pool, ExecutorSaturatedError
+from app.utils.logger import get_logger
+from app.utils.tracing import begin_trace, current_trace, span, use_trace
+
+logger = get_logger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+QUEUE_WAIT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25)
+
+
+class _PendingQuery:
+    def __init__(self, question: str, k: int, distance_threshold: float, nprobe: int, ef_search: int,
+                 future: asyncio.Future, query_service=None, search_filter: SearchFilter = None):
+        self.question = question
+        self.k = k
+        self.distance_threshold = distance_threshold
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.future = future
+        self.query_service = query_service
+        self.search_filter = search_filter
+        self.enqueued_at = time.perf_counter()
+        self.trace = current_trace()
+
+
+class EmbeddingBatcher:
+    def __init__(self, query_service, window_ms: float = None, max_batch_size: int = None):
+        """
+        Agrupa las preguntas concurrentes de `/query/` en micro-lotes.
+
+        Las preguntas que llegan dentro de una ventana de pocos milisegundos (hasta `max_batch_size`) se codifican
+        en una sola llamada al modelo de embeddings y se buscan con un único `index.search` de varias filas, en un
+        hilo del pool de inferencia para no bloquear el event loop. Después, cada petición recibe sus propios resultados.
+
+        Las preguntas de distintas colecciones o con distintos filtros de metadatos se codifican juntas (el modelo de
+        embeddings es el mismo) y se buscan en grupos separados.
+
+        :param query_service: Servicio de consultas que realiza la codificación y la búsqueda (y el de la colección
+                              por defecto).
+        :param window_ms: Tiempo máximo de espera para completar un lote (por defecto, `Config.EMBEDDING_BATCH_WINDOW_MS`).
+        :param max_batch_size: Tamaño máximo del lote (por defecto, `Config.EMBEDDING_BATCH_MAX_SIZE`).
+        """
+        self.query_service = query_service
+        self.window = (window_ms if window_ms is not None else Config.EMBEDDING_BATCH_WINDOW_MS) / 1000
+        self.max_batch_size = max_batch_size or Config.EMBEDDING_BATCH_MAX_SIZE
+        self.batch_size_histogram = metrics.histogram(
+            "embedding_batch_size", "Preguntas por lote de embeddings", BATCH_SIZE_BUCKETS
+        )
+        self.queue_wait_histogram = metrics.histogram(
+            "embedding_queue_wait_seconds", "Espera en cola antes de codificar la pregunta", QUEUE_WAIT_BUCKETS
+        )
+        self._queue = None
+        self._worker = None
+        self._loop = None
+
+    def _ensure_worker(self):
+        """
+        Crea la cola y la tarea consumidora en el event loop actual (la primera vez o si el loop ha cambiado).
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=Config.EMBEDDING_QUEUE_MAX_SIZE)
+            self._worker = loop.create_task(self._run())
+
+    async def query(self, question: str, k: int = 10, distance_threshold: float = 1.7, nprobe: int = None,
+                    ef_search: int = None, query_service=None,
+                    search_filter: SearchFilter = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Equivalente asíncrono de `QueryService.query`, resuelto dentro de un micro-lote.
+
+        :param query_service: Servicio de la colección en la que se busca (por defecto, el del batcher).
+        :param search_filter: Filtro de metadatos aplicado durante la búsqueda.
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        pending = _PendingQuery(
+            question, k, distance_threshold, nprobe, ef_search, future, query_service or self.query_service,
+            search_filter,
+        )
+        try:
+            self._queue.put_nowait(pending)
+        except asyncio.QueueFull:
+            raise ExecutorSaturatedError("embedding")
+        return await future
+
+    async def _run(self):
+        # La tarea hereda el contexto de la petición que la creó: se desactiva su traza
+        begin_trace(enabled=False)
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            started_at = time.perf_counter()
+            self.batch_size_histogram.observe(len(batch))
+            for pending in batch:
+                self.queue_wait_histogram.observe(started_at - pending.enqueued_at)
+                if pending.trace is not None:
+                    pending.trace.add("embedding_queue", pending.enqueued_at, started_at - pending.enqueued_at)
+
+            try:
+                results = await inference_pool.run(self._process, batch)
+            except Exception as e:
+                logger.error(f"Error procesando un lote de {len(batch)} preguntas: {e}")
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                continue
+
+            for pending, result in zip(batch, results):
+                if not pending.future.done():
+                    pending.future.set_result(result)
+
+    def _process(self, batch: List[_PendingQuery]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Codifica todas las preguntas del lote de una vez y las busca con una búsqueda multi-fila
+        por cada combinación de colección, filtro y parámetros de búsqueda.
+        """
+        # Cada etapa se mide una vez por lote y se añade a la traza de todas sus peticiones
+        traces = [pending.trace for pending in batch]
+        with span("embedding", traces):
+            embeddings = self.query_service.encode_questions([pending.question for pending in batch])
+        results = [None] * len(batch)
+
+        groups = {}
+        for position, pending in enumerate(batch):
+            search_filter = pending.search_filter.key() if pending.search_filter else None
+            key = (id(pending.query_service), search_filter, pending.nprobe, pending.ef_search)
+            groups.setdefault(key, []).append(position)
+
+        for positions in groups.values():
+            first = batch[positions[0]]
+            query_service = first.query_service
+            k = max(batch[position].k for position in positions)
+            with span("faiss_search", [traces[position] for position in positions]):
+                allowed_ids = query_service.allowed_ids(first.search_filter)
+                distances, indices = query_service.search_embeddings(
+                    embeddings[positions], k, nprobe=first.nprobe, ef_search=first.ef_search, allowed_ids=allowed_ids
+                )
+            for row, position in enumerate(positions):
+                pending = batch[position]
+                with use_trace(pending.trace):
+                    results[position] = query_service.hybrid_results(
+                        pending.question, distances[row][:pending.k], indices[row][:pending.k], pending.k,
+                        pending.distance_threshold, allowed_ids
+                    )
+        return results
+
+    def stats(self) -> dict:
+        """
+        Histogramas de tamaño de lote y espera en cola, para ajustar el compromiso throughput/latencia.
+        """
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_wait_seconds": self.queue_wait_histogram.snapshot(),
+        }
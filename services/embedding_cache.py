@@ -0,0 +1,104 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+import numpy as np
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, model_name: str, max_bytes: int):
+        """
+        Caché persistente (SQLite) de embeddings de fragmentos, indexada por (modelo, hash del texto).
+
+        Al volver a subir un documento revisado solo se calculan los embeddings de los fragmentos que han cambiado.
+        Cuando los vectores guardados superan `max_bytes` se eliminan los usados hace más tiempo.
+
+        :param path: Ruta a la base de datos SQLite.
+        :param model_name: Nombre del modelo de embeddings (forma parte de la clave).
+        :param max_bytes: Tamaño máximo de los vectores guardados (0 = sin límite).
+        """
+        self.path = path
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Devuelve el embedding guardado de cada texto, o None si no está en la caché.
+        """
+        keys = [self._key(text) for text in texts]
+        found = {}
+        with self._lock:
+            # Consultas por bloques para no superar el límite de parámetros de SQLite
+            for start in range(0, len(keys), 500):
+                block = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(block))})", block
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                     [(now, key) for key in found])
+                self._db.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [np.frombuffer(found[key], dtype=np.float32) if key in found else None for key in keys]
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray):
+        """
+        Guarda los embeddings de varios textos y aplica el límite de tamaño.
+        """
+        now = time.time()
+        rows = [
+            (self._key(text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        if not self.max_bytes:
+            return
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        if total <= self.max_bytes or not count:
+            return
+        excess = int(np.ceil((total - self.max_bytes) / (total / count)))
+        self._db.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self.evicted += excess
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": count,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evicted": self.evicted,
+            }
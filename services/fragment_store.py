@@ -0,0 +1,283 @@
+import os
+import json
+import mmap
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+import numpy as np
+from app.config import Config
+from app.utils.generations import generation_path, latest_generation, remove_older_generations, write_table
+from app.utils.logger import get_logger
+
+try:
+    import zstandard
+except ImportError:  # Opcional: sin zstandard los bloques se comprimen con zlib
+    zstandard = None
+
+# Primer byte de cada bloque comprimido: indica el códec con el que se comprimió
+_ZSTD_BLOCK = b"Z"
+_ZLIB_BLOCK = b"z"
+_BLOCK_CACHE_SIZE = 64  # Bloques descomprimidos que se conservan
+
+logger = get_logger(__name__)
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "zstd" and zstandard is not None:
+        return _ZSTD_BLOCK + zstandard.ZstdCompressor(level=3).compress(data)
+    return _ZLIB_BLOCK + zlib.compress(data, 6)
+
+
+def _decompress(block: bytes) -> bytes:
+    codec, data = block[:1], block[1:]
+    if codec == _ZLIB_BLOCK:
+        return zlib.decompress(data)
+    if zstandard is None:
+        raise RuntimeError("[ERROR] FragmentStore: Se necesita el paquete 'zstandard' para leer los fragmentos comprimidos.")
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+class FragmentStore:
+    def __init__(self, base_path: str, compression: str = None, block_size: int = None):
+        """
+        Almacén de fragmentos en disco, mapeado en memoria.
+
+        Cada fragmento (texto + metadatos) se guarda como un registro JSON en un blob de solo-añadir
+        (`<base>.fragments.bin`). Una tabla ordenada por ID con (id, offset, longitud, posición) en
+        `<base>.fragments.idx.npy` permite extraer un fragmento sin materializar el corpus entero.
+        Ambos archivos se abren con mmap, así que varios procesos comparten una única copia en la caché de páginas.
+
+        Con compresión, los registros se añaden en bloques comprimidos de `block_size` registros; la tabla apunta
+        al bloque y a la posición del registro dentro de él, y para leer un fragmento solo se descomprime su bloque.
+        Los registros sin comprimir (posición -1) y los bloques comprimidos pueden convivir en el mismo blob.
+
+        Al compactar, el blob se reescribe como una generación nueva (`<base>.fragments.<n>.bin`, con su tabla
+        `<base>.fragments.<n>.idx.npy`): publicar la tabla es el único paso que cambia de generación, así que una
+        compactación interrumpida deja intactos la tabla y el blob anteriores.
+
+        :param base_path: Ruta base (sin extensión) de los archivos del almacén.
+        :param compression: "zstd", "zlib" o "none" (por defecto, `Config.FRAGMENT_COMPRESSION`).
+        :param block_size: Registros por bloque comprimido (por defecto, `Config.FRAGMENT_BLOCK_SIZE`).
+        """
+        self._prefix = base_path + ".fragments"
+        self.generation = 0
+        self._set_generation(0)
+        compression = Config.FRAGMENT_COMPRESSION if compression is None else compression
+        self.compression = None if compression in ("", "none") else compression
+        if self.compression == "zstd" and zstandard is None:
+            logger.warning("'zstandard' no está instalado; los fragmentos se comprimen con zlib.")
+        self.block_size = block_size or Config.FRAGMENT_BLOCK_SIZE
+        self._table = np.empty((0, 4), dtype=np.int64)
+        self._blob = None
+        self._blocks = OrderedDict()  # offset del bloque -> registros descomprimidos
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """
+        Abre la tabla de offsets y el blob de fragmentos (ambos mapeados en memoria).
+        """
+        with self._lock:
+            self._set_generation(latest_generation(self._prefix, ".idx.npy"))
+            if os.path.exists(self.table_path):
+                self._table = np.load(self.table_path, mmap_mode="r")
+                if self._table.shape[1] == 3:
+                    # Formato anterior, sin bloques: todos los registros están sin comprimir
+                    self._table = np.column_stack((self._table, np.full(len(self._table), -1, dtype=np.int64)))
+            else:
+                self._table = np.empty((0, 4), dtype=np.int64)
+            self._open_blob()
+
+    def _set_generation(self, generation: int):
+        self.generation = generation
+        self.blob_path = generation_path(self._prefix, ".bin", generation)
+        self.table_path = generation_path(self._prefix, ".idx.npy", generation)
+
+    def _open_blob(self):
+        self._blocks.clear()
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
+        if os.path.exists(self.blob_path) and os.path.getsize(self.blob_path) > 0:
+            with open(self.blob_path, "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def save(self):
+        """
+        Persiste la tabla de offsets (archivo temporal + rename). Compacta el blob si más de la mitad son registros borrados.
+        """
+        with self._lock:
+            os.makedirs(os.path.dirname(self.table_path) or ".", exist_ok=True)
+            blob_size = os.path.getsize(self.blob_path) if os.path.exists(self.blob_path) else 0
+            if blob_size > 2 * self._live_bytes():
+                self._compact()
+            else:
+                write_table(self.table_path, self._table)
+
+    def remove_obsolete(self):
+        """
+        Borra el blob y la tabla de las generaciones anteriores a la actual (cuando ya no los referencia ninguna
+        versión publicada del corpus).
+        """
+        remove_older_generations(self._prefix, (".bin", ".idx.npy"), self.generation)
+
+    def _live_bytes(self) -> int:
+        """
+        Bytes del blob que ocupan los registros vivos (cada bloque comprimido cuenta una vez).
+        """
+        _, first_rows = np.unique(self._table[:, 1], return_index=True)
+        return int(self._table[first_rows, 2].sum())
+
+    def _compact(self):
+        """
+        Reescribe los registros (o bloques) vivos en el blob de una generación nueva y publica su tabla.
+
+        El blob nuevo no lo referencia nada hasta que se publica la tabla (un único rename); los archivos de la
+        generación anterior se conservan hasta `remove_obsolete`.
+        """
+        generation = self.generation + 1
+        blob_path = generation_path(self._prefix, ".bin", generation)
+        table = np.array(self._table)
+        offset = 0
+        moved = {}  # offset anterior -> offset nuevo (un bloque compartido por varios registros se copia una vez)
+        with open(blob_path, "wb") as f:
+            for row in table:
+                previous = int(row[1])
+                if previous not in moved:
+                    f.write(self._read(previous, int(row[2])))
+                    moved[previous] = offset
+                    offset += int(row[2])
+                row[1] = moved[previous]
+            f.flush()
+            os.fsync(f.fileno())
+        write_table(generation_path(self._prefix, ".idx.npy", generation), table)
+        self._set_generation(generation)
+        self._table = table
+        self._open_blob()
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def __contains__(self, fragment_id) -> bool:
+        return self._row(fragment_id) is not None
+
+    def ids(self) -> np.ndarray:
+        return np.asarray(self._table[:, 0])
+
+    def _row(self, fragment_id: int) -> Optional[int]:
+        ids = self._table[:, 0]
+        position = int(np.searchsorted(ids, int(fragment_id)))
+        if position < len(ids) and ids[position] == int(fragment_id):
+            return position
+        return None
+
+    def _read(self, offset: int, length: int) -> bytes:
+        if self._blob is None or offset + length > len(self._blob):
+            # El blob ha crecido desde que se mapeó.
+            self._open_blob()
+        return self._blob[offset:offset + length]
+
+    def _block(self, offset: int, length: int) -> List[bytes]:
+        """
+        Registros de un bloque comprimido (los últimos bloques leídos se conservan descomprimidos).
+        """
+        records = self._blocks.get(offset)
+        if records is None:
+            records = _decompress(self._read(offset, length)).split(b"\n")
+            self._blocks[offset] = records
+            while len(self._blocks) > _BLOCK_CACHE_SIZE:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(offset)
+        return records
+
+    def get(self, fragment_id: int) -> Optional[dict]:
+        """
+        Devuelve el registro (texto y metadatos) de un fragmento, o None si no existe.
+        """
+        with self._lock:
+            row = self._row(fragment_id)
+            if row is None:
+                return None
+            _, offset, length, slot = (int(value) for value in self._table[row])
+            payload = self._read(offset, length) if slot < 0 else self._block(offset, length)[slot]
+            return json.loads(payload.decode("utf-8"))
+
+    def get_text(self, fragment_id: int) -> Optional[str]:
+        record = self.get(fragment_id)
+        return record["text"] if record else None
+
+    def append(self, fragment_ids: List[int], records: List[dict]) -> np.ndarray:
+        """
+        Añade registros al final del blob. Los IDs deben ser crecientes y mayores que los existentes.
+
+        :return: Filas añadidas a la tabla (id, offset, longitud, posición), para el log de escritura del corpus.
+        """
+        if not fragment_ids:
+            return np.empty((0, 4), dtype=np.int64)
+        with self._lock:
+            if len(self._table) and int(fragment_ids[0]) <= int(self._table[-1, 0]):
+                raise ValueError("[ERROR] FragmentStore: Los IDs de fragmento deben ser crecientes.")
+            # json.dumps escapa los saltos de línea, así que "\n" separa los registros dentro de un bloque
+            payloads = [json.dumps(record, ensure_ascii=False).encode("utf-8") for record in records]
+            if self.compression:
+                chunks, slots, chunk_of_record = [], [], []
+                for start in range(0, len(payloads), self.block_size):
+                    block = payloads[start:start + self.block_size]
+                    chunk_of_record.extend([len(chunks)] * len(block))
+                    slots.extend(range(len(block)))
+                    chunks.append(_compress(b"\n".join(block), self.compression))
+            else:
+                chunks, slots, chunk_of_record = payloads, [-1] * len(payloads), list(range(len(payloads)))
+
+            os.makedirs(os.path.dirname(self.blob_path) or ".", exist_ok=True)
+            with open(self.blob_path, "ab") as f:
+                start = f.tell()
+                f.write(b"".join(chunks))
+            lengths = np.fromiter((len(chunk) for chunk in chunks), dtype=np.int64, count=len(chunks))
+            offsets = start + np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+            chunk_of_record = np.asarray(chunk_of_record, dtype=np.int64)
+            rows = np.column_stack((
+                np.asarray(fragment_ids, dtype=np.int64), offsets[chunk_of_record], lengths[chunk_of_record],
+                np.asarray(slots, dtype=np.int64),
+            ))
+            self._table = np.concatenate((np.asarray(self._table), rows))
+            return rows
+
+    def add_rows(self, rows: np.ndarray) -> int:
+        """
+        Añade a la tabla filas de registros que ya están en el blob (al reaplicar el log de escritura del corpus).
+        Las de IDs que ya están en la tabla se ignoran.
+
+        :return: Número de filas añadidas.
+        """
+        with self._lock:
+            rows = np.asarray(rows, dtype=np.int64).reshape(-1, 4)
+            rows = rows[~np.isin(rows[:, 0], self._table[:, 0])]
+            if len(rows):
+                table = np.concatenate((np.asarray(self._table), rows))
+                self._table = table[np.argsort(table[:, 0], kind="stable")]
+            return len(rows)
+
+    def sync(self):
+        """
+        Fuerza la escritura en disco de los registros añadidos al blob.
+        """
+        if os.path.exists(self.blob_path):
+            fd = os.open(self.blob_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def remove(self, fragment_ids: Iterable[int]) -> int:
+        """
+        Elimina fragmentos de la tabla. Su espacio en el blob se recupera al compactar.
+        """
+        with self._lock:
+            keep = ~np.isin(self._table[:, 0], np.asarray(list(fragment_ids), dtype=np.int64))
+            removed = int((~keep).sum())
+            if removed:
+                self._table = np.asarray(self._table)[keep]
+            return removed
@@ -0,0 +1,151 @@
+import math
+from typing import Optional
+import numpy as np
+import faiss
+from app.config import Config
+
+# Tipos de índice soportados y su cadena equivalente para `faiss.index_factory`
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "sq_fp16", "sq_int8")
+# SQ8 estima el rango de cada dimensión con una muestra de vectores
+SQ_TRAIN_MIN_VECTORS = 1000
+
+
+def factory_string(index_type: str = None) -> str:
+    """
+    Traduce el tipo de índice configurado a una cadena de `faiss.index_factory`.
+
+    Cualquier valor que no sea uno de `INDEX_TYPES` se interpreta directamente como una cadena de fábrica de FAISS.
+
+    :param index_type: Tipo de índice (por defecto, `Config.INDEX_TYPE`).
+    :return: Cadena para `faiss.index_factory`.
+    """
+    index_type = index_type or Config.INDEX_TYPE
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf_flat":
+        return f"IVF{Config.IVF_NLIST},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{Config.HNSW_M}"
+    if index_type == "ivf_pq":
+        return f"IVF{Config.IVF_NLIST},PQ{Config.PQ_M}x{Config.PQ_NBITS}"
+    if index_type == "sq_fp16":
+        return "SQfp16"
+    if index_type == "sq_int8":
+        return "SQ8"
+    return index_type
+
+
+def is_lossy(index_type: str = None) -> bool:
+    """
+    Indica si el índice configurado guarda los vectores cuantizados (SQ/PQ), con distancias aproximadas.
+    """
+    return any(code in factory_string(index_type) for code in ("SQ", "PQ"))
+
+
+def create_index(dimension: int, index_type: str = None) -> faiss.Index:
+    """
+    Crea el índice base (sin IDs ni entrenar) según la configuración.
+
+    :param dimension: Dimensión de los embeddings.
+    :param index_type: Tipo de índice (por defecto, `Config.INDEX_TYPE`).
+    :return: Índice FAISS.
+    """
+    index = faiss.index_factory(dimension, factory_string(index_type), faiss.METRIC_L2)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = Config.HNSW_EF_CONSTRUCTION
+    apply_search_defaults(index)
+    return index
+
+
+def apply_search_defaults(index: faiss.Index):
+    """
+    Aplica los parámetros de búsqueda por defecto (`nprobe`, `efSearch`) a un índice.
+    """
+    index = unwrap(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = Config.IVF_NPROBE
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = Config.HNSW_EF_SEARCH
+
+
+def unwrap(index: faiss.Index) -> faiss.Index:
+    """
+    Devuelve el índice base de un `IndexIDMap` con su tipo concreto.
+    """
+    if isinstance(index, faiss.IndexIDMap):
+        index = index.index
+    return faiss.downcast_index(index)
+
+
+def train_threshold(index_type: str = None) -> int:
+    """
+    Número mínimo de vectores necesario para entrenar el índice configurado (0 si no necesita entrenamiento).
+    """
+    if Config.INDEX_TRAIN_MIN_VECTORS:
+        return Config.INDEX_TRAIN_MIN_VECTORS
+    index = create_index(Config.EMBEDDING_DIMENSION, index_type)
+    if index.is_trained:
+        return 0
+    # FAISS recomienda al menos 39 puntos por centroide; PQ necesita 2^nbits puntos por subcuantizador.
+    threshold = 2 ** Config.PQ_NBITS if "PQ" in factory_string(index_type) else 0
+    if "SQ" in factory_string(index_type):
+        threshold = max(threshold, SQ_TRAIN_MIN_VECTORS)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        threshold = max(threshold, 39 * ivf.nlist)
+    return threshold
+
+
+def train_index(index: faiss.Index, vectors: np.ndarray):
+    """
+    Entrena un índice con una muestra de los vectores dados.
+    """
+    sample_size = max(train_threshold(), 256 * Config.IVF_NLIST)
+    if len(vectors) > sample_size:
+        rng = np.random.default_rng(0)
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+
+
+def search_parameters(nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                      index: faiss.Index = None, allowed_ids: np.ndarray = None) -> Optional[faiss.SearchParameters]:
+    """
+    Construye los parámetros de búsqueda por petición para el índice dado.
+
+    Con `allowed_ids`, la búsqueda se restringe a esos IDs con un `IDSelectorBatch`: FAISS descarta el resto de
+    vectores mientras busca, en lugar de filtrar los `k` resultados después. Como con un filtro muy selectivo IVF
+    y HNSW encuentran pocos vectores admitidos entre los que visitan, `nprobe`/`efSearch` se amplían en proporción
+    inversa a la fracción de vectores admitidos.
+
+    :param nprobe: Listas invertidas a visitar (índices IVF).
+    :param ef_search: Tamaño de la lista de candidatos (índices HNSW).
+    :param index: Índice sobre el que se va a buscar.
+    :param allowed_ids: IDs a los que se limita la búsqueda (None = todos).
+    :return: Parámetros de búsqueda, o None si no aplica ninguno.
+    """
+    if index is None:
+        return None
+    base = unwrap(index)
+    ivf = faiss.try_extract_index_ivf(base)
+    if allowed_ids is None:
+        if nprobe and ivf is not None:
+            return faiss.SearchParametersIVF(nprobe=int(nprobe))
+        if ef_search and isinstance(base, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+        return None
+
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(allowed_ids, dtype=np.int64))
+    widen = max(1.0, index.ntotal / max(len(allowed_ids), 1))
+    if ivf is not None:
+        nprobe = nprobe or ivf.nprobe
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=min(ivf.nlist, math.ceil(nprobe * widen)))
+    elif isinstance(base, faiss.IndexHNSW):
+        ef_search = ef_search or base.hnsw.efSearch
+        ef_search = max(ef_search, min(index.ntotal, math.ceil(ef_search * widen)))
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    # Los parámetros de SWIG no retienen el selector: se guarda una referencia mientras se usan
+    params.referenced_objects = [selector]
+    return params
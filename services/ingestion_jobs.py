@@ -0,0 +1,168 @@
+import contextlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional
+from app.config import Config
+from app.utils.executors import ingestion_pool
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def remove_upload(file_path: str):
+    """
+    Elimina un PDF subido y su directorio temporal (si queda vacío).
+    """
+    try:
+        os.remove(file_path)
+        os.rmdir(os.path.dirname(file_path))
+    except OSError:
+        pass
+
+
+class DocumentBusyError(Exception):
+    """
+    Se lanza al encolar la ingesta de un documento que ya se está indexando (en la misma colección).
+    """
+    def __init__(self, doc_id: str, job_id: str):
+        super().__init__(f"El documento '{doc_id}' ya se está procesando (trabajo {job_id}).")
+        self.doc_id = doc_id
+        self.job_id = job_id
+
+
+class IngestionJob:
+    def __init__(self, file_path: str, doc_id: str, temporary: bool = False, collection: str = None):
+        self.job_id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.doc_id = doc_id
+        self.collection = collection
+        self.temporary = temporary
+        self.status = "queued"  # queued -> running -> completed | failed
+        self.pages_total = None
+        self.pages_done = 0
+        self.fragments = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def to_dict(self) -> dict:
+        progress = None
+        if self.pages_total:
+            progress = self.pages_done / self.pages_total
+        elif self.status == "completed":
+            progress = 1.0
+        return {
+            "job_id": self.job_id,
+            "doc_id": self.doc_id,
+            "collection": self.collection,
+            "filename": os.path.basename(self.file_path),
+            "status": self.status,
+            "pages_total": self.pages_total,
+            "pages_done": self.pages_done,
+            "fragments": self.fragments,
+            "progress": progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionJobManager:
+    def __init__(self, pdf_service, max_finished_jobs: int = None, collections=None):
+        """
+        Ejecuta la ingesta de PDFs como trabajos en segundo plano en el pool de ingesta.
+
+        `submit` devuelve el trabajo al instante; su progreso (páginas extraídas, fragmentos indexados)
+        se consulta con `get`. Se conservan los últimos `max_finished_jobs` trabajos terminados.
+
+        :param pdf_service: Servicio que procesa los PDFs.
+        :param max_finished_jobs: Trabajos terminados que se conservan (por defecto, `Config.INGESTION_JOB_HISTORY`).
+        :param collections: Colecciones (`CollectionManager`); la del trabajo se carga (o se crea) al ejecutarlo.
+        """
+        self.pdf_service = pdf_service
+        self.collections = collections
+        self.max_finished_jobs = max_finished_jobs or Config.INGESTION_JOB_HISTORY
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, file_path: str, doc_id: str = None, temporary: bool = False,
+               collection: str = None) -> IngestionJob:
+        """
+        Encola la ingesta de un PDF.
+
+        :param file_path: Ruta al archivo PDF.
+        :param doc_id: ID del documento (por defecto, el nombre del archivo sin extensión).
+        :param temporary: Eliminar el archivo (y su directorio, si queda vacío) al terminar.
+        :param collection: Colección en la que se indexa (por defecto, la colección por defecto).
+        :return: El trabajo creado.
+        :raises DocumentBusyError: Si ya hay un trabajo en curso para el mismo documento.
+        :raises ExecutorSaturatedError: Si el pool de ingesta está lleno.
+        """
+        doc_id = doc_id or os.path.splitext(os.path.basename(file_path))[0]
+        if self.collections is not None:
+            collection = self.collections.resolve_name(collection)
+        job = IngestionJob(file_path, doc_id, temporary, collection)
+        with self._lock:
+            for other in self._jobs.values():
+                if other.doc_id == doc_id and other.collection == collection and not other.finished:
+                    raise DocumentBusyError(doc_id, other.job_id)
+            # Se registra antes de encolarlo para que un segundo envío del mismo documento lo vea
+            self._jobs[job.job_id] = job
+        try:
+            ingestion_pool.submit(self._run, job)
+        except Exception:
+            with self._lock:
+                del self._jobs[job.job_id]
+            raise
+        logger.info(f"Trabajo {job.job_id} encolado para el documento '{doc_id}'.")
+        return job
+
+    def _run(self, job: IngestionJob):
+        job.update(status="running", started_at=time.time())
+        try:
+            # La colección no se descarga (ni se cierra su corpus) mientras dura la ingesta
+            collection = (
+                self.collections.pinned(job.collection, create=True) if self.collections else contextlib.nullcontext()
+            )
+            with collection as query_service:
+                job.result = self.pdf_service.process_pdf(
+                    job.file_path, doc_id=job.doc_id, progress=job.update, query_service=query_service
+                )
+            job.update(status="completed")
+        except Exception as e:
+            logger.error(f"El trabajo {job.job_id} ha fallado: {e}")
+            job.update(status="failed", error=str(e))
+        finally:
+            job.finished_at = time.time()
+            if job.temporary:
+                remove_upload(job.file_path)
+            self._prune()
+
+    def _prune(self):
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+            for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestionJob]:
+        with self._lock:
+            return list(self._jobs.values())
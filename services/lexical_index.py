@@ -0,0 +1,150 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Container, Dict, Iterable, List, Tuple
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Palabras vacías en inglés (idioma de los fragmentos indexados) y en español
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "in", "is", "it",
+    "its", "many", "much", "of", "on", "or", "that", "the", "their", "there", "this", "to", "was", "what", "when",
+    "where", "which", "who", "why", "will", "with", "you", "your",
+    "al", "como", "con", "cual", "cuales", "cuando", "cómo", "cuál", "cuáles", "cuándo", "de", "del", "donde",
+    "dónde", "el", "en", "es", "la", "las", "lo", "los", "para", "por", "que", "qué", "se", "su", "un", "una", "y",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Normaliza un texto en términos: minúsculas, sin palabras vacías y con el plural inglés simple reducido.
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if len(token) < 2 or token in STOP_WORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+class BM25Index:
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        """
+        Índice invertido con puntuación BM25 sobre los fragmentos del corpus.
+
+        Cada término tiene su lista de fragmentos (posting list) con la frecuencia del término; una búsqueda solo
+        recorre las listas de los términos de la pregunta. Se actualiza de forma incremental al añadir o eliminar
+        fragmentos y se guarda en JSON junto al índice FAISS.
+
+        :param path: Ruta del archivo del índice.
+        :param k1: Saturación de la frecuencia del término.
+        :param b: Normalización por longitud del fragmento.
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+        self.dirty = False
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def load(self) -> bool:
+        """
+        Carga el índice desde disco. Devuelve False si no existe o no se puede leer.
+        """
+        with self._lock:
+            self.postings, self.lengths, self.total_length = {}, {}, 0
+            if not os.path.exists(self.path):
+                return False
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.lengths = {int(fid): length for fid, length in data["lengths"].items()}
+                self.postings = {
+                    term: {int(fid): tf for fid, tf in posting.items()} for term, posting in data["postings"].items()
+                }
+                self.total_length = sum(self.lengths.values())
+                self.dirty = False
+                return True
+            except Exception as e:
+                logger.error(f"No se pudo cargar el índice léxico desde {self.path}: {e}")
+                self.postings, self.lengths, self.total_length = {}, {}, 0
+                return False
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"lengths": self.lengths, "postings": self.postings}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    def add(self, fragment_ids: Iterable[int], texts: Iterable[str]):
+        with self._lock:
+            for fragment_id, text in zip(fragment_ids, texts):
+                fragment_id = int(fragment_id)
+                if fragment_id in self.lengths:
+                    continue
+                terms = tokenize(text)
+                for term, tf in Counter(terms).items():
+                    self.postings.setdefault(term, {})[fragment_id] = tf
+                self.lengths[fragment_id] = len(terms)
+                self.total_length += len(terms)
+            self.dirty = True
+
+    def remove(self, fragment_ids: Iterable[int], texts: Iterable[str]):
+        """
+        Elimina fragmentos; se necesita su texto para localizar sus términos.
+        """
+        with self._lock:
+            for fragment_id, text in zip(fragment_ids, texts):
+                fragment_id = int(fragment_id)
+                if fragment_id not in self.lengths:
+                    continue
+                for term in set(tokenize(text or "")):
+                    posting = self.postings.get(term)
+                    if posting is not None:
+                        posting.pop(fragment_id, None)
+                        if not posting:
+                            del self.postings[term]
+                self.total_length -= self.lengths.pop(fragment_id)
+            self.dirty = True
+
+    def search(self, query: str, k: int, allowed_ids: Container[int] = None) -> List[Tuple[int, float]]:
+        """
+        Devuelve los `k` fragmentos con mayor puntuación BM25 para la consulta: [(id, puntuación)].
+
+        :param allowed_ids: Solo se puntúan estos fragmentos (filtro de metadatos; None = todos).
+        """
+        with self._lock:
+            n = len(self.lengths)
+            if not n:
+                return []
+            average_length = self.total_length / n or 1.0
+            scores: Dict[int, float] = {}
+            for term in set(tokenize(query)):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for fragment_id, tf in posting.items():
+                    if allowed_ids is not None and fragment_id not in allowed_ids:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[fragment_id] / average_length)
+                    scores[fragment_id] = scores.get(fragment_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,88 @@
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Tuple
+import pdfplumber
+from app.config import Config
+
+# Este módulo solo importa pdfplumber: los procesos del pool (arrancados con "spawn") no cargan los modelos.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # "spawn" evita heredar por fork los hilos de la API (uvicorn, torch) en los procesos hijos
+            _pool = ProcessPoolExecutor(
+                max_workers=Config.PDF_EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _reset_pool(broken: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False)
+
+
+def count_pages(file_path: str) -> int:
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """
+    Extrae el texto de las páginas [start, end) de un PDF. Se ejecuta en un proceso del pool.
+    """
+    with pdfplumber.open(file_path) as pdf:
+        return [pdf.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def iter_pages(file_path: str, page_count: int) -> Iterator[Tuple[int, str]]:
+    """
+    Devuelve (número de página, texto) en orden, extrayendo las páginas en paralelo en el pool de procesos.
+
+    Las páginas se reparten en bloques de `Config.PDF_PAGES_PER_TASK`; como mucho hay dos bloques por proceso
+    en vuelo, de modo que la extracción avanza mientras se procesan las páginas ya extraídas sin acumular
+    el documento entero en memoria. Con `Config.PDF_EXTRACTION_WORKERS=0` se extrae en el hilo actual.
+
+    :param file_path: Ruta al archivo PDF.
+    :param page_count: Número de páginas del PDF.
+    """
+    ranges = [
+        (start, min(start + Config.PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, Config.PDF_PAGES_PER_TASK)
+    ]
+
+    if Config.PDF_EXTRACTION_WORKERS <= 0:
+        for start, end in ranges:
+            for offset, text in enumerate(extract_page_range(file_path, start, end)):
+                yield start + offset, text
+        return
+
+    pool = _get_pool()
+    max_in_flight = 2 * Config.PDF_EXTRACTION_WORKERS
+    pending = deque()
+    next_range = 0
+    try:
+        while pending or next_range < len(ranges):
+            while next_range < len(ranges) and len(pending) < max_in_flight:
+                start, end = ranges[next_range]
+                pending.append((start, pool.submit(extract_page_range, file_path, start, end)))
+                next_range += 1
+            start, future = pending.popleft()
+            for offset, text in enumerate(future.result()):
+                yield start + offset, text
+    except BrokenProcessPool:
+        # Un proceso del pool ha muerto: se descarta el pool para que la siguiente ingesta cree uno nuevo
+        _reset_pool(pool)
+        raise
+    finally:
+        for _, future in pending:
+            future.cancel()
@@ -1,86 +1,254 @@
+import hashlib
 import os
-import pdfplumber
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from app.config import Config
+from app.models.registry import embedding_model_id
+from app.services.pdf_extraction import count_pages, iter_pages
+from app.services.embedding_cache import EmbeddingCache
+from app.services.chunking import create_chunker, tokenizer_counter, approximate_token_count
+from app.utils.logger import get_logger
+from app.utils.tracing import INGESTION_STAGE_METRIC, span, timed_iter
+
+logger = get_logger(__name__)
 
 class PDFService:
-    def __init__(self, temp_pdf_path, faiss_index_path, query_service):
+    def __init__(self, temp_pdf_path, faiss_index_path, query_service, translator=None, embedding_model=None):
         """
         Inicializa el servicio de procesamiento de PDFs.
 
         :param temp_pdf_path: Ruta temporal para almacenar los PDFs.
         :param faiss_index_path: Ruta al índice FAISS.
         :param query_service: Instancia del servicio de consultas.
+        :param translator: Servicio de traducción para pretraducir los fragmentos (opcional).
+        :param embedding_model: Modelo de embeddings (por defecto, el del servicio de consultas).
         """
         self.temp_pdf_path = temp_pdf_path
         self.faiss_index_path = faiss_index_path
         self.query_service = query_service
-        print("[DEBUG] PDFService: Cargando el modelo de embeddings 'all-MiniLM-L6-v2'.")
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')  # Modelo para embeddings
-        print("[DEBUG] PDFService: Modelo de embeddings cargado exitosamente.")
+        self.translator = translator
+        # Mismo modelo que las consultas: se carga una sola vez, en el primer uso
+        self.embedding_model = embedding_model or query_service.model_clients["embedding"]
+        self._token_counter = None
+        self._chunk_max_tokens = None
+
+        # Caché persistente de embeddings de fragmentos (desactivada si EMBEDDING_CACHE_PATH está vacío)
+        self.embedding_cache = None
+        if Config.EMBEDDING_CACHE_PATH:
+            self.embedding_cache = EmbeddingCache(
+                Config.EMBEDDING_CACHE_PATH, embedding_model_id(), Config.EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+            )
+
+    def _resolve_chunking(self):
+        """
+        Los fragmentos se miden con el tokenizador del modelo de embeddings y no superan su longitud máxima.
+        Se resuelve en la primera ingesta para no cargar el modelo al arrancar.
+        """
+        tokenizer = getattr(self.embedding_model, "tokenizer", None)
+        chunk_max_tokens = Config.CHUNK_MAX_TOKENS
+        max_seq_length = getattr(self.embedding_model, "max_seq_length", None)
+        if max_seq_length:
+            chunk_max_tokens = min(chunk_max_tokens, max_seq_length - 2)  # [CLS] y [SEP]
+        self._token_counter = tokenizer_counter(tokenizer) if tokenizer is not None else approximate_token_count
+        self._chunk_max_tokens = chunk_max_tokens
+
+    @property
+    def token_counter(self):
+        if self._token_counter is None:
+            self._resolve_chunking()
+        return self._token_counter
+
+    @property
+    def chunk_max_tokens(self) -> int:
+        if self._chunk_max_tokens is None:
+            self._resolve_chunking()
+        return self._chunk_max_tokens
+
+    def process_pdf(self, file_path, doc_id: str = None, progress=None, query_service=None):
+        """
+        Extrae, fragmenta e indexa un PDF como un documento del corpus, en streaming.
+
+        Las páginas se extraen en paralelo en un pool de procesos y se fragmentan según llegan con el chunker
+        configurado (`Config.CHUNKER`), que guarda la página y la posición de cada fragmento. Los fragmentos se
+        codifican en lotes de `Config.INGESTION_EMBED_BATCH_SIZE` y cada lote se añade al índice en cuanto está
+        listo, de modo que la memoria no crece con el tamaño del PDF.
 
-    def process_pdf(self, file_path):
+        Si ya existe un documento con el mismo ID, sus fragmentos anteriores se eliminan al terminar; si la ingesta
+        falla, se eliminan los fragmentos nuevos y se conserva la versión anterior. El resto del corpus no se modifica.
+        Si el archivo es idéntico (mismo hash SHA-256) al ya indexado con ese ID, no se procesa de nuevo, y los
+        fragmentos que no han cambiado reutilizan su embedding de la caché de embeddings.
+
+        :param file_path: Ruta al archivo PDF.
+        :param doc_id: ID del documento (por defecto, el nombre del archivo sin extensión).
+        :param progress: Función opcional que recibe el progreso como argumentos con nombre
+                         (`pages_total`, `pages_done`, `fragments`).
+        :param query_service: Servicio de la colección en la que se indexa (por defecto, el del servicio).
+        :return: ID del documento, número de páginas, número de fragmentos indexados y aciertos de la caché de embeddings.
+        """
+        # Bloqueo de escritura del corpus (entre workers) hasta persistir el documento
+        query_service = query_service or self.query_service
+        with query_service.store.writer(), span("total", metric=INGESTION_STAGE_METRIC):
+            return self._ingest(query_service, file_path, doc_id, progress)
+
+    def _ingest(self, query_service, file_path, doc_id: str = None, progress=None):
+        doc_id = doc_id or os.path.splitext(os.path.basename(file_path))[0]
+        report = progress or (lambda **fields: None)
+        store = query_service.store
+        replaced_ids = list(store.documents.get(doc_id, {}).get("fragment_ids", []))
+        new_ids = []
         try:
-            print(f"[DEBUG] process_pdf: Iniciando procesamiento del archivo PDF: {file_path}")
+            logger.debug(f"Iniciando procesamiento del archivo PDF: {file_path}")
 
             # Verificar si el archivo existe
             if not os.path.exists(file_path):
                 raise FileNotFoundError(f"[ERROR] process_pdf: El archivo no existe: {file_path}")
 
-            # Extraer texto
-            print("[DEBUG] process_pdf: Abriendo el archivo PDF para extraer texto.")
-            text = ""
-            with pdfplumber.open(file_path) as pdf:
-                for i, page in enumerate(pdf.pages):
-                    page_text = page.extract_text() or ""
-                    text += page_text + "\n"
-                    print(f"[DEBUG] process_pdf: Texto extraído de la página {i + 1}.")
-            
-            if not text.strip():
+            # Archivo idéntico al ya indexado: no hay nada que hacer
+            file_hash = self._file_hash(file_path)
+            chunker_signature = f"{Config.CHUNKER}:{self.chunk_max_tokens}:{Config.CHUNK_OVERLAP_TOKENS}"
+            existing = store.documents.get(doc_id, {}).get("metadata", {})
+            if replaced_ids and existing.get("sha256") == file_hash and existing.get("chunker") == chunker_signature:
+                logger.info(f"El documento '{doc_id}' no ha cambiado (mismo hash); se omite la ingesta.")
+                report(pages_total=existing.get("pages"), pages_done=existing.get("pages") or 0, fragments=len(replaced_ids))
+                return {"doc_id": doc_id, "pages": existing.get("pages"), "fragments": len(replaced_ids), "unchanged": True}
+
+            page_count = count_pages(file_path)
+            logger.debug(f"Extrayendo {page_count} páginas en paralelo.")
+            report(pages_total=page_count, pages_done=0, fragments=0)
+
+            chunker = create_chunker(token_counter=self.token_counter, max_tokens=self.chunk_max_tokens)
+            batch = []
+            cache_stats = {"hits": 0, "misses": 0}
+            has_text = False
+            pages = timed_iter(iter_pages(file_path, page_count), "extraction", metric=INGESTION_STAGE_METRIC)
+            for page_number, page_text in pages:
+                has_text = has_text or bool(page_text.strip())
+                with span("chunking", metric=INGESTION_STAGE_METRIC):
+                    batch.extend(chunker.feed(page_number + 1, page_text))
+
+                if len(batch) >= Config.INGESTION_EMBED_BATCH_SIZE:
+                    new_ids.extend(self._index_batch(query_service, doc_id, batch, len(new_ids), cache_stats))
+                    batch = []
+                report(pages_done=page_number + 1, fragments=len(new_ids))
+
+            if not has_text:
                 raise ValueError("[ERROR] process_pdf: El texto extraído del PDF está vacío.")
-            
-            # Dividir en fragmentos
-            print("[DEBUG] process_pdf: Dividiendo el texto en fragmentos.")
-            fragments = [text[i:i + 500] for i in range(0, len(text), 500)]
-            if not fragments:
+
+            batch.extend(chunker.flush())
+            if batch:
+                new_ids.extend(self._index_batch(query_service, doc_id, batch, len(new_ids), cache_stats))
+            if not new_ids:
                 raise ValueError("[ERROR] process_pdf: No se generaron fragmentos del PDF. Verifique el contenido del archivo.")
-            
-            print(f"[DEBUG] process_pdf: Fragmentos generados: {len(fragments)}")
-            for idx, fragment in enumerate(fragments[:5]):
-                print(f"[DEBUG] Fragmento {idx + 1}:\n{fragment[:200]}...\n")
-
-            # Limpiar índice FAISS y sincronizar fragmentos
-            print("[DEBUG] process_pdf: Limpiando índice FAISS existente.")
-            self.query_service.fragments.clear()
-            self.query_service.index.reset()
-
-            # Generar embeddings para los fragmentos
-            print("[DEBUG] process_pdf: Generando embeddings para los fragmentos.")
-            embeddings = self.embedding_model.encode(fragments, convert_to_tensor=False)
-            embeddings = np.array(embeddings)
-            print(f"[DEBUG] process_pdf: Embeddings generados: {embeddings.shape}")
-
-            if embeddings.size == 0:
-                raise ValueError("[ERROR] process_pdf: Los embeddings no se generaron correctamente.")
-            
-            # Añadir embeddings y fragmentos al índice
-            print("[DEBUG] process_pdf: Añadiendo embeddings y fragmentos al índice FAISS.")
-            self.query_service.add_to_index(embeddings, fragments)
-            print("[INFO] process_pdf: Fragmentos añadidos al índice FAISS con éxito.")
+
+            # Sustituir la versión anterior del documento (si la había) y persistir el corpus
+            metadata = {
+                "filename": os.path.basename(file_path), "sha256": file_hash, "pages": page_count,
+                "chunker": chunker_signature,
+            }
+            with span("finalize", metric=INGESTION_STAGE_METRIC):
+                store.finalize_document(doc_id, metadata, replaced_ids)
+            report(fragments=len(new_ids))
+            logger.info(
+                f"Documento '{doc_id}' indexado con {len(new_ids)} fragmentos "
+                f"({cache_stats['hits']} embeddings reutilizados de la caché, {cache_stats['misses']} calculados)."
+            )
 
             # Verificar sincronización
-            print("[DEBUG] process_pdf: Verificando estado del índice y fragmentos después de sincronización.")
-            print(f"[DEBUG] Vectores en índice FAISS: {self.query_service.index.ntotal}")
-            print(f"[DEBUG] Fragmentos en QueryService: {len(self.query_service.fragments)}")
+            logger.debug(f"Vectores en índice FAISS: {query_service.index.ntotal}")
+            logger.debug(f"Fragmentos en QueryService: {len(query_service.store)}")
+
+            return {
+                "doc_id": doc_id,
+                "pages": page_count,
+                "fragments": len(new_ids),
+                "unchanged": False,
+                "embedding_cache": cache_stats,
+            }
 
         except FileNotFoundError as fnf_error:
-            print(f"[ERROR] process_pdf: Archivo no encontrado: {fnf_error}")
+            logger.error(f"Archivo no encontrado: {fnf_error}")
+            self._discard_partial(query_service, doc_id, new_ids)
             raise fnf_error
         
         except ValueError as val_error:
-            print(f"[ERROR] process_pdf: Error en el contenido o procesamiento del PDF: {val_error}")
+            logger.error(f"Error en el contenido o procesamiento del PDF: {val_error}")
+            self._discard_partial(query_service, doc_id, new_ids)
             raise val_error
 
         except Exception as e:
-            print(f"[ERROR] process_pdf: Error inesperado procesando el PDF: {e}")
+            logger.error(f"Error inesperado procesando el PDF: {e}")
+            self._discard_partial(query_service, doc_id, new_ids)
             raise e
+
+    def _discard_partial(self, query_service, doc_id: str, new_ids):
+        """
+        Elimina los fragmentos ya indexados de una ingesta fallida (la versión anterior del documento se conserva).
+        """
+        if new_ids:
+            logger.warning(f"Eliminando {len(new_ids)} fragmentos de la ingesta fallida de '{doc_id}'.")
+            query_service.store.remove_fragments(doc_id, new_ids)
+
+    def _index_batch(self, query_service, doc_id: str, chunks, first_position: int, cache_stats: dict):
+        """
+        Codifica un lote de fragmentos y lo añade al índice (sin persistir todavía el corpus).
+
+        Solo se calculan los embeddings que no están en la caché de embeddings.
+
+        :param chunks: Fragmentos (`Chunk`) del lote.
+        :param cache_stats: Contadores de aciertos (`hits`) y fallos (`misses`) de la caché para esta ingesta.
+        :return: IDs asignados a los fragmentos.
+        """
+        fragments = [chunk.text for chunk in chunks]
+        cached = self.embedding_cache.get_many(fragments) if self.embedding_cache else [None] * len(fragments)
+        missing = [position for position, embedding in enumerate(cached) if embedding is None]
+        cache_stats["hits"] += len(fragments) - len(missing)
+        cache_stats["misses"] += len(missing)
+
+        if missing:
+            logger.debug(f"Generando embeddings para {len(missing)} de {len(fragments)} fragmentos del lote.")
+            texts = [fragments[position] for position in missing]
+            with span("embedding", metric=INGESTION_STAGE_METRIC):
+                computed = np.array(self.embedding_model.encode(texts, convert_to_tensor=False))
+            if computed.size == 0:
+                raise ValueError("[ERROR] process_pdf: Los embeddings no se generaron correctamente.")
+            for position, embedding in zip(missing, computed):
+                cached[position] = embedding
+            if self.embedding_cache:
+                self.embedding_cache.put_many(texts, computed)
+        embeddings = np.array(cached, dtype=np.float32)
+
+        with span("pretranslation", metric=INGESTION_STAGE_METRIC):
+            fragment_metadata = self.pretranslate(fragments) or [{} for _ in fragments]
+        for offset, (chunk, metadata) in enumerate(zip(chunks, fragment_metadata)):
+            metadata.update(chunk.metadata())
+            metadata["position"] = first_position + offset
+        with span("indexing", metric=INGESTION_STAGE_METRIC):
+            return query_service.add_to_index(
+                embeddings, fragments, doc_id=doc_id, fragment_metadata=fragment_metadata, save=False
+            )
+
+    @staticmethod
+    def _file_hash(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def pretranslate(self, fragments):
+        """
+        Traduce los fragmentos a los idiomas de `Config.PRETRANSLATE_LANGUAGES` para guardarlos junto al fragmento,
+        de modo que las consultas en esos idiomas no tengan que traducir.
+
+        :param fragments: Fragmentos del documento.
+        :return: Metadatos por fragmento con las traducciones, o None si no hay nada que pretraducir.
+        """
+        languages = [lang for lang in Config.PRETRANSLATE_LANGUAGES if lang != "en"]
+        if not self.translator or not languages:
+            return None
+
+        fragment_metadata = [{"translations": {}} for _ in fragments]
+        for lang in languages:
+            logger.debug(f"Pretraduciendo {len(fragments)} fragmentos a '{lang}'.")
+            for metadata, translated in zip(fragment_metadata, self.translator.to_target_batch(fragments, lang)):
+                metadata["translations"][lang] = translated
+        return fragment_metadata
@@ -1,14 +1,35 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import numpy as np
-import faiss
-import os
 from app.models.ollama_model import OllamaModel
+from app.models.model_router import ModelRouter
 from app.models.gpt_neox_model import GPTNeoXModel
 from app.models.llama_model import LLaMAModel
+from app.config import Config
+from app.services.corpus_store import CorpusStore, SearchFilter
+from app.services.answer_cache import SemanticAnswerCache, AnswerLookup
+from app.services.chunking import load_token_counter
+from app.services.context_compression import ContextCompressor
+from app.models.registry import model_registry, LazyModel
+from app.utils.executors import io_pool, ExecutorSaturatedError
+from app.utils.logger import get_logger
+from app.utils.metrics import metrics
+from app.utils.tracing import span
+
+logger = get_logger(__name__)
+
+DEFAULT_DOC_ID = "default"
+PRELOADED_DOC_ID = "preloaded"
+# Clientes con generación asíncrona y en streaming
+OLLAMA_CLIENTS = (OllamaModel, ModelRouter)
+NO_ANSWER_MESSAGE = "No se pudo generar una respuesta relevante a partir del contexto proporcionado."
+GENERATION_ERROR_MESSAGE = "Ocurrió un error al intentar generar la respuesta."
+# Buckets de los histogramas de tokens del contexto
+TOKEN_BUCKETS = (32, 64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 4096)
 
 
 class QueryService:
-    def __init__(self, index_path: str, model_clients: dict, fragments: list = None, translator=None):
+    def __init__(self, index_path: str, model_clients: dict, fragments: list = None, translator=None,
+                 parent: "QueryService" = None):
         """
         Inicializa el servicio de consultas con FAISS y clientes de modelos.
 
@@ -16,72 +37,154 @@ class QueryService:
         :param model_clients: Diccionario con clientes para modelos generativos.
         :param fragments: Lista de fragmentos pre-cargados (opcional).
         :param translator: Servicio de traducción (opcional).
+        :param parent: Servicio del que se reutilizan el contador de tokens y el compresor de contexto (el de
+                       la colección por defecto, al cargar otra colección).
         """
         self.index_path = index_path
         self.translator = translator
+        self.model_clients = model_clients
 
-        # Cargar o crear el índice FAISS
-        if os.path.exists(index_path):
-            try:
-                self.index = faiss.read_index(index_path)
-                print(f"[DEBUG] Índice cargado desde {index_path} con {self.index.ntotal} vectores.")
-            except Exception as e:
-                print(f"[ERROR] No se pudo cargar el índice desde {index_path}: {e}")
-                self._create_new_index()
-        else:
-            print(f"[INFO] No se encontró el índice en {index_path}. Creando un nuevo índice.")
-            self._create_new_index()
+        # Cargar o crear el corpus (índice FAISS + fragmentos persistidos)
+        self.store = CorpusStore(index_path)
 
-        self.model_clients = model_clients
-        self.fragments = fragments or []
-        print(f"[DEBUG] QueryService inicializado con modelos: {list(model_clients.keys())}")
+        # Caché semántica de respuestas (desactivada con ANSWER_CACHE_SIZE=0)
+        self.answer_cache = None
+        if Config.ANSWER_CACHE_SIZE > 0:
+            self.answer_cache = SemanticAnswerCache(
+                Config.ANSWER_CACHE_SIZE, Config.ANSWER_CACHE_TTL, Config.ANSWER_CACHE_SIMILARITY
+            )
+        # Contador de tokens del LLM para ajustar el contexto del prompt a Config.PROMPT_CONTEXT_TOKENS
+        self.prompt_token_counter = (
+            parent.prompt_token_counter if parent is not None else load_token_counter(Config.PROMPT_TOKENIZER)
+        )
+        # Compresión del contexto tras la recuperación (se activa con CONTEXT_COMPRESSION=True)
+        self.context_compressor = parent.context_compressor if parent is not None else None
+        if Config.CONTEXT_COMPRESSION and parent is None:
+            reranker = LazyModel(model_registry, "reranker") if Config.RERANKER_MODEL else None
+            self.context_compressor = ContextCompressor(self.model_clients["embedding"], reranker)
+        self.context_tokens = {
+            stage: metrics.histogram(
+                "prompt_context_tokens", "Tokens del contexto: fragmentos recuperados y los que llegan al prompt",
+                buckets=TOKEN_BUCKETS, stage=stage,
+            )
+            for stage in ("retrieved", "prompt")
+        }
+        logger.debug(f"QueryService inicializado con modelos: {list(model_clients.keys())}")
+
+        if fragments and PRELOADED_DOC_ID not in self.store.documents:
+            embeddings = self.model_clients["embedding"].encode(fragments, convert_to_tensor=False)
+            self.add_to_index(np.array(embeddings), fragments, doc_id=PRELOADED_DOC_ID)
 
         # Validar sincronización entre índice y fragmentos
         self.validate_and_sync_index()
 
-    def _create_new_index(self):
-        """
-        Crea un nuevo índice FAISS.
-        """
-        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
-        self.index = faiss.IndexFlatL2(384)  # Dimensión del embedding debe ser 384
-        faiss.write_index(self.index, self.index_path)
-        print(f"[INFO] Nuevo índice FAISS creado y guardado en {self.index_path}.")
+    @property
+    def index(self):
+        return self.store.index
 
     def validate_and_sync_index(self):
         """
         Valida si el índice FAISS y los fragmentos están sincronizados.
-        """
-        print(f"[DEBUG] Fragmentos disponibles antes de la sincronización: {len(self.fragments)}")
 
-        if not self.fragments:
-            print("[ERROR] No hay fragmentos disponibles para sincronizar con el índice FAISS.")
+        La comprobación es de solo lectura, sin el bloqueo de escritura del corpus (una ingesta larga en otro worker
+        no retrasa el arranque); solo si hay algo que corregir se toma el bloqueo y se vuelve a comprobar. Solo se
+        re-calculan los embeddings de los fragmentos que faltan en el índice.
+        """
+        # Sin esperar al bloqueo de escritura: si otro proceso está escribiendo, se comprueba la versión cargada
+        self.store.refresh()
+        logger.debug(f"Fragmentos disponibles antes de la sincronización: {len(self.store)}")
+        orphan_ids, missing_ids = self._index_differences()
+        if not orphan_ids and not missing_ids:
+            logger.info("El índice FAISS y los fragmentos están sincronizados.")
             return
 
-        if len(self.fragments) != self.index.ntotal:
-            print(f"[WARNING] Desajuste: {len(self.fragments)} fragmentos, {self.index.ntotal} vectores en índice.")
-            print("[INFO] Reseteando índice y sincronizando con los fragmentos...")
-            try:
-                self.index.reset()
-                embeddings = self.model_clients["embedding"].encode(self.fragments, convert_to_tensor=False)
-                self.add_to_index(np.array(embeddings), self.fragments)
-                print("[INFO] Índice sincronizado correctamente.")
-            except Exception as e:
-                print(f"[ERROR] Fallo al sincronizar el índice: {e}")
-        else:
-            print("[INFO] El índice FAISS y los fragmentos están sincronizados.")
+        # Con varios workers, solo uno a la vez corrige el índice; los demás parten de la versión ya corregida
+        with self.store.writer():
+            orphan_ids, missing_ids = self._index_differences()
+            if orphan_ids:
+                logger.warning(f"{len(orphan_ids)} vectores en el índice sin fragmento asociado. Eliminándolos.")
+                self.store.remove_ids(orphan_ids)
+
+            if missing_ids:
+                logger.warning(f"{len(missing_ids)} fragmentos sin vector en el índice. Re-indexándolos.")
+                try:
+                    texts = [self.store.get_text(fid) for fid in missing_ids]
+                    embeddings = self.model_clients["embedding"].encode(texts, convert_to_tensor=False)
+                    self.store.add_vectors(np.array(embeddings), missing_ids)
+                    logger.info("Índice sincronizado correctamente.")
+                except Exception as e:
+                    logger.error(f"Fallo al sincronizar el índice: {e}")
+
+            if orphan_ids or missing_ids:
+                self.store.save()
+            else:
+                logger.info("El índice FAISS y los fragmentos están sincronizados.")
 
-    def query(self, question: str, k: int = 10, distance_threshold: float = 1.7) -> Tuple[np.ndarray, np.ndarray]:
+    def _index_differences(self) -> Tuple[List[int], List[int]]:
+        """
+        :return: IDs de los vectores del índice sin fragmento y de los fragmentos sin vector en el índice.
+        """
+        indexed_ids = set(self.store.indexed_ids().tolist())
+        stored_ids = set(self.store.fragment_ids().tolist())
+        return sorted(indexed_ids - stored_ids), sorted(stored_ids - indexed_ids)
+
+    def query(self, question: str, k: int = 10, distance_threshold: float = 1.7, nprobe: int = None,
+              ef_search: int = None, search_filter: SearchFilter = None) -> Tuple[np.ndarray, np.ndarray]:
         """
         Realiza una consulta al índice FAISS.
 
         :param question: Pregunta del usuario.
         :param k: Número de fragmentos similares a recuperar.
         :param distance_threshold: Umbral de distancia para filtrar resultados irrelevantes.
+        :param nprobe: Listas invertidas a visitar (solo índices IVF; por defecto `Config.IVF_NPROBE`).
+        :param ef_search: Candidatos a explorar (solo índices HNSW; por defecto `Config.HNSW_EF_SEARCH`).
+        :param search_filter: Filtro de metadatos (documentos, rango de páginas) aplicado durante la búsqueda.
         :return: Distancias e índices de los fragmentos más similares.
         """
-        question_embedding = self.model_clients["embedding"].encode([question])
-        distances, indices = self.index.search(np.array(question_embedding, dtype=np.float32), k)
+        allowed_ids = self.allowed_ids(search_filter)
+        with span("embedding"):
+            question_embedding = self.encode_questions([question])
+        with span("faiss_search"):
+            distances, indices = self.search_embeddings(
+                question_embedding, k, nprobe=nprobe, ef_search=ef_search, allowed_ids=allowed_ids
+            )
+        return self.hybrid_results(question, distances[0], indices[0], k, distance_threshold, allowed_ids)
+
+    def encode_questions(self, questions: List[str]) -> np.ndarray:
+        """
+        Calcula los embeddings de varias preguntas en una sola pasada del modelo.
+        """
+        return np.array(self.model_clients["embedding"].encode(questions), dtype=np.float32)
+
+    def allowed_ids(self, search_filter: Optional[SearchFilter]) -> Optional[np.ndarray]:
+        """
+        IDs de los fragmentos que cumplen el filtro de metadatos, o None si no hay filtro.
+        """
+        if not search_filter:
+            return None
+        return self.store.filter_ids(search_filter)
+
+    def search_embeddings(self, embeddings: np.ndarray, k: int = 10, nprobe: int = None, ef_search: int = None,
+                          allowed_ids: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca varias consultas a la vez en el índice FAISS (una fila por consulta), opcionalmente limitadas a
+        los fragmentos `allowed_ids` (ver `allowed_ids`).
+        """
+        return self.store.search(embeddings, k, nprobe=nprobe, ef_search=ef_search, allowed_ids=allowed_ids)
+
+    def filter_results(self, distances: np.ndarray, indices: np.ndarray,
+                       distance_threshold: float = 1.7) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Filtra los resultados de una consulta por distancia.
+
+        :param distances: Distancias devueltas por FAISS para una consulta.
+        :param indices: IDs devueltos por FAISS para una consulta.
+        :param distance_threshold: Umbral de distancia para filtrar resultados irrelevantes.
+        :return: Distancias e índices válidos.
+        """
+        # Descartar huecos (-1) cuando el índice tiene menos de k vectores
+        found = indices >= 0
+        distances, indices = distances[found][None, :], indices[found][None, :]
 
         # Filtrar resultados por distancia
         valid_indices = [
@@ -90,47 +193,222 @@ class QueryService:
         valid_distances = [d for d in distances[0] if d < distance_threshold]
 
         if not valid_indices:
-            print("[WARNING] No se encontraron fragmentos relevantes. Retornando los más cercanos sin filtrar.")
+            logger.warning("No se encontraron fragmentos relevantes. Retornando los más cercanos sin filtrar.")
             valid_indices = indices[0]
             valid_distances = distances[0]
 
-        print(f"[DEBUG] Distancias originales: {distances}")
-        print(f"[DEBUG] Índices originales: {indices}")
-        print(f"[DEBUG] Distancias válidas: {valid_distances}")
-        print(f"[DEBUG] Índices válidos: {valid_indices}")
+        # Formato diferido: los arrays solo se convierten a texto si el nivel DEBUG está activo
+        logger.debug("Distancias originales: %s, índices originales: %s", distances, indices)
+        logger.debug("Distancias válidas: %s, índices válidos: %s", valid_distances, valid_indices)
 
         return np.array(valid_distances), np.array(valid_indices)
 
-    def get_fragments(self, indices: List[int], target_language: str = "es", distances: List[float] = None) -> List[str]:
+    def hybrid_results(self, question: str, distances: np.ndarray, indices: np.ndarray, k: int = 10,
+                       distance_threshold: float = 1.7,
+                       allowed_ids: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Filtra los resultados vectoriales de una consulta y los fusiona con los del índice léxico BM25
+        mediante reciprocal-rank fusion (RRF).
+
+        :param question: Pregunta (en el idioma de los fragmentos).
+        :param distances: Distancias devueltas por FAISS para la consulta.
+        :param indices: IDs devueltos por FAISS para la consulta.
+        :param k: Número de fragmentos a devolver.
+        :param distance_threshold: Umbral de distancia para filtrar resultados vectoriales irrelevantes.
+        :param allowed_ids: Fragmentos admitidos por el filtro de metadatos (también en BM25; None = todos).
+        :return: Distancias (infinito para los fragmentos encontrados solo por BM25) e IDs, en orden de fusión.
+        """
+        distances, indices = self.filter_results(distances, indices, distance_threshold)
+        if not Config.HYBRID_SEARCH:
+            return distances, indices
+
+        with span("bm25_search"):
+            allowed = set(allowed_ids.tolist()) if allowed_ids is not None else None
+            lexical = self.store.lexical.search(question, k, allowed)
+        if not lexical:
+            return distances, indices
+
+        fused = {}
+        for rank, fragment_id in enumerate(indices.tolist()):
+            fused[fragment_id] = fused.get(fragment_id, 0.0) + 1 / (Config.RRF_K + rank + 1)
+        for rank, (fragment_id, _) in enumerate(lexical):
+            fused[fragment_id] = fused.get(fragment_id, 0.0) + 1 / (Config.RRF_K + rank + 1)
+        order = sorted(fused, key=fused.get, reverse=True)[:k]
+
+        vector_distances = dict(zip(indices.tolist(), distances.tolist()))
+        logger.debug("Fusión RRF: %d resultados vectoriales, %d léxicos, %d finales.", len(indices), len(lexical), len(order))
+        return np.array([vector_distances.get(fid, np.inf) for fid in order]), np.array(order, dtype=np.int64)
+
+    def get_fragments(self, indices: List[int], target_language: str = "es", distances: List[float] = None,
+                      question: str = None) -> List[str]:
         """
         Recupera los fragmentos correspondientes a los índices dados y los traduce al idioma deseado.
 
-        :param indices: Lista de índices de los fragmentos a recuperar.
+        :param indices: Lista de IDs de los fragmentos a recuperar.
         :param target_language: Idioma deseado para los fragmentos.
         :param distances: Distancias asociadas a los índices (opcional).
+        :param question: Pregunta en inglés; si se indica, el contexto se comprime (`ContextCompressor`).
         :return: Lista de fragmentos traducidos.
         """
-        if isinstance(indices, np.ndarray):
-            indices = indices.tolist()
+        questions = [question] if question is not None else None
+        return self.get_fragments_batch([indices], [target_language], [distances], questions)[0]
+
+    def get_fragments_batch(self, indices_batch: List[List[int]], target_languages: List[str],
+                            distances_batch: List[List[float]] = None,
+                            questions: List[str] = None) -> List[List[str]]:
+        """
+        Versión de `get_fragments` para varias consultas: los fragmentos sin traducción precalculada de todas
+        ellas se traducen juntos, con una sola llamada a `translate_batch` por idioma.
 
-        distances = distances if distances is not None and len(distances) > 0 else []
+        Con `questions`, los candidatos de todas las consultas se comprimen juntos antes de traducirlos (así
+        solo se traduce lo que llega al prompt).
 
-        result_fragments = []
-        for idx, distance in zip(indices, distances):
-            if 0 <= idx < len(self.fragments):
-                fragment = self.fragments[idx]
-                print(f"[DEBUG] Fragmento recuperado (índice {idx}, distancia {distance}): {fragment[:200]}...")
+        :param indices_batch: IDs de los fragmentos de cada consulta.
+        :param target_languages: Idioma deseado para cada consulta.
+        :param distances_batch: Distancias de cada consulta (opcional).
+        :param questions: Pregunta en inglés de cada consulta (opcional).
+        :return: Fragmentos (traducidos) de cada consulta.
+        """
+        distances_batch = distances_batch or [None] * len(indices_batch)
+        records_batch = []
+        with span("fragment_fetch"):
+            for indices, distances in zip(indices_batch, distances_batch):
+                if isinstance(indices, np.ndarray):
+                    indices = indices.tolist()
+                distances = distances if distances is not None and len(distances) > 0 else []
+
+                records = []
+                for idx, distance in zip(indices, distances):
+                    record = self.store.get_metadata(idx)
+                    if record is not None:
+                        logger.debug("Fragmento recuperado (índice %s, distancia %s): %.200s...", idx, distance, record["text"])
+                        records.append(record)
+                    else:
+                        logger.warning(f"No existe ningún fragmento con ID {idx}.")
+                records_batch.append(records)
+
+        # Fragmento elegido: registro y texto (el completo, o sus frases relevantes si se han extraído)
+        if questions is not None and self.context_compressor is not None:
+            selections_batch = self.compress_context(questions, records_batch)
+        else:
+            selections_batch = [[(record, record["text"]) for record in records] for records in records_batch]
+            if questions is not None:
+                for selections in selections_batch:
+                    self.observe_context_tokens([text for _, text in selections], [text for _, text in selections])
+
+        results = []
+        pending = {}  # Idioma -> (consulta, posición) de los fragmentos sin traducción precalculada
+        for selections, target_language in zip(selections_batch, target_languages):
+            result_fragments = []
+            for record, fragment in selections:
                 if self.translator and target_language != "en":
-                    try:
-                        fragment = self.translator.to_target(fragment, target_language)
-                    except Exception as e:
-                        print(f"[WARNING] Error al traducir fragmento: {e}")
+                    # Las traducciones precalculadas son del fragmento completo
+                    translated = record.get("translations", {}).get(target_language)
+                    if translated is not None and fragment == record["text"]:
+                        fragment = translated
+                    else:
+                        pending.setdefault(target_language, []).append((len(results), len(result_fragments)))
                 result_fragments.append(fragment)
-            else:
-                print(f"[WARNING] Índice {idx} fuera del rango válido.")
-        
-        return result_fragments
+            results.append(result_fragments)
+
+        # Traducir de una vez (un solo generate con padding por lote) los fragmentos que no estaban pretraducidos
+        for target_language, positions in pending.items():
+            try:
+                with span("translation"):
+                    translated = self.translator.to_target_batch(
+                        [results[query][position] for query, position in positions], target_language
+                    )
+                for (query, position), fragment in zip(positions, translated):
+                    results[query][position] = fragment
+            except Exception as e:
+                logger.warning(f"Error al traducir fragmentos: {e}")
+
+        return results
+
+    def compress_context(self, questions: List[str], records_batch: List[List[dict]]) -> List[List[Tuple[dict, str]]]:
+        """
+        Reduce los fragmentos recuperados de cada consulta a los que llegan al prompt (ver `ContextCompressor`).
+
+        :param questions: Pregunta en inglés de cada consulta.
+        :param records_batch: Registros de los fragmentos recuperados de cada consulta, por relevancia.
+        :return: (registro, texto) de los fragmentos elegidos de cada consulta.
+        """
+        candidates = [[record["text"] for record in records] for records in records_batch]
+        selections_batch = self.context_compressor.compress_batch(questions, candidates)
+
+        results = []
+        for records, texts, selections in zip(records_batch, candidates, selections_batch):
+            selected = [(records[position], text) for position, text in selections]
+            self.observe_context_tokens(texts, [text for _, text in selected])
+            results.append(selected)
+        return results
+
+    def observe_context_tokens(self, retrieved: List[str], prompt: List[str]):
+        """
+        Registra en `/metrics` los tokens del contexto que se enviaría al LLM con los fragmentos recuperados y
+        con los que llegan al prompt (ambos ajustados al presupuesto de `pack_fragments`).
+        """
+        if not retrieved:
+            return
+        for stage, fragments in (("retrieved", retrieved), ("prompt", prompt)):
+            tokens = sum(self.prompt_token_counter(fragment) for fragment in self.pack_fragments(fragments))
+            self.context_tokens[stage].observe(tokens)
+
+    def pack_fragments(self, fragments: List[str], budget: int = None) -> List[str]:
+        """
+        Selecciona, en orden de relevancia, los fragmentos que caben en el presupuesto de tokens del contexto.
+
+        Los fragmentos que no caben se saltan (uno posterior más corto aún puede entrar). El primero se incluye
+        siempre.
+
+        :param fragments: Fragmentos ordenados por relevancia.
+        :param budget: Tokens máximos del contexto (por defecto, `Config.PROMPT_CONTEXT_TOKENS`).
+        :return: Fragmentos seleccionados.
+        """
+        budget = budget or Config.PROMPT_CONTEXT_TOKENS
+        selected, used = [], 0
+        for fragment in fragments:
+            tokens = self.prompt_token_counter(fragment)
+            if selected and used + tokens > budget:
+                continue
+            selected.append(fragment)
+            used += tokens
+        logger.debug("Contexto del prompt: %d de %d fragmentos, ~%d tokens.", len(selected), len(fragments), used)
+        return selected
+
+    def build_prompt(self, fragments: List[str], question: str) -> str:
+        """
+        Construye el prompt para el modelo generativo a partir de los fragmentos relevantes.
+
+        :param fragments: Lista de fragmentos relevantes.
+        :param question: Pregunta del usuario.
+        :return: Prompt completo.
+        """
+        # Crear contexto con los fragmentos relevantes que caben en el presupuesto de tokens
+        context = "\n".join(self.pack_fragments(fragments))
+
+        # Construir el prompt
+        prompt = (
+            f"Contexto del juego:\n{context}\n\n"
+            f"Pregunta: {question}\n\n"
+            "Instrucciones: Responde con información específica basada en el contexto proporcionado. "
+            "Si el contexto no tiene información suficiente, menciona que falta información clara, pero intenta responder lo mejor posible en español."
+        )
+
+        # El prompt completo solo se formatea con el nivel DEBUG activo
+        logger.debug("Prompt enviado al modelo:\n%s", prompt)
+        return prompt
 
+    def _clean_response(self, response) -> str:
+        logger.debug("Respuesta bruta del modelo:\n%s", response)
+
+        # Capturar y procesar la respuesta generada
+        if response and isinstance(response, str):
+            # Si la respuesta contiene contenido válido, la devolvemos directamente
+            return response.strip()
+
+        # Fallback si no se genera una respuesta válida
+        return NO_ANSWER_MESSAGE
 
     def generate_response(self, fragments: List[str], question: str, model_name: str, target_language: str = "es") -> str:
         """
@@ -146,18 +424,7 @@ class QueryService:
             return "No se encontraron fragmentos relevantes para esta pregunta."
 
         try:
-            # Crear contexto con los fragmentos relevantes
-            context = "\n".join(fragments[:5])
-
-            # Construir el prompt
-            prompt = (
-                f"Contexto del juego:\n{context}\n\n"
-                f"Pregunta: {question}\n\n"
-                "Instrucciones: Responde con información específica basada en el contexto proporcionado. "
-                "Si el contexto no tiene información suficiente, menciona que falta información clara, pero intenta responder lo mejor posible en español."
-            )
-
-            print(f"[DEBUG] Prompt enviado al modelo:\n{prompt}")
+            prompt = self.build_prompt(fragments, question)
 
             # Verificar si el modelo está disponible
             model_client = self.model_clients.get(model_name)
@@ -165,81 +432,216 @@ class QueryService:
                 return f"[ERROR] El modelo '{model_name}' no está disponible."
 
             # Generar respuesta usando el cliente del modelo
-            if isinstance(model_client, OllamaModel):
+            if isinstance(model_client, OLLAMA_CLIENTS):
                 response = model_client.generate(prompt=prompt, model_name=model_name)
             else:
-                response = model_client.generate(prompt=prompt)
+                with span("llm_generation"):
+                    response = model_client.generate(prompt=prompt)
 
-            print(f"[DEBUG] Respuesta bruta del modelo:\n{response}")
+            return self._clean_response(response)
 
-            # Capturar y procesar la respuesta generada
-            if response and isinstance(response, str):
-                # Si la respuesta contiene contenido válido, la devolvemos directamente
-                return response.strip()
+        except Exception as e:
+            logger.error(f"Error al generar la respuesta: {e}")
+            return GENERATION_ERROR_MESSAGE
 
-            # Fallback si no se genera una respuesta válida
-            return "No se pudo generar una respuesta relevante a partir del contexto proporcionado."
+    async def agenerate_response(self, fragments: List[str], question: str, model_name: str,
+                                 target_language: str = "es") -> str:
+        """
+        Versión asíncrona de `generate_response`, para no bloquear el event loop.
 
-        except Exception as e:
-            print(f"[ERROR] Error al generar la respuesta: {e}")
-            return "Ocurrió un error al intentar generar la respuesta."
+        Ollama se consulta con su cliente HTTP asíncrono; los clientes sin versión asíncrona se ejecutan
+        en el pool de E/S.
 
+        :param fragments: Lista de fragmentos relevantes.
+        :param question: Pregunta del usuario.
+        :param model_name: Nombre del modelo generativo a utilizar.
+        :param target_language: Idioma deseado para la respuesta.
+        :return: Respuesta generada en el idioma deseado.
+        """
+        if not fragments:
+            return "No se encontraron fragmentos relevantes para esta pregunta."
 
+        try:
+            prompt = self.build_prompt(fragments, question)
 
+            model_client = self.model_clients.get(model_name)
+            if not model_client:
+                return f"[ERROR] El modelo '{model_name}' no está disponible."
 
+            if isinstance(model_client, OLLAMA_CLIENTS):
+                response = await model_client.agenerate(prompt=prompt, model_name=model_name)
+            else:
+                with span("llm_generation"):
+                    response = await io_pool.run(model_client.generate, prompt=prompt)
 
+            return self._clean_response(response)
 
-    def extract_keywords_from_question(self, question: str) -> List[str]:
+        except ExecutorSaturatedError:
+            raise
+        except Exception as e:
+            logger.error(f"Error al generar la respuesta: {e}")
+            return GENERATION_ERROR_MESSAGE
+
+    async def astream_response(self, fragments: List[str], question: str, model_name: str,
+                               target_language: str = "es"):
         """
-        Extrae palabras clave de una pregunta utilizando heurísticas simples.
+        Genera la respuesta en streaming, token a token.
 
+        Los clientes sin streaming producen la respuesta completa como un único token.
+
+        :param fragments: Lista de fragmentos relevantes.
         :param question: Pregunta del usuario.
-        :return: Lista de palabras clave.
+        :param model_name: Nombre del modelo generativo a utilizar.
+        :param target_language: Idioma deseado para la respuesta.
+        :return: Generador asíncrono de tokens.
+        """
+        if not fragments:
+            yield "No se encontraron fragmentos relevantes para esta pregunta."
+            return
+
+        model_client = self.model_clients.get(model_name)
+        if not model_client:
+            yield f"[ERROR] El modelo '{model_name}' no está disponible."
+            return
+
+        prompt = self.build_prompt(fragments, question)
+        if isinstance(model_client, OLLAMA_CLIENTS):
+            async for token in model_client.astream(prompt=prompt, model_name=model_name):
+                yield token
+        else:
+            with span("llm_generation"):
+                response = await io_pool.run(model_client.generate, prompt=prompt)
+            yield self._clean_response(response)
+
+    def lookup_answer(self, question: str, model_name: str, target_language: str = "es",
+                      search_filter: SearchFilter = None) -> AnswerLookup:
         """
-        # Convertir en minúsculas y eliminar puntuaciones simples
-        question = question.lower().replace("¿", "").replace("?", "").strip()
-        stop_words = {"qué", "cuál", "cuáles", "cómo", "cuándo", "dónde", "por", "qué", "es", "la", "el", "los", "las", "de", "un", "una", "para", "y"}
-        keywords = [word for word in question.split() if word not in stop_words]
-        return keywords
+        Busca en la caché semántica una respuesta a una pregunta equivalente.
 
+        La pregunta se codifica tal cual llega (sin traducir), de modo que un acierto evita la traducción,
+        la recuperación y la generación. Las consultas con filtro de metadatos no usan la caché (su respuesta
+        depende del filtro).
 
+        :param question: Pregunta del usuario.
+        :param model_name: Nombre del modelo generativo.
+        :param target_language: Idioma deseado para la respuesta.
+        :param search_filter: Filtro de metadatos de la consulta.
+        :return: Resultado de la búsqueda; se pasa después a `cache_answer` si no hubo acierto.
+        """
+        corpus_version = self.store.version
+        if self.answer_cache is None or search_filter:
+            return AnswerLookup(None, model_name, target_language, corpus_version, None)
+
+        with span("answer_cache_lookup"):
+            embedding = self.encode_questions([question])[0]
+            entry = self.answer_cache.lookup(embedding, model_name, target_language, corpus_version)
+        if entry is not None:
+            logger.debug(f"Respuesta servida desde la caché semántica para: {question}")
+        return AnswerLookup(embedding, model_name, target_language, corpus_version, entry)
+
+    def cache_answer(self, lookup: AnswerLookup, answer: str, fragments: List[str]):
+        """
+        Guarda una respuesta generada en la caché semántica (salvo errores o respuestas vacías).
 
+        :param lookup: Resultado de `lookup_answer` para la pregunta.
+        :param answer: Respuesta generada.
+        :param fragments: Fragmentos recuperados para la pregunta.
+        """
+        if self.answer_cache is None or lookup.embedding is None:
+            return
+        answer = answer.strip()
+        if not answer or answer in (NO_ANSWER_MESSAGE, GENERATION_ERROR_MESSAGE) or answer.startswith(("Error:", "[ERROR]")):
+            return
+        # Si el corpus ha cambiado durante la generación, la respuesta ya no es válida
+        if lookup.corpus_version != self.store.version:
+            return
+        self.answer_cache.store(
+            lookup.embedding, lookup.model_name, lookup.target_language, lookup.corpus_version, answer, fragments
+        )
 
-    def add_to_index(self, embeddings: np.ndarray, fragments: List[str]):
+    def add_to_index(self, embeddings: np.ndarray, fragments: List[str], doc_id: str = DEFAULT_DOC_ID,
+                     fragment_metadata: List[dict] = None, save: bool = True) -> List[int]:
         """
-        Añade embeddings y fragmentos al índice FAISS.
+        Añade embeddings y fragmentos al índice FAISS sin reemplazar el resto del corpus.
 
         :param embeddings: Embeddings generados.
         :param fragments: Fragmentos correspondientes.
+        :param doc_id: Documento al que pertenecen los fragmentos.
+        :param fragment_metadata: Metadatos por fragmento (opcional).
+        :param save: Persistir el corpus tras añadirlos (False durante una ingesta por lotes).
+        :return: IDs asignados a los fragmentos.
         """
-        if embeddings is None or len(embeddings) == 0:
-            raise ValueError("[ERROR] Los embeddings están vacíos. No se pueden agregar al índice FAISS.")
-        if len(embeddings) != len(fragments):
-            raise ValueError("[ERROR] La cantidad de embeddings no coincide con la cantidad de fragmentos.")
+        ids = self.store.append_fragments(doc_id, embeddings, fragments, fragment_metadata, save=save)
+        logger.info(f"Añadidos {len(embeddings)} embeddings al índice.")
+        return ids
 
-        self.index.add(embeddings)
-        self.fragments = fragments
-        faiss.write_index(self.index, self.index_path)
-        print(f"[INFO] Añadidos {len(embeddings)} embeddings al índice.")
+    def add_document(self, doc_id: str, embeddings: np.ndarray, fragments: List[str], metadata: dict = None,
+                     fragment_metadata: List[dict] = None) -> List[int]:
+        """
+        Añade un documento completo al corpus, reemplazando su versión anterior si existe.
+
+        :param doc_id: ID del documento.
+        :param embeddings: Embeddings de los fragmentos.
+        :param fragments: Fragmentos del documento.
+        :param metadata: Metadatos del documento.
+        :param fragment_metadata: Metadatos por fragmento (opcional).
+        :return: IDs asignados a los fragmentos.
+        """
+        ids = self.store.add_document(doc_id, embeddings, fragments, metadata, fragment_metadata)
+        logger.info(f"Documento '{doc_id}' indexado con {len(ids)} fragmentos.")
+        return ids
+
+    def delete_document(self, doc_id: str) -> int:
+        """
+        Elimina un documento del corpus.
+
+        :param doc_id: ID del documento.
+        :return: Número de fragmentos eliminados.
+        """
+        removed = self.store.delete_document(doc_id)
+        logger.info(f"Documento '{doc_id}' eliminado ({removed} fragmentos).")
+        return removed
+
+    def close(self):
+        """
+        Deja de vigilar el índice en disco (al descargar la colección de memoria).
+        """
+        self.store.close()
 
-    def inspect_index(self):
+    def list_documents(self) -> List[dict]:
+        """
+        Lista los documentos presentes en el corpus.
+        """
+        return self.store.list_documents()
+
+    def inspect_index(self) -> dict:
         """
         Inspecciona el estado del índice FAISS.
+
+        :return: Estadísticas del corpus (`CorpusStore.stats`), o un diccionario vacío si no hay índice.
         """
         if not hasattr(self, "index") or self.index is None:
-            print("[ERROR] Índice FAISS no inicializado.")
-        else:
-            print(f"[INFO] El índice FAISS contiene {self.index.ntotal} vectores.")
+            logger.error("Índice FAISS no inicializado.")
+            return {}
+        logger.info(f"El índice FAISS contiene {self.index.ntotal} vectores de {len(self.store.documents)} documentos.")
+        return self.store.stats()
 
-    def test_query(self, query: str, k: int = 5):
-        """
-        Realiza una prueba directa al índice FAISS con una consulta específica.
+    def test_query(self, query: str, k: int = 5) -> List[dict]:
         """
-        question_embedding = self.model_clients["embedding"].encode([query])
-        distances, indices = self.index.search(np.array(question_embedding, dtype=np.float32), k)
-        print(f"[DEBUG] Distancias: {distances}")
-        print(f"[DEBUG] Índices: {indices}")
+        Realiza una prueba directa al índice FAISS con una consulta específica (sin BM25, traducción ni generación).
 
-        for idx in indices[0]:
-            if idx < len(self.fragments):
-                print(f"[DEBUG] Fragmento devuelto (índice {idx}): {self.fragments[idx][:200]}...")
+        :return: ID, distancia y texto de cada fragmento devuelto.
+        """
+        with span("embedding"):
+            question_embedding = self.encode_questions([query])
+        with span("faiss_search"):
+            distances, indices = self.store.search(question_embedding, k)
+        logger.debug("Distancias: %s, índices: %s", distances, indices)
+
+        results = []
+        for idx, distance in zip(indices[0].tolist(), distances[0].tolist()):
+            fragment = self.store.get_text(idx) if idx >= 0 else None
+            if fragment is not None:
+                logger.debug("Fragmento devuelto (índice %s): %.200s...", idx, fragment)
+                results.append({"id": idx, "distance": distance, "text": fragment})
+        return results
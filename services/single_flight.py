@@ -0,0 +1,185 @@
+import asyncio
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Tuple
+from app.utils.metrics import metrics
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """
+    Forma canónica de una pregunta para detectar duplicados: sin mayúsculas ni espacios sobrantes.
+    """
+    return re.sub(r"\s+", " ", question).strip().casefold()
+
+
+class Broadcast:
+    def __init__(self, source: AsyncIterator, on_finish: Callable[["Broadcast"], None] = None):
+        """
+        Reparte los eventos de un generador asíncrono entre varios suscriptores.
+
+        El generador se consume una sola vez en su propia tarea. Cada suscriptor recibe primero los eventos ya
+        emitidos y después los siguientes según llegan. Si todos los suscriptores se van antes de que termine,
+        se cancela la tarea (y con ella, p. ej., la generación en Ollama).
+
+        :param source: Generador asíncrono de eventos.
+        :param on_finish: Función que se llama una vez, cuando el reparto termina o se cancela.
+        """
+        self.events = []
+        self.finished = False
+        self.error = None
+        self.subscribers = 0
+        self._on_finish = on_finish
+        self._updated = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        self._started = self.loop.create_future()
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator):
+        try:
+            async for event in source:
+                self.events.append(event)
+                if not self._started.done():
+                    self._started.set_result(None)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            await source.aclose()
+            self.finished = True
+            if not self._started.done():
+                if self.error is not None and not isinstance(self.error, asyncio.CancelledError):
+                    self._started.set_exception(self.error)
+                else:
+                    self._started.set_result(None)
+            self._notify()
+            self._finish()
+
+    def _notify(self):
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    def _finish(self):
+        if self._on_finish is not None:
+            on_finish, self._on_finish = self._on_finish, None
+            on_finish(self)
+
+    async def started(self):
+        """
+        Espera al primer evento. Si el generador falla antes de emitir ninguno, lanza su excepción, de modo que
+        los errores previos a la respuesta (p. ej. un pool saturado) se pueden devolver como error HTTP.
+        """
+        await asyncio.shield(self._started)
+
+    def subscribe(self) -> AsyncIterator:
+        """
+        Eventos del reparto desde el principio. El suscriptor cuenta desde esta llamada (no desde que empieza a
+        leer): si se empieza a leer, cerrar el generador (`aclose`) lo da de baja; si se abandona sin leer ningún
+        evento, hay que llamar a `unsubscribe`.
+        """
+        self.subscribers += 1
+        return self._follow()
+
+    def unsubscribe(self):
+        """
+        Da de baja a un suscriptor. Si era el último y el reparto sigue en curso, se deja de generar.
+        """
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.finished:
+            # Nadie escucha ya: se deja de generar y no se aceptan más suscriptores
+            self._finish()
+            self._task.cancel()
+
+    async def _follow(self) -> AsyncIterator:
+        position = 0
+        try:
+            while True:
+                updated = self._updated
+                while position < len(self.events):
+                    yield self.events[position]
+                    position += 1
+                if self.finished:
+                    if self.error is not None and not isinstance(self.error, asyncio.CancelledError):
+                        raise self.error
+                    return
+                await updated.wait()
+        finally:
+            self.unsubscribe()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        """
+        Deduplicación de trabajo en curso ("single flight"): las peticiones concurrentes con la misma clave se
+        unen al cálculo que ya está en marcha y comparten su resultado, en lugar de repetirlo.
+
+        Solo agrupa peticiones simultáneas del mismo proceso; los resultados no se guardan al terminar (para eso
+        está la caché semántica de respuestas).
+
+        :param name: Nombre del grupo, usado como etiqueta de los contadores de `/metrics`.
+        """
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, Broadcast] = {}
+        self.leaders = metrics.counter(
+            "single_flight_leaders_total", "Cálculos iniciados (peticiones no agrupadas)", group=name
+        )
+        self.coalesced = metrics.counter(
+            "single_flight_coalesced_total", "Peticiones unidas a un cálculo idéntico en curso", group=name
+        )
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]) -> Tuple[Any, bool]:
+        """
+        Devuelve el resultado de `fn()`, o el del cálculo en curso con la misma clave.
+
+        El cálculo se ejecuta en su propia tarea: si la petición que lo inició se cancela, las demás siguen
+        esperando su resultado. Si falla, todas reciben la excepción.
+
+        :return: Resultado (compartido: no hay que modificarlo) y si la petición se unió a un cálculo ajeno.
+        """
+        task = self._calls.get(key)
+        # Un cálculo de otro event loop (p. ej. otro cliente de pruebas) no se puede esperar desde este
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(self._calls, key, done))
+            self.leaders.inc()
+            shared = False
+        else:
+            self.coalesced.inc()
+            shared = True
+            logger.debug(f"Petición agrupada con un cálculo en curso ({self.name}).")
+        return await asyncio.shield(task), shared
+
+    def stream(self, key: Hashable, source_factory: Callable[[], AsyncIterator]) -> Tuple[Broadcast, bool]:
+        """
+        Devuelve el reparto en curso con la misma clave, o uno nuevo sobre `source_factory()`. Los suscriptores
+        que llegan tarde reciben primero los eventos (p. ej. tokens) ya emitidos.
+
+        :return: Reparto y si la petición se unió a uno ajeno.
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None or broadcast.loop is not asyncio.get_running_loop():
+            broadcast = Broadcast(source_factory(), on_finish=lambda done: self._forget(self._streams, key, done))
+            self._streams[key] = broadcast
+            self.leaders.inc()
+            return broadcast, False
+        self.coalesced.inc()
+        logger.debug(f"Stream agrupado con uno en curso ({self.name}).")
+        return broadcast, True
+
+    @staticmethod
+    def _forget(calls: dict, key: Hashable, call):
+        if calls.get(key) is call:
+            del calls[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders.value,
+            "coalesced": self.coalesced.value,
+        }
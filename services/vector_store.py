@@ -0,0 +1,213 @@
+import os
+import threading
+from typing import Iterable, List, Tuple
+import numpy as np
+from app.utils.generations import generation_path, latest_generation, remove_older_generations, write_table
+
+
+class VectorStore:
+    def __init__(self, base_path: str, dimension: int):
+        """
+        Vectores float32 exactos de los fragmentos, en disco y mapeados en memoria.
+
+        Sirven para re-ordenar con la distancia exacta los candidatos de un índice cuantizado (SQ/PQ), que solo
+        guarda versiones aproximadas de los vectores. Los vectores se añaden al final de `<base>.vectors.f32`
+        (una fila por vector) y una tabla ordenada por ID con (id, fila) en `<base>.vectors.idx.npy` los localiza.
+        Solo se leen las filas de los candidatos de cada búsqueda, así que no necesitan estar en RAM.
+
+        Al compactar, los vectores vivos se escriben en un archivo de una generación nueva
+        (`<base>.vectors.<n>.f32`, con su tabla `<base>.vectors.<n>.idx.npy`), que solo pasa a usarse al publicar su
+        tabla con un único rename.
+
+        :param base_path: Ruta base (sin extensión) de los archivos del almacén.
+        :param dimension: Dimensión de los vectores.
+        """
+        self._prefix = base_path + ".vectors"
+        self._set_generation(0)
+        self.dimension = dimension
+        self._table = np.empty((0, 2), dtype=np.int64)
+        self._data = None
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """
+        Abre la tabla de filas y el archivo de vectores (ambos mapeados en memoria).
+        """
+        with self._lock:
+            self._set_generation(latest_generation(self._prefix, ".idx.npy"))
+            if os.path.exists(self.table_path):
+                self._table = np.load(self.table_path, mmap_mode="r")
+            else:
+                self._table = np.empty((0, 2), dtype=np.int64)
+            self._open_data()
+
+    def _set_generation(self, generation: int):
+        self.generation = generation
+        self.data_path = generation_path(self._prefix, ".f32", generation)
+        self.table_path = generation_path(self._prefix, ".idx.npy", generation)
+
+    def _open_data(self):
+        self._data = None
+        rows = self._rows_on_disk()
+        if rows:
+            self._data = np.memmap(self.data_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+
+    def _rows_on_disk(self) -> int:
+        if not os.path.exists(self.data_path):
+            return 0
+        return os.path.getsize(self.data_path) // (4 * self.dimension)
+
+    def save(self):
+        """
+        Persiste la tabla de filas (archivo temporal + rename). Compacta el archivo de vectores si más de la
+        mitad de sus filas son de fragmentos borrados.
+        """
+        with self._lock:
+            os.makedirs(os.path.dirname(self.table_path) or ".", exist_ok=True)
+            if self._rows_on_disk() > 2 * len(self._table):
+                self._compact()
+            else:
+                write_table(self.table_path, self._table)
+
+    def remove_obsolete(self):
+        """
+        Borra los archivos de las generaciones anteriores a la actual (cuando ya no los referencia ninguna versión
+        publicada del corpus).
+        """
+        remove_older_generations(self._prefix, (".f32", ".idx.npy"), self.generation)
+
+    def _compact(self):
+        """
+        Copia las filas vivas al archivo de vectores de una generación nueva y publica su tabla.
+
+        El archivo nuevo no lo referencia nada hasta que se publica la tabla (un único rename); los de la generación
+        anterior se conservan hasta `remove_obsolete`.
+        """
+        generation = self.generation + 1
+        data_path = generation_path(self._prefix, ".f32", generation)
+        table = np.array(self._table)
+        with open(data_path, "wb") as f:
+            for start in range(0, len(table), 65536):
+                f.write(np.ascontiguousarray(self._vectors(table[start:start + 65536, 1])).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        table[:, 1] = np.arange(len(table), dtype=np.int64)
+        write_table(generation_path(self._prefix, ".idx.npy", generation), table)
+        self._set_generation(generation)
+        self._table = table
+        self._open_data()
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def _vectors(self, rows: np.ndarray) -> np.ndarray:
+        if len(rows) and (self._data is None or int(rows.max()) >= len(self._data)):
+            # El archivo ha crecido desde que se mapeó.
+            self._open_data()
+        return self._data[rows] if len(rows) else np.empty((0, self.dimension), dtype=np.float32)
+
+    def append(self, fragment_ids: List[int], vectors: np.ndarray) -> np.ndarray:
+        """
+        Añade los vectores de fragmentos que todavía no están en el almacén.
+
+        :return: Filas añadidas a la tabla (id, fila), para el log de escritura del corpus.
+        """
+        if not len(fragment_ids):
+            return np.empty((0, 2), dtype=np.int64)
+        with self._lock:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+            os.makedirs(os.path.dirname(self.data_path) or ".", exist_ok=True)
+            with open(self.data_path, "ab") as f:
+                first_row = f.tell() // (4 * self.dimension)
+                f.write(vectors.tobytes())
+            rows = np.column_stack((
+                np.asarray(fragment_ids, dtype=np.int64),
+                np.arange(first_row, first_row + len(vectors), dtype=np.int64),
+            ))
+            self._insert(rows)
+            return rows
+
+    def _insert(self, rows: np.ndarray):
+        table = np.concatenate((np.asarray(self._table), rows))
+        if len(self._table) and int(rows[0, 0]) <= int(self._table[-1, 0]):
+            # Resincronización: IDs anteriores a los existentes
+            table = table[np.argsort(table[:, 0], kind="stable")]
+        self._table = table
+
+    def add_rows(self, rows: np.ndarray) -> int:
+        """
+        Añade a la tabla filas de vectores que ya están en el archivo (al reaplicar el log de escritura del
+        corpus). Las de IDs que ya están en la tabla se ignoran.
+
+        :return: Número de filas añadidas.
+        """
+        with self._lock:
+            rows = np.asarray(rows, dtype=np.int64).reshape(-1, 2)
+            rows = rows[~np.isin(rows[:, 0], self._table[:, 0])]
+            if len(rows):
+                self._insert(rows[np.argsort(rows[:, 0], kind="stable")])
+            return len(rows)
+
+    def sync(self):
+        """
+        Fuerza la escritura en disco de los vectores añadidos al archivo.
+        """
+        if os.path.exists(self.data_path):
+            fd = os.open(self.data_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def remove(self, fragment_ids: Iterable[int]) -> int:
+        """
+        Elimina vectores de la tabla. Su espacio se recupera al compactar.
+        """
+        with self._lock:
+            keep = ~np.isin(self._table[:, 0], np.asarray(list(fragment_ids), dtype=np.int64))
+            removed = int((~keep).sum())
+            if removed:
+                self._table = np.asarray(self._table)[keep]
+            return removed
+
+    def get(self, fragment_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Devuelve los vectores exactos de los IDs dados.
+
+        :return: Máscara de los IDs encontrados y sus vectores (solo los encontrados, en el mismo orden).
+        """
+        with self._lock:
+            fragment_ids = np.asarray(fragment_ids, dtype=np.int64)
+            ids = self._table[:, 0]
+            if not len(ids):
+                return np.zeros(len(fragment_ids), dtype=bool), np.empty((0, self.dimension), dtype=np.float32)
+            positions = np.minimum(np.searchsorted(ids, fragment_ids), len(ids) - 1)
+            found = ids[positions] == fragment_ids
+            return found, np.asarray(self._vectors(np.asarray(self._table[positions[found], 1])))
+
+    def rerank(self, queries: np.ndarray, distances: np.ndarray, ids: np.ndarray,
+               k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Re-ordena los candidatos de un índice cuantizado con la distancia L2 exacta y se queda con los `k` mejores.
+        Los candidatos sin vector guardado conservan su distancia aproximada.
+
+        :param queries: Embeddings de consulta.
+        :param distances: Distancias aproximadas de los candidatos (una fila por consulta).
+        :param ids: IDs de los candidatos (-1 si no hay).
+        :param k: Número de resultados por consulta.
+        :return: Distancias e IDs de los `k` mejores (-1 si no hay).
+        """
+        top_distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        top_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, query in enumerate(queries):
+            valid = ids[row] >= 0
+            candidate_ids = ids[row][valid]
+            candidate_distances = distances[row][valid].astype(np.float32)
+            found, vectors = self.get(candidate_ids)
+            if found.any():
+                candidate_distances[found] = ((vectors - query) ** 2).sum(axis=1)
+            order = np.argsort(candidate_distances, kind="stable")[:k]
+            top_distances[row, :len(order)] = candidate_distances[order]
+            top_ids[row, :len(order)] = candidate_ids[order]
+        return top_distances, top_ids
@@ -0,0 +1,167 @@
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import List, Optional, Tuple
+import numpy as np
+from app.config import Config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Cabecera de cada registro: longitud del contenido y su CRC32
+_HEADER = struct.Struct("<II")
+# Dentro del contenido: longitud del JSON de la operación, seguida de los vectores float32 (si los hay)
+_JSON_LENGTH = struct.Struct("<I")
+
+# Operación del log con sus vectores (o None)
+Entry = Tuple[dict, Optional[np.ndarray]]
+
+
+class WriteAheadLog:
+    def __init__(self, path: str, dimension: int, fsync: bool = None):
+        """
+        Log de solo-añadir con las modificaciones del corpus posteriores a la última instantánea en disco.
+
+        Cada operación se escribe como un registro `<longitud><crc32><json><vectores>` al final del archivo. Las
+        operaciones de una modificación (p. ej. todos los lotes de una ingesta) se confirman juntas con un registro
+        `commit` y un solo `fsync` (`commit`), así que el coste de una escritura depende del lote, no del corpus.
+
+        Al leer el log (`read`) solo se devuelven las transacciones completas: un registro truncado o con un CRC
+        que no cuadra (escritura interrumpida) y todo lo que le sigue se descartan.
+
+        Las escrituras se serializan con el bloqueo de escritura del corpus; el archivo se abre con `O_APPEND`, así
+        que varios procesos pueden añadir registros por turnos.
+
+        :param path: Ruta del archivo del log.
+        :param dimension: Dimensión de los vectores.
+        :param fsync: Sincronizar el log con el disco en cada `commit` (por defecto, `Config.WAL_FSYNC`).
+        """
+        self.path = path
+        self.dimension = dimension
+        self.fsync = Config.WAL_FSYNC if fsync is None else fsync
+        self.seq = 0  # Número de la última operación escrita o leída
+        self.committed_size = 0  # Bytes del log hasta el último commit conocido por este proceso
+        self.pending = 0  # Operaciones escritas desde el último commit
+        self.commits = 0
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def _descriptor(self) -> int:
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fd
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def append(self, operation: dict, vectors: np.ndarray = None):
+        """
+        Añade una operación al log (sin sincronizar todavía con el disco).
+
+        :param operation: Operación (serializable como JSON).
+        :param vectors: Vectores de la operación (una fila por vector).
+        """
+        with self._lock:
+            self.seq += 1
+            body = json.dumps({**operation, "seq": self.seq}, ensure_ascii=False).encode("utf-8")
+            payload = _JSON_LENGTH.pack(len(body)) + body
+            if vectors is not None:
+                payload += np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+            record = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+            fd = self._descriptor()
+            written = 0
+            while written < len(record):
+                written += os.write(fd, record[written:])
+            self.pending += 1
+
+    def commit(self) -> bool:
+        """
+        Confirma las operaciones escritas desde el último commit, con un único `fsync`.
+
+        :return: False si no había nada que confirmar.
+        """
+        if not self.pending:
+            return False
+        self.append({"op": "commit"})
+        with self._lock:
+            if self.fsync:
+                os.fsync(self._fd)
+            self.committed_size = os.fstat(self._fd).st_size
+            self.pending = 0
+            self.commits += 1
+        return True
+
+    def discard_uncommitted(self):
+        """
+        Elimina del final del log los registros sin confirmar de otro proceso que terminó a mitad de una
+        modificación (con el bloqueo de escritura tomado, antes de añadir registros nuevos).
+        """
+        with self._lock:
+            if self.pending or self.size() <= self.committed_size:
+                return
+            logger.warning(f"Descartando {self.size() - self.committed_size} bytes sin confirmar del log {self.path}.")
+            os.truncate(self.path, self.committed_size)
+
+    def reset(self):
+        """
+        Vacía el log (sus operaciones ya están en la instantánea recién guardada).
+        """
+        with self._lock:
+            if os.path.exists(self.path):
+                os.truncate(self.path, 0)
+            self.committed_size = 0
+            self.pending = 0
+
+    def read(self, after_seq: int = 0, offset: int = 0) -> Tuple[List[List[Entry]], int, int]:
+        """
+        Lee las transacciones confirmadas del log.
+
+        :param after_seq: Omitir las transacciones confirmadas hasta esta operación (ya aplicadas).
+        :param offset: Empezar a leer en esta posición (el final de la última transacción ya leída).
+        :return: Operaciones de cada transacción posterior a `after_seq`, bytes del log hasta el último commit y
+                 número de la última operación confirmada.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0, after_seq
+
+        transactions, current = [], []
+        position, committed, last_seq = 0, 0, after_seq
+        while position + _HEADER.size <= len(data):
+            length, checksum = _HEADER.unpack_from(data, position)
+            start, end = position + _HEADER.size, position + _HEADER.size + length
+            if end > len(data) or zlib.crc32(data[start:end]) != checksum:
+                break
+            (json_length,) = _JSON_LENGTH.unpack_from(data, start)
+            body_end = start + _JSON_LENGTH.size + json_length
+            operation = json.loads(data[start + _JSON_LENGTH.size:body_end].decode("utf-8"))
+            vectors = None
+            if end > body_end:
+                vectors = np.frombuffer(data[body_end:end], dtype=np.float32).reshape(-1, self.dimension)
+            position = end
+            if operation["op"] != "commit":
+                current.append((operation, vectors))
+                continue
+            if operation["seq"] > after_seq:
+                transactions.append(current)
+            current, committed, last_seq = [], position, max(last_seq, operation["seq"])
+
+        if committed < len(data):
+            # Modificación en curso de otro proceso, o interrumpida (se descarta con `discard_uncommitted`)
+            logger.debug(f"El log {self.path} termina con {len(data) - committed} bytes sin confirmar.")
+        return transactions, offset + committed, last_seq
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
@@ -0,0 +1,84 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from app.config import Config
+
+
+class ExecutorSaturatedError(Exception):
+    """
+    Se lanza cuando un pool no admite más trabajo; las rutas la convierten en un 503.
+    """
+    def __init__(self, pool_name: str):
+        super().__init__(f"El pool '{pool_name}' está saturado. Inténtalo de nuevo más tarde.")
+        self.pool_name = pool_name
+
+
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        """
+        Pool de hilos con cola acotada para sacar trabajo bloqueante del event loop.
+
+        Como mucho `max_workers` tareas se ejecutan a la vez y `max_queue` esperan; por encima de eso
+        `run` lanza `ExecutorSaturatedError` en lugar de encolar sin límite (backpressure).
+
+        :param name: Nombre del pool (para errores y estadísticas).
+        :param max_workers: Hilos del pool.
+        :param max_queue: Tareas que pueden esperar a un hilo libre.
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._pending = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Encola `fn(*args, **kwargs)` en el pool y devuelve su `Future` (para trabajos en segundo plano).
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturatedError(self.name)
+            self._pending += 1
+        try:
+            # La tarea se ejecuta con el contexto de quien la encola (p. ej. la traza de la petición)
+            future = self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: Future = None):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Ejecuta `fn(*args, **kwargs)` en el pool y espera su resultado sin bloquear el event loop.
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "pending": self._pending,
+                "rejected": self._rejected,
+            }
+
+
+# Inferencia en CPU: traducción, embeddings y búsquedas FAISS
+inference_pool = BoundedExecutor("inference", Config.INFERENCE_POOL_WORKERS, Config.INFERENCE_POOL_QUEUE)
+# Procesamiento de PDFs, separado para que las subidas no dejen sin hilos a las consultas
+ingestion_pool = BoundedExecutor("ingestion", Config.INGESTION_POOL_WORKERS, Config.INGESTION_POOL_QUEUE)
+# Llamadas de red bloqueantes de clientes sin versión asíncrona
+io_pool = BoundedExecutor("io", Config.IO_POOL_WORKERS, Config.IO_POOL_QUEUE)
+
+
+def pool_stats() -> dict:
+    return {pool.name: pool.stats() for pool in (inference_pool, ingestion_pool, io_pool)}
@@ -0,0 +1,68 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, el bloqueo solo protege dentro del proceso
+    fcntl = None
+
+
+class FileLock:
+    def __init__(self, path: str):
+        """
+        Bloqueo entre procesos con `flock` sobre un archivo (compartido o exclusivo), reentrante dentro del proceso.
+
+        Los hilos del mismo proceso se excluyen entre sí; entre procesos, los bloqueos compartidos son compatibles
+        entre ellos y el exclusivo excluye a todos. Un bloqueo anidado conserva el modo del más externo.
+
+        :param path: Ruta del archivo de bloqueo (se crea si no existe).
+        """
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self, shared: bool = False, blocking: bool = True) -> bool:
+        """
+        Adquiere el bloqueo. Con `blocking=False` devuelve False si otro hilo o proceso lo tiene.
+        """
+        if not self._thread_lock.acquire(blocking=blocking):
+            return False
+        if self._depth == 0 and fcntl is not None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            try:
+                fcntl.flock(fd, flags if blocking else flags | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                self._thread_lock.release()
+                return False
+            self._fd = fd
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    @contextmanager
+    def shared(self):
+        self.acquire(shared=True)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def exclusive(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,63 @@
+import os
+import re
+from typing import Iterable
+import numpy as np
+
+
+def generation_path(prefix: str, suffix: str, generation: int) -> str:
+    """
+    Ruta de un archivo de una generación: `<prefix>.<generación><suffix>`. La generación 0 conserva el nombre sin
+    número (`<prefix><suffix>`), el de los archivos creados antes de que existieran las generaciones.
+    """
+    return f"{prefix}.{generation}{suffix}" if generation else prefix + suffix
+
+
+def _generations(prefix: str, suffix: str) -> dict:
+    """
+    Generaciones con archivo en disco -> ruta del archivo.
+    """
+    directory, name = os.path.split(prefix)
+    pattern = re.compile(re.escape(name) + r"(?:\.(\d+))?" + re.escape(suffix) + "$")
+    found = {}
+    try:
+        entries = os.listdir(directory or ".")
+    except FileNotFoundError:
+        return found
+    for entry in entries:
+        match = pattern.match(entry)
+        if match:
+            found[int(match.group(1) or 0)] = os.path.join(directory, entry)
+    return found
+
+
+def latest_generation(prefix: str, suffix: str) -> int:
+    """
+    Última generación publicada: la mayor con archivo `<prefix>.<generación><suffix>` en disco (0 si no hay).
+    """
+    return max(_generations(prefix, suffix), default=0)
+
+
+def remove_older_generations(prefix: str, suffixes: Iterable[str], generation: int):
+    """
+    Borra los archivos de las generaciones anteriores a `generation` (ya sustituidos por los de esa generación).
+    """
+    for suffix in suffixes:
+        for older, path in _generations(prefix, suffix).items():
+            if older < generation:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def write_table(path: str, table: np.ndarray):
+    """
+    Escribe una tabla `.npy` de forma atómica (archivo temporal sincronizado con el disco + rename). Publicar la
+    tabla de una generación nueva es lo que la hace visible.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.asarray(table))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
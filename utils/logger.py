@@ -0,0 +1,59 @@
+import json
+import logging
+import sys
+import threading
+from app.config import Config
+
+# Atributos propios de `logging.LogRecord`; el resto llega por `extra=` y se incluye en el JSON
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Una línea JSON por registro: marca de tiempo, nivel, logger, mensaje y los campos pasados con `extra=`.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: str = None, fmt: str = None):
+    """
+    Configura el logger `app` (del que cuelgan los de todos los módulos): nivel y formato `text` o `json`.
+
+    :param level: Nivel mínimo (por defecto, `Config.LOG_LEVEL`).
+    :param fmt: Formato de salida (por defecto, `Config.LOG_FORMAT`).
+    """
+    global _configured
+    with _configure_lock:
+        root = logging.getLogger("app")
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        handler = logging.StreamHandler(sys.stderr)
+        if (fmt or Config.LOG_FORMAT) == "json":
+            handler.setFormatter(JsonFormatter())
+        else:
+            handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+        root.addHandler(handler)
+        root.setLevel((level or Config.LOG_LEVEL).upper())
+        root.propagate = False
+        _configured = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Devuelve el logger de un módulo (`get_logger(__name__)`), configurando el logger `app` la primera vez.
+    """
+    if not _configured:
+        configure_logging()
+    return logging.getLogger(name)
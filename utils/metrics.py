@@ -0,0 +1,161 @@
+import bisect
+import threading
+from typing import Dict, List, Sequence, Union
+
+# Buckets por defecto para latencias, en segundos
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, description: str = "", buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labels: Dict[str, str] = None):
+        """
+        Histograma acumulativo sencillo y seguro entre hilos.
+
+        :param name: Nombre de la métrica.
+        :param description: Descripción de la métrica.
+        :param buckets: Límites superiores de los buckets.
+        :param labels: Etiquetas fijas de la serie (p. ej. `{"stage": "embedding"}`).
+        """
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+            self._max = max(self._max, value)
+
+    def snapshot(self) -> dict:
+        """
+        Devuelve el estado del histograma: recuento, suma, media, máximo y recuentos acumulados por bucket.
+        """
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets, self._counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = self._count
+            return {
+                "count": self._count,
+                "sum": self._sum,
+                "mean": self._sum / self._count if self._count else 0.0,
+                "max": self._max,
+                "buckets": buckets,
+            }
+
+    def render(self) -> List[str]:
+        """
+        Líneas de la serie en el formato de texto de Prometheus (sin las cabeceras HELP/TYPE).
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for bound, count in snapshot["buckets"].items():
+            lines.append(f"{self.name}_bucket{_format_labels({**self.labels, 'le': bound})} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels)} {snapshot['sum']}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels)} {snapshot['count']}")
+        return lines
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, description: str = "", labels: Dict[str, str] = None):
+        """
+        Contador monótono seguro entre hilos.
+
+        :param name: Nombre de la métrica (por convención, terminado en `_total`).
+        :param description: Descripción de la métrica.
+        :param labels: Etiquetas fijas de la serie.
+        """
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {self._value}"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Registro de las métricas del proceso, expuestas en `GET /metrics`.
+
+        Cada serie se identifica por su nombre y sus etiquetas; pedir dos veces la misma devuelve el mismo objeto.
+        """
+        self._series: Dict[tuple, Union[Histogram, Counter]] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, description: str = "", buckets: Sequence[float] = LATENCY_BUCKETS,
+                  **labels) -> Histogram:
+        """
+        Devuelve el histograma con ese nombre y etiquetas, creándolo si no existe.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._series.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._series.setdefault(key, Histogram(name, description, buckets, labels))
+        return histogram
+
+    def counter(self, name: str, description: str = "", **labels) -> Counter:
+        """
+        Devuelve el contador con ese nombre y etiquetas, creándolo si no existe.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        counter = self._series.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._series.setdefault(key, Counter(name, description, labels))
+        return counter
+
+    def render(self) -> str:
+        """
+        Todas las series en el formato de texto de Prometheus, agrupadas por métrica.
+        """
+        with self._lock:
+            series = list(self._series.values())
+        by_name: Dict[str, list] = {}
+        for metric in series:
+            by_name.setdefault(metric.name, []).append(metric)
+        lines = []
+        for name in sorted(by_name):
+            lines.append(f"# HELP {name} {by_name[name][0].description}")
+            lines.append(f"# TYPE {name} {by_name[name][0].type}")
+            for metric in by_name[name]:
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Métricas compartidas por todos los servicios del proceso
+metrics = MetricsRegistry()
@@ -0,0 +1,112 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+from app.utils.metrics import metrics
+
+# Histogramas de latencia por etapa (etiqueta `stage`)
+QUERY_STAGE_METRIC = "query_stage_seconds"
+INGESTION_STAGE_METRIC = "ingestion_stage_seconds"
+_DESCRIPTIONS = {
+    QUERY_STAGE_METRIC: "Latencia de cada etapa de una consulta",
+    INGESTION_STAGE_METRIC: "Latencia de cada etapa de la ingesta de un PDF",
+}
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    def __init__(self):
+        """
+        Traza de una petición: las etapas por las que pasa, con su inicio relativo y su duración.
+        """
+        self.started_at = time.perf_counter()
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, start: float, duration: float):
+        with self._lock:
+            self._spans.append({
+                "stage": stage,
+                "start_ms": round((start - self.started_at) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+            })
+
+    def to_dict(self) -> dict:
+        """
+        Duración total hasta ahora y etapas ordenadas por inicio (lo que se devuelve con `trace=true`).
+        """
+        with self._lock:
+            spans = sorted(self._spans, key=lambda span: span["start_ms"])
+        return {"total_ms": round((time.perf_counter() - self.started_at) * 1000, 3), "spans": spans}
+
+
+def begin_trace(enabled: bool = True) -> Optional[Trace]:
+    """
+    Empieza (o desactiva, con `enabled=False`) la traza de la petición actual.
+
+    Cada petición se atiende en su propia tarea de asyncio, con su propio contexto, así que la traza no se
+    mezcla con la de otras peticiones. Los pools de hilos copian el contexto (`BoundedExecutor.submit`), de
+    modo que las etapas que se ejecutan en ellos también se añaden.
+    """
+    trace = Trace() if enabled else None
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace: Optional[Trace]):
+    """
+    Hace de `trace` la traza actual dentro del bloque (p. ej. al procesar una petición dentro de un lote).
+    """
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def record_span(stage: str, start: float, duration: float, traces: Iterable[Optional[Trace]] = None,
+                metric: str = QUERY_STAGE_METRIC):
+    """
+    Registra la duración de una etapa en su histograma y en las trazas indicadas (por defecto, la actual).
+
+    Para etapas medidas una vez para varias peticiones (p. ej. un micro-lote de embeddings), `traces` recibe
+    las trazas de todas ellas.
+    """
+    metrics.histogram(metric, _DESCRIPTIONS.get(metric, ""), stage=stage).observe(duration)
+    for trace in (traces if traces is not None else [current_trace()]):
+        if trace is not None:
+            trace.add(stage, start, duration)
+
+
+@contextmanager
+def span(stage: str, traces: Iterable[Optional[Trace]] = None, metric: str = QUERY_STAGE_METRIC):
+    """
+    Mide el bloque como una etapa: `with span("faiss_search"): ...`.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, start, time.perf_counter() - start, traces, metric)
+
+
+def timed_iter(iterable: Iterable, stage: str, metric: str = QUERY_STAGE_METRIC) -> Iterator:
+    """
+    Recorre `iterable` midiendo como etapa la espera de cada elemento (p. ej. páginas extraídas en otro proceso).
+    """
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        record_span(stage, start, time.perf_counter() - start, metric=metric)
+        yield item
@@ -1,18 +1,157 @@
-from transformers import MarianMTModel, MarianTokenizer
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+from app.config import Config
+from app.models.registry import model_registry
+from app.utils.metrics import metrics
+
+
+class TranslationCache:
+    def __init__(self, max_entries: int, disk_path: Optional[str] = None):
+        """
+        Caché de traducciones indexada por el hash del contenido: LRU en memoria con un nivel opcional en disco (SQLite).
+
+        :param max_entries: Entradas máximas en memoria.
+        :param disk_path: Ruta a la base de datos SQLite del nivel en disco (None para desactivarlo).
+        """
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._disk.commit()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_name: str, source_lang: str, target_lang: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}|{source_lang}|{target_lang}|{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+            if self._disk is not None:
+                row = self._disk.execute("SELECT value FROM translations WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    self._remember(key, row[0])
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put_many(self, items: List[tuple]):
+        with self._lock:
+            for key, value in items:
+                self._remember(key, value)
+            if self._disk is not None:
+                self._disk.executemany("INSERT OR REPLACE INTO translations (key, value) VALUES (?, ?)", items)
+                self._disk.commit()
+
+    def _remember(self, key: str, value: str):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_tier": self._disk is not None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
 
 class Translator:
-    def __init__(self):
-        self.model_name = "Helsinki-NLP/opus-mt-en-es"
-        self.tokenizer = MarianTokenizer.from_pretrained(self.model_name)
-        self.model = MarianMTModel.from_pretrained(self.model_name)
-    
+    def __init__(self, registry=None):
+        """
+        Traductor MarianMT con caché de traducciones. El modelo se carga del registro de modelos la primera vez
+        que hay que traducir algo que no está en la caché.
+
+        :param registry: Registro de modelos (por defecto, el global).
+        """
+        self.model_name = Config.TRANSLATION_MODEL
+        self.registry = registry or model_registry
+        self.cache = TranslationCache(Config.TRANSLATION_CACHE_SIZE, Config.TRANSLATION_CACHE_PATH)
+        self.batch_histogram = metrics.histogram("translation_batch_seconds", "Duración de cada llamada a generate")
+        self._model_lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        return self.registry.get("translation")[0]
+
+    @property
+    def model(self):
+        return self.registry.get("translation")[1]
+
     def to_english(self, text):
         return self._translate(text, source_lang="es", target_lang="en")
-    
+
     def to_target(self, text, target_lang="es"):
         return self._translate(text, source_lang="en", target_lang=target_lang)
-    
+
+    def to_target_batch(self, texts: List[str], target_lang: str = "es") -> List[str]:
+        return self.translate_batch(texts, source_lang="en", target_lang=target_lang)
+
     def _translate(self, text, source_lang, target_lang):
-        batch = self.tokenizer.prepare_seq2seq_batch([text], return_tensors="pt")
-        translation = self.model.generate(**batch)
-        return self.tokenizer.decode(translation[0], skip_special_tokens=True)
+        return self.translate_batch([text], source_lang, target_lang)[0]
+
+    def translate_batch(self, texts: List[str], source_lang: str, target_lang: str) -> List[str]:
+        """
+        Traduce varios textos: los que están en caché se devuelven directamente y el resto se traduce en
+        llamadas a `generate` con padding de hasta `Config.TRANSLATION_BATCH_SIZE` textos.
+
+        :param texts: Textos a traducir.
+        :param source_lang: Idioma de origen.
+        :param target_lang: Idioma de destino.
+        :return: Textos traducidos, en el mismo orden.
+        """
+        keys = [TranslationCache.key(self.model_name, source_lang, target_lang, text) for text in texts]
+        results = [self.cache.get(key) for key in keys]
+
+        pending = {}
+        for position, (text, result) in enumerate(zip(texts, results)):
+            if result is None:
+                pending.setdefault(text, []).append(position)
+        if not pending:
+            return results
+
+        # Ordenar por longitud reduce el padding dentro de cada lote
+        unique_texts = sorted(pending, key=len)
+        translated = []
+        for start in range(0, len(unique_texts), Config.TRANSLATION_BATCH_SIZE):
+            translated.extend(self._generate(unique_texts[start:start + Config.TRANSLATION_BATCH_SIZE]))
+
+        new_entries = []
+        for text, translation in zip(unique_texts, translated):
+            for position in pending[text]:
+                results[position] = translation
+            new_entries.append((keys[pending[text][0]], translation))
+        self.cache.put_many(new_entries)
+        return results
+
+    def _generate(self, texts: List[str]) -> List[str]:
+        start = time.perf_counter()
+        with self._model_lock:
+            batch = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True)
+            translation = self.model.generate(**batch)
+            decoded = self.tokenizer.batch_decode(translation, skip_special_tokens=True)
+        self.batch_histogram.observe(time.perf_counter() - start)
+        return decoded
+
+    def stats(self) -> dict:
+        return {"cache": self.cache.stats(), "generate_seconds": self.batch_histogram.snapshot()}